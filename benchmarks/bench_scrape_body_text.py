@@ -0,0 +1,64 @@
+"""
+Compares the single-pass section extractor with the previous BeautifulSoup implementation of
+`WebpageRetrievalTool._scrape_body_text` on generated documentation-like pages.
+
+Run with `python benchmarks/bench_scrape_body_text.py`.
+"""
+import sys
+import timeit
+from pathlib import Path
+
+# the legacy implementation is kept with the test helpers, as the tests compare with it too
+sys.path.append(str(Path(__file__).parents[1] / "tests"))
+
+from helpers import legacy_scrape_body_text
+
+from neat_ai_assistant.utils.html_sections import extract_section_text
+
+
+def build_page(n_sections: int, paragraphs_per_section: int = 3) -> bytes:
+    sections = []
+    for i in range(n_sections):
+        paragraphs = "".join(
+            f"<p>Paragraph {j} of section {i} with <a href='#'>a link</a> &amp; some <code>code</code>.</p>"
+            for j in range(paragraphs_per_section)
+        )
+        sections.append(
+            f"<h{2 + i % 3}>Section {i}</h{2 + i % 3}>{paragraphs}<ul><li>item</li><li>item</li></ul>"
+        )
+    head = "<head><title>Docs</title><script>var x = 1;</script></head>"
+    nav = "<nav><a href='/'>Home</a></nav>"
+    page = f"<!DOCTYPE html><html>{head}<body>{nav}<main>{''.join(sections)}</main></body></html>"
+    return page.encode("utf-8")
+
+
+def main() -> None:
+    for n_sections in [10, 100, 1_000]:
+        page = build_page(n_sections)
+        assert extract_section_text(page) == legacy_scrape_body_text(page)
+        number = max(1, 200 // n_sections)
+        legacy_seconds = (
+            timeit.timeit(lambda: legacy_scrape_body_text(page), number=number) / number
+        )
+        single_pass_seconds = (
+            timeit.timeit(lambda: extract_section_text(page), number=number) / number
+        )
+        # without a character budget the whole page is parsed
+        full_pass_seconds = (
+            timeit.timeit(
+                lambda: extract_section_text(page, maximum_length_char=len(page)),
+                number=number,
+            )
+            / number
+        )
+        print(
+            f"{n_sections:>5} sections, {len(page) / 1_000:>7.0f} kB: "
+            f"legacy {legacy_seconds * 1_000:>8.2f} ms, "
+            f"single pass {single_pass_seconds * 1_000:>6.2f} ms "
+            f"({full_pass_seconds * 1_000:>6.2f} ms without budget), "
+            f"speedup {legacy_seconds / single_pass_seconds:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+The benchmark cases of the agent's hot paths. The LLM is replaced by a `ScriptedBackend` and pages are generated locally,
+so the timings only contain the Python-side overhead.
+"""
+from typing import Any, Callable, Mapping
+
+from bench_scrape_body_text import build_page
+from helpers import WordCountingOpenaiWrapper
+from runner import BenchmarkCase, BenchmarkSkipped
+
+from neat_ai_assistant import (
+    ConversationHistory,
+    EvictionPolicy,
+    KeepFirstUserTurnEviction,
+    KeywordToolSelector,
+    LargestToolResultFirstEviction,
+    Message,
+    Model,
+    NeatAgent,
+    OldestFirstEviction,
+    OpenaiWrapper,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+    ToolRegistry,
+    WebpageRetrievalTool,
+)
+from neat_ai_assistant.agent.agent import _ReplyState
+from neat_ai_assistant.agent.tool import ToolResult
+
+MODEL = Model.GPT_4
+
+
+class _BenchmarkTool(Tool):
+    def __init__(self, i: int, n_params: int = 5) -> None:
+        super().__init__(
+            name=f"Benchmark Tool {i}",
+            description=f"Looks up record {i} in the benchmark index.",
+            params=[
+                ToolParam(
+                    name=f"param_{j}",
+                    type="string",
+                    description=f"Parameter {j} of the lookup.",
+                    required=j == 0,
+                )
+                for j in range(n_params)
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([f"Record for {json_query['param_0']}." * 20])
+
+
+def _build_transcript(n_messages: int) -> list[Message]:
+    return [
+        Message(
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"Message {i} talks about the weather in Berlin and stock prices. "
+            * 10,
+        )
+        for i in range(n_messages)
+    ]
+
+
+def _get_tokenizing_wrapper(**kwargs: Any) -> OpenaiWrapper:
+    openai_wrapper = OpenaiWrapper(**kwargs)
+    try:
+        openai_wrapper.count_tokens("warm up", MODEL)
+    except Exception as e:
+        raise BenchmarkSkipped(
+            f"the tiktoken encoding is not available ({type(e).__name__})"
+        )
+    return openai_wrapper
+
+
+def count_tokens(n_messages: int) -> Callable[[], Any]:
+    openai_wrapper = _get_tokenizing_wrapper()
+    messages = _build_transcript(n_messages)
+    return lambda: openai_wrapper.open_ai_count_tokens(messages, MODEL)
+
+
+def count_message_tokens(n_chars: int) -> Callable[[], Any]:
+    openai_wrapper = _get_tokenizing_wrapper()
+    message = Message(role="user", content=("lorem ipsum dolor " * n_chars)[:n_chars])
+    return lambda: openai_wrapper.count_message_tokens(message, MODEL)
+
+
+def serialize_tools(n_tools: int) -> Callable[[], Any]:
+    tools = [_BenchmarkTool(i) for i in range(n_tools)]
+    return lambda: [t.serialize(True) for t in tools]
+
+
+def serialize_registry(n_tools: int) -> Callable[[], Any]:
+    registry = ToolRegistry([_BenchmarkTool(i) for i in range(n_tools)])
+    return lambda: registry.serialize()
+
+
+def select_tools(n_tools: int) -> Callable[[], Any]:
+    registry = ToolRegistry([_BenchmarkTool(i) for i in range(n_tools)])
+    selector = KeywordToolSelector(k=5)
+    selector.select("warm up the index", registry)
+    return lambda: selector.select("Look up record 42 in the index.", registry)
+
+
+def build_message(n_tool_results: int) -> Callable[[], Any]:
+    agent = NeatAgent(
+        openai_wrapper=WordCountingOpenaiWrapper(),
+        tools=[_BenchmarkTool(0)],
+        history=ConversationHistory(),
+    )
+    tool_results = [
+        ToolResult(source=f"Tool {i}", results=["A result of a few words."] * 5)
+        for i in range(n_tool_results)
+    ]
+    return lambda: agent._build_message("What is the weather?", tool_results)
+
+
+def scrape_body_text(n_sections: int, maximum_length_char: int) -> Callable[[], Any]:
+    page = build_page(n_sections)
+    return lambda: WebpageRetrievalTool._scrape_body_text(page, maximum_length_char)
+
+
+def grow_reply_state(n_messages: int) -> Callable[[], Any]:
+    messages = _build_transcript(n_messages)
+    system_message = Message(role="system", content="You answer questions.")
+
+    def grow() -> None:
+        state = _ReplyState.from_system_message(system_message, 10)
+        for message in messages:
+            state.add_message(message, 100)
+            state.add_tool_results([])
+        # evict half of the messages, the way `_fit_context` does
+        for _ in range(n_messages // 2):
+            state.pop_message(1)
+
+    return grow
+
+
+def fit_context(n_messages: int, eviction_policy: EvictionPolicy) -> Callable[[], Any]:
+    messages = _build_transcript(n_messages)
+    agent = NeatAgent(
+        openai_wrapper=WordCountingOpenaiWrapper(),
+        tools=[_BenchmarkTool(0)],
+        history=ConversationHistory(),
+        eviction_policy=eviction_policy,
+    )
+    # half of the messages fit, the state is rebuilt for each call as the fit evicts from it
+    agent.prompt_budget = 100 * n_messages // 2
+
+    def fit() -> None:
+        state = _ReplyState.from_system_message(agent.SYSTEM_MESSAGE, 10)
+        for message in messages:
+            state.add_message(message, 100)
+        agent._fit_context(state)
+
+    return fit
+
+
+def reply_to(n_tool_rounds: int, stream: bool) -> Callable[[], Any]:
+    replies = [
+        ScriptedReply(
+            tool_calls=[
+                (
+                    "benchmark_tool_0",
+                    {"param_0": f"round {i}", "reasoning": "Need the record."},
+                )
+            ]
+        )
+        for i in range(n_tool_rounds)
+    ] + [ScriptedReply(content="The record says what you asked for. " * 20)]
+    openai_wrapper = _get_tokenizing_wrapper(backend=ScriptedBackend(replies))
+    agent = NeatAgent(
+        openai_wrapper=openai_wrapper,
+        tools=[_BenchmarkTool(i) for i in range(10)],
+        history=ConversationHistory(),
+        stream=stream,
+    )
+
+    def reply() -> None:
+        # a fresh history for each call, so it does not grow over the timed calls
+        agent.history = ConversationHistory()
+        list(agent.reply_to("Look up the record."))
+
+    return reply
+
+
+EVICTION_POLICIES: Mapping[str, EvictionPolicy] = {
+    "oldest": OldestFirstEviction(),
+    "largest": LargestToolResultFirstEviction(),
+    "keep_first": KeepFirstUserTurnEviction(),
+}
+
+
+def _case(name: str, setup: Callable[[], Callable[[], Any]]) -> BenchmarkCase:
+    return BenchmarkCase(name=name, setup=setup)
+
+
+CASES = [
+    *[
+        _case(f"open_ai_count_tokens/messages={n}", lambda n=n: count_tokens(n))
+        for n in [10, 100, 1_000]
+    ],
+    *[
+        _case(f"count_message_tokens/chars={n}", lambda n=n: count_message_tokens(n))
+        for n in [100, 10_000, 100_000]
+    ],
+    *[
+        _case(f"tool_serialize/tools={n}", lambda n=n: serialize_tools(n))
+        for n in [10, 100]
+    ],
+    *[
+        _case(f"tool_registry_serialize/tools={n}", lambda n=n: serialize_registry(n))
+        for n in [10, 100]
+    ],
+    *[_case(f"tool_select/tools={n}", lambda n=n: select_tools(n)) for n in [10, 100]],
+    *[
+        _case(f"build_message/tool_results={n}", lambda n=n: build_message(n))
+        for n in [0, 10]
+    ],
+    *[
+        _case(
+            f"scrape_body_text/sections={n},max_chars={m}",
+            lambda n=n, m=m: scrape_body_text(n, m),
+        )
+        for n in [10, 2_000]
+        # the default budget stops early, a huge one parses the whole page
+        for m in [1_000, 10_000_000]
+    ],
+    *[
+        _case(f"reply_state/messages={n}", lambda n=n: grow_reply_state(n))
+        for n in [10, 1_000]
+    ],
+    *[
+        _case(
+            f"fit_context/messages={n},policy={name}",
+            lambda n=n, policy=policy: fit_context(n, policy),
+        )
+        for n in [10, 1_000]
+        for name, policy in EVICTION_POLICIES.items()
+    ],
+    *[
+        _case(
+            f"reply_to/tool_rounds={n},stream={stream}",
+            lambda n=n, stream=stream: reply_to(n, stream),
+        )
+        for n in [0, 3]
+        for stream in [False, True]
+    ],
+]
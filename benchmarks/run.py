@@ -0,0 +1,61 @@
+"""
+Runs the benchmark suite and compares it with a baseline.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json --threshold 0.2
+
+With `--baseline`, the exit code is 1 if any case got slower than the threshold allows.
+Baselines are only comparable on the same machine, so record one before and after a change.
+"""
+import argparse
+import fnmatch
+import sys
+from pathlib import Path
+
+# the cases share the test helpers, such as the word-counting wrapper stub
+sys.path.append(str(Path(__file__).parents[1] / "tests"))
+
+from cases import CASES
+from runner import find_regressions, load_report, run_cases, save_report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", type=Path, help="Where to write the results.")
+    parser.add_argument("--baseline", type=Path, help="Results to compare with.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Allowed slowdown of a case over the baseline, 0.2 being 20%%.",
+    )
+    parser.add_argument(
+        "--filter", default="*", help="Only run cases matching this glob pattern."
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="Minimal duration of each timed repetition.",
+    )
+    args = parser.parse_args()
+
+    cases = [c for c in CASES if fnmatch.fnmatch(c.name, args.filter)]
+    report = run_cases(cases, repeat=args.repeat, min_seconds=args.min_seconds)
+    if args.output:
+        save_report(report, args.output)
+
+    if args.baseline is None:
+        return 0
+    regressions = find_regressions(report, load_report(args.baseline), args.threshold)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.name}: {regression.baseline_seconds * 1_000:.4f} ms "
+            f"-> {regression.current_seconds * 1_000:.4f} ms ({regression.ratio:.2f}x)"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+A minimal benchmark runner: times registered cases, writes the results as JSON and compares them with a baseline.
+"""
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from pydantic import BaseModel
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+class BenchmarkCase(BaseModel):
+    name: str
+    # builds the fixtures once and returns the function to time
+    setup: Callable[[], Callable[[], Any]]
+
+
+class BenchmarkResult(BaseModel):
+    name: str
+    status: str = "ok"
+    reason: Optional[str] = None
+    number: int = 0
+    repeat: int = 0
+    min_seconds: Optional[float] = None
+    median_seconds: Optional[float] = None
+
+
+class BenchmarkReport(BaseModel):
+    metadata: dict[str, Any]
+    results: list[BenchmarkResult]
+
+    def get_result(self, name: str) -> Optional[BenchmarkResult]:
+        return next((r for r in self.results if r.name == name), None)
+
+
+class Regression(BaseModel):
+    name: str
+    baseline_seconds: float
+    current_seconds: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_seconds / self.baseline_seconds
+
+
+def _get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(case: BenchmarkCase, repeat: int, min_seconds: float) -> BenchmarkResult:
+    """Times the case's function `repeat` times, each over enough calls to last at least `min_seconds`."""
+    try:
+        function = case.setup()
+    except BenchmarkSkipped as e:
+        return BenchmarkResult(name=case.name, status="skipped", reason=str(e))
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_seconds:
+        number *= 2
+    timings = [timer.timeit(number) / number for _ in range(repeat)]
+    return BenchmarkResult(
+        name=case.name,
+        number=number,
+        repeat=repeat,
+        min_seconds=min(timings),
+        median_seconds=statistics.median(timings),
+    )
+
+
+def run_cases(
+    cases: Iterable[BenchmarkCase],
+    repeat: int = 5,
+    min_seconds: float = 0.05,
+    log: Callable[[str], None] = print,
+) -> BenchmarkReport:
+    results = []
+    for case in cases:
+        result = run_case(case, repeat, min_seconds)
+        if result.median_seconds is None:
+            log(f"{case.name:<48} skipped: {result.reason}")
+        else:
+            log(f"{case.name:<48} {result.median_seconds * 1_000:>12.4f} ms")
+        results.append(result)
+    metadata = {
+        "commit": _get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+    return BenchmarkReport(metadata=metadata, results=results)
+
+
+def find_regressions(
+    report: BenchmarkReport, baseline: BenchmarkReport, threshold: float
+) -> list[Regression]:
+    """Cases whose median is more than `threshold` (0.2 = 20%) slower than in the baseline."""
+    regressions = []
+    for result in report.results:
+        baseline_result = baseline.get_result(result.name)
+        if (
+            result.median_seconds is None
+            or baseline_result is None
+            or baseline_result.median_seconds is None
+        ):
+            continue
+        if result.median_seconds > baseline_result.median_seconds * (1 + threshold):
+            regressions.append(
+                Regression(
+                    name=result.name,
+                    baseline_seconds=baseline_result.median_seconds,
+                    current_seconds=result.median_seconds,
+                )
+            )
+    return regressions
+
+
+def load_report(path: Path) -> BenchmarkReport:
+    return BenchmarkReport.model_validate(json.loads(path.read_text("utf-8")))
+
+
+def save_report(report: BenchmarkReport, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(report.model_dump_json(indent=2) + "\n", "utf-8")
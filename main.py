@@ -1,16 +1,40 @@
+import asyncio
 import json
+import math
+import os
+import uuid
+from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sse_starlette import EventSourceResponse
+from starlette.background import BackgroundTask
 
 from neat_ai_assistant import (
-    ConversationHistory,
+    CancellationToken,
+    ChatBackend,
+    ChatCompletionCache,
     DuckDuckGoSearchTool,
+    JsonLinesTraceSink,
+    MetricsRegistry,
     Model,
-    NeatAgent,
+    OpenaiBackend,
     OpenaiWrapper,
-    QueryConversationHistoryTool,
+    PageCache,
+    PrometheusTraceSink,
+    RateLimiter,
+    RecordingBackend,
+    ReplayBackend,
+    ReplyLimits,
+    RunQueueFullError,
+    RunScheduler,
+    SessionManager,
+    SQLiteCache,
+    SQLiteHistoryDatabase,
+    SQLiteHistoryStorage,
+    ToolResultCompactor,
+    Tracer,
     WebpageRetrievalTool,
 )
 
@@ -21,25 +45,134 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 
-openai_wrapper = OpenaiWrapper()
-history = ConversationHistory()
+# record real sessions, or replay them to profile the server without the API
+llm_record_path = os.getenv("LLM_RECORD_PATH")
+llm_replay_path = os.getenv("LLM_REPLAY_PATH")
+if llm_replay_path:
+    # the tools run live, so prompts that differ from the recording fall back to its order
+    llm_backend: ChatBackend = ReplayBackend(llm_replay_path, strict=False)
+elif llm_record_path:
+    llm_backend = RecordingBackend(OpenaiBackend(), llm_record_path)
+else:
+    llm_backend = OpenaiBackend()
+# opt-in: replay identical completions instead of paying for another round trip
+response_cache_path = os.getenv("RESPONSE_CACHE_PATH")
+openai_wrapper = OpenaiWrapper(
+    backend=llm_backend,
+    # all sessions of this worker queue for the same per-model request and token budgets
+    rate_limiter=None if llm_replay_path else RateLimiter.shared(),
+    response_cache=ChatCompletionCache(
+        disk_cache=SQLiteCache(response_cache_path, max_bytes=200_000_000)
+    )
+    if response_cache_path
+    else None,
+)
+# an on-disk tier lets all workers reuse each other's downloaded pages
+page_cache_path = os.getenv("PAGE_CACHE_PATH")
+page_cache = PageCache(
+    disk_cache=SQLiteCache(page_cache_path, max_bytes=500_000_000)
+    if page_cache_path
+    else None
+)
 tools = [
-    WebpageRetrievalTool(),
+    WebpageRetrievalTool(page_cache=page_cache),
     DuckDuckGoSearchTool(),
-    QueryConversationHistoryTool(history=history),
 ]
-agent = NeatAgent(
-    openai_wrapper=openai_wrapper, tools=tools, history=history, model=Model.GPT_4
+# every request is traced into the /metrics endpoint, and optionally into a JSON lines trace log
+metrics_registry = MetricsRegistry()
+trace_log_path = os.getenv("TRACE_LOG_PATH")
+tracer = Tracer(
+    [PrometheusTraceSink(metrics_registry)]
+    + ([JsonLinesTraceSink(trace_log_path)] if trace_log_path else [])
+)
+# share histories across workers and restarts by pointing all workers to one SQLite file
+history_database_path = os.getenv("HISTORY_DATABASE_PATH")
+history_database = (
+    SQLiteHistoryDatabase(history_database_path) if history_database_path else None
+)
+sessions = SessionManager(
+    openai_wrapper=openai_wrapper,
+    tools=tools,
+    model=Model.GPT_4,
+    max_sessions=1_000,
+    max_messages_per_session=100,
+    max_tokens_per_session=16_000,
+    idle_ttl_seconds=3_600,
+    storage_factory=(
+        (lambda session_id: SQLiteHistoryStorage(history_database, session_id))
+        if history_database
+        else None
+    ),
+    stream=True,
+    tracer=tracer,
+    # retrieved webpages are cut down to the passages relevant to the question
+    result_compactor=ToolResultCompactor(openai_wrapper, max_tokens_per_tool=2_000),
+    # long replies stop calling tools and answer with what they have
+    limits=ReplyLimits(
+        deadline_seconds=float(os.getenv("REPLY_DEADLINE_SECONDS") or 60),
+        max_iterations=8,
+        max_total_tokens=100_000,
+    ),
+)
+# bursts queue up behind a bounded number of replies instead of all running at once
+scheduler = RunScheduler(
+    max_concurrent_runs=int(os.getenv("MAX_CONCURRENT_RUNS") or 8),
+    max_queued_runs=int(os.getenv("MAX_QUEUED_RUNS") or 32),
+    metrics_registry=metrics_registry,
 )
 
 
 @app.get("/chat")
-async def chat(user_message: str):
+async def chat(user_message: str, session_id: Optional[str] = None):
+    # clients without a session get a fresh one, returned in X-Session-Id to continue it,
+    # instead of all sharing one history and one queue slot
+    session_id = session_id or uuid.uuid4().hex
+    try:
+        ticket = scheduler.enqueue(session_id)
+    except RunQueueFullError as e:
+        return JSONResponse(
+            {"detail": str(e)},
+            status_code=429,
+            headers={
+                "Retry-After": str(math.ceil(e.retry_after_seconds)),
+                "X-Session-Id": session_id,
+            },
+        )
+    cancellation = CancellationToken()
+
     async def event_generator():
-        for message in agent.reply_to(user_message):
-            yield json.dumps(message.model_dump())
+        try:
+            async with ticket:
+                # a session that is not in memory yet loads its history from disk
+                agent = (
+                    await asyncio.to_thread(sessions.get_agent, session_id)
+                    if history_database
+                    else sessions.get_agent(session_id)
+                )
+                async for message in agent.areply_to(user_message, cancellation):
+                    yield {
+                        "event": message.type,
+                        "data": json.dumps(message.model_dump()),
+                    }
+        except (asyncio.CancelledError, GeneratorExit):
+            # the client disconnected: also stop work that outlives the task, like pages scraped in threads
+            cancellation.cancel("client disconnected")
+            raise
+
+    # frees the ticket even if the client disconnects before the stream starts
+    return EventSourceResponse(
+        event_generator(),
+        headers={"X-Session-Id": session_id},
+        background=BackgroundTask(ticket.release),
+    )
+
 
-    return EventSourceResponse(event_generator())
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(
+        metrics_registry.render(), media_type="text/plain; version=0.0.4"
+    )
@@ -94,6 +94,7 @@ function App() {
   const [messages, setMessages] = useState([]);
   const [isLoading, setLoading] = useState(false);
   const bottomRef = useRef();
+  const sessionId = useRef(crypto.randomUUID());
 
   const sendMessage = async (e) => {
     e.preventDefault();
@@ -103,29 +104,60 @@ function App() {
     const userMessage = { text: message, sender: 'user' };
     setMessages((prevMessages) => [...prevMessages, userMessage]);
 
-    const response = await fetch(`http://localhost:8000/chat?user_message=${message}`);
+    const response = await fetch(`http://localhost:8000/chat?user_message=${message}&session_id=${sessionId.current}`);
     const reader = response.body.getReader();
     const textDecoder = new TextDecoder();
+    let buffer = "";
+
+    const handleEvent = (rawEvent) => {
+      const dataLines = rawEvent
+        .split('\n')
+        .filter(line => line.startsWith('data: '))
+        .map(line => line.replace('data: ', ''));
+      if (!dataLines.length) return;
+
+      const botMessage = { ...JSON.parse(dataLines.join('\n')), sender: 'bot' };
+
+      // Check if message is an image and decode it
+      if (botMessage.type === 'image') {
+        botMessage.text = `data:image/png;base64,${botMessage.text}`;
+      }
+
+      setMessages((prevMessages) => {
+        const lastMessage = prevMessages[prevMessages.length - 1];
+        const isStreaming = lastMessage && lastMessage.streaming;
+
+        // Streamed answer tokens are appended to one message, which the final answer replaces
+        if (botMessage.type === 'answer_delta') {
+          if (isStreaming) {
+            return [
+              ...prevMessages.slice(0, -1),
+              { ...lastMessage, text: lastMessage.text + botMessage.text },
+            ];
+          }
+          return [...prevMessages, { ...botMessage, type: 'answer', streaming: true }];
+        }
+        // The streamed text turned out to come with tool calls, so it was not the answer
+        if (botMessage.type === 'answer_reset') {
+          return isStreaming ? prevMessages.slice(0, -1) : prevMessages;
+        }
+        if (botMessage.type === 'answer' && isStreaming) {
+          return [...prevMessages.slice(0, -1), botMessage];
+        }
+        return [...prevMessages, botMessage];
+      });
+    };
 
     while (true) {
       const { value, done } = await reader.read();
       if (done) break;
 
-      const messages = textDecoder.decode(value).split('\n\n');
-      messages
-        .filter(msg => msg.startsWith('data: '))
-        .map(msg => msg.replace('data: ', ''))
-        .forEach(jsonPart => {
-          const botMessage = { ...JSON.parse(jsonPart), sender: 'bot' };
-
-          // Check if message is an image and decode it
-          if (botMessage.type === 'image') {
-            botMessage.text = `data:image/png;base64,${botMessage.text}`;
-          }
-
-          setMessages((prevMessages) => [...prevMessages, botMessage]);
-        });
+      buffer += textDecoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+      const rawEvents = buffer.split('\n\n');
+      buffer = rawEvents.pop();
+      rawEvents.forEach(handleEvent);
     }
+    if (buffer.trim()) handleEvent(buffer);
 
     setMessage("");
     setLoading(false);
@@ -1,6 +1,29 @@
-from .agent.agent import NeatAgent, NeatAgentOutput
+from .agent.agent import NeatAgent, NeatAgentOutput, ReplyLimits
+from .agent.context_budget import (
+    DEFAULT_CONTEXT_BUDGETS,
+    ContextBudget,
+    EvictionPolicy,
+    KeepFirstUserTurnEviction,
+    LargestToolResultFirstEviction,
+    OldestFirstEviction,
+)
 from .agent.conversation_history import ConversationHistory
+from .agent.history_storage import (
+    HistoryStorage,
+    InMemoryHistoryStorage,
+    SQLiteHistoryDatabase,
+    SQLiteHistoryStorage,
+)
+from .agent.result_compaction import ToolResultCompactor
+from .agent.run_scheduler import RunQueueFullError, RunScheduler
+from .agent.session_manager import SessionManager
 from .agent.tool import Tool, ToolParam
+from .agent.tool_registry import (
+    AllToolsSelector,
+    KeywordToolSelector,
+    ToolRegistry,
+    ToolSelector,
+)
 from .agent.tools import (
     DuckDuckGoSearchTool,
     FinancialRetrievalTool,
@@ -9,14 +32,44 @@ from .agent.tools import (
     WeatherRetrievalTool,
     WebpageRetrievalTool,
 )
+from .llm.backends import ChatBackend, OpenaiBackend, ScriptedBackend, ScriptedReply
 from .llm.openai_wrapper import Message, Model, OpenaiWrapper
+from .llm.rate_limiter import RateLimiter, RateLimits
+from .llm.recording import RecordingBackend, ReplayBackend
+from .llm.response_cache import ChatCompletionCache
+from .utils.cache import CacheStats, LRUCache, SQLiteCache
+from .utils.cancellation import CancellationToken, RunCancelledError
+from .utils.page_cache import PageCache
+from .utils.prometheus import MetricsRegistry, PrometheusTraceSink
+from .utils.rate_limit import TokenBucket
+from .utils.tracing import JsonLinesTraceSink, Tracer, TraceSink
+from .utils.web_search import WebSearchClient
 
 __all__ = [
     "NeatAgent",
     "NeatAgentOutput",
+    "ReplyLimits",
+    "DEFAULT_CONTEXT_BUDGETS",
+    "ContextBudget",
+    "EvictionPolicy",
+    "KeepFirstUserTurnEviction",
+    "LargestToolResultFirstEviction",
+    "OldestFirstEviction",
     "ConversationHistory",
+    "HistoryStorage",
+    "InMemoryHistoryStorage",
+    "SQLiteHistoryDatabase",
+    "SQLiteHistoryStorage",
+    "ToolResultCompactor",
+    "RunQueueFullError",
+    "RunScheduler",
+    "SessionManager",
     "Tool",
     "ToolParam",
+    "ToolRegistry",
+    "ToolSelector",
+    "AllToolsSelector",
+    "KeywordToolSelector",
     "DuckDuckGoSearchTool",
     "FinancialRetrievalTool",
     "QueryConversationHistoryTool",
@@ -26,4 +79,26 @@ __all__ = [
     "Model",
     "Message",
     "OpenaiWrapper",
+    "RateLimiter",
+    "RateLimits",
+    "ChatBackend",
+    "OpenaiBackend",
+    "ScriptedBackend",
+    "ScriptedReply",
+    "RecordingBackend",
+    "ReplayBackend",
+    "ChatCompletionCache",
+    "CancellationToken",
+    "RunCancelledError",
+    "CacheStats",
+    "LRUCache",
+    "SQLiteCache",
+    "PageCache",
+    "MetricsRegistry",
+    "PrometheusTraceSink",
+    "TokenBucket",
+    "JsonLinesTraceSink",
+    "Tracer",
+    "TraceSink",
+    "WebSearchClient",
 ]
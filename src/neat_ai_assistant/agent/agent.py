@@ -1,23 +1,109 @@
+import asyncio
+import copy
 import json
-from typing import Any, Iterable, Literal, Mapping, Optional, Sequence, cast
+import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Iterable,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+    cast,
+)
 
 from dotenv import load_dotenv
+from openai.types.chat import ChatCompletionChunk
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from openai.types.chat.chat_completion_message_tool_call import (
     ChatCompletionMessageToolCall,
 )
-from pydantic import BaseModel
-
-from ..llm.openai_wrapper import Message, Model, OpenaiWrapper
+from pydantic import BaseModel, PrivateAttr
+
+from ..llm.openai_wrapper import TOKENS_PER_REPLY, Message, Model, OpenaiWrapper
+from ..llm.streaming import ChatCompletionStreamAccumulator
+from ..utils.cancellation import (
+    CancellationToken,
+    RunCancelledError,
+    activate_cancellation,
+)
+from ..utils.tracing import (
+    NULL_SPAN,
+    SpanRecorder,
+    Trace,
+    Tracer,
+    activate_trace,
+    count_event,
+)
+from .context_budget import (
+    DEFAULT_CONTEXT_BUDGETS,
+    ContextBudget,
+    EvictionPolicy,
+    OldestFirstEviction,
+)
 from .conversation_history import ConversationHistory
+from .result_compaction import ToolResultCompactor
 from .tool import Tool, ToolResult
+from .tool_registry import AllToolsSelector, ToolRegistry, ToolSelector
 
 load_dotenv()
 
+T = TypeVar("T")
+
 
 class NeatAgentOutput(BaseModel):
-    type: Literal["thought", "function_call", "answer"]
+    type: Literal[
+        "thought",
+        "function_call",
+        "context_eviction",
+        "limit_reached",
+        "answer_delta",
+        "answer_reset",
+        "answer",
+    ]
     text: Optional[str]
+    prompt_tokens: Optional[int] = None
+    evicted_messages: Optional[Sequence[Message]] = None
+
+
+class ReplyLimits(BaseModel):
+    """
+    Bounds on the work done for one reply; `None` lifts a bound.
+    Once one is reached, the model is asked for a final answer without tools, from what was gathered so far.
+    The answer itself counts as an iteration. LLM calls and tool runs are cut short so that the last
+    `final_answer_seconds` before the deadline remain for the answer, which gets at least that long.
+    `max_repeated_tool_rounds` is how often the model may repeat a turn of calls it already made in this reply.
+    """
+
+    deadline_seconds: Optional[float] = None
+    final_answer_seconds: float = 10.0
+    max_iterations: Optional[int] = None
+    max_total_tokens: Optional[int] = None
+    max_repeated_tool_rounds: int = 1
+
+    def get_reached_limit(
+        self,
+        iterations: int,
+        elapsed_seconds: float,
+        total_tokens: int,
+        repeated_tool_rounds: int,
+    ) -> Optional[str]:
+        if self.max_iterations is not None and iterations + 1 >= self.max_iterations:
+            return "max_iterations"
+        if (
+            self.deadline_seconds is not None
+            and elapsed_seconds >= self.deadline_seconds - self.final_answer_seconds
+        ):
+            return "deadline"
+        if self.max_total_tokens is not None and total_tokens >= self.max_total_tokens:
+            return "max_total_tokens"
+        if repeated_tool_rounds > self.max_repeated_tool_rounds:
+            return "repeated_tool_calls"
+        return None
 
 
 class _Function:
@@ -79,18 +165,35 @@ class _ChatCompletionMessage:
 
 class _ReplyState(BaseModel):
     messages: list[Message] = []
+    message_token_counts: list[int] = []
     tool_results_list: list[Sequence[ToolResult]] = []
     final_answer: Optional[str] = None
+    _message_tokens_sum: int = PrivateAttr(default=0)
 
     @classmethod
-    def from_system_message(cls, system_message: Message) -> "_ReplyState":
-        return cls(messages=[system_message])
+    def from_system_message(
+        cls, system_message: Message, token_count: int
+    ) -> "_ReplyState":
+        state = cls()
+        state.add_message(system_message, token_count)
+        return state
+
+    @property
+    def prompt_token_count(self) -> int:
+        """Tokens the current messages take up in a prompt, maintained incrementally."""
+        return self._message_tokens_sum + TOKENS_PER_REPLY
 
     def get_last_tool_results(self) -> Sequence[ToolResult]:
         return self.tool_results_list[-1] if self.tool_results_list else []
 
-    def add_message(self, message: Message) -> None:
+    def add_message(self, message: Message, token_count: int) -> None:
         self.messages.append(message)
+        self.message_token_counts.append(token_count)
+        self._message_tokens_sum += token_count
+
+    def pop_message(self, index: int) -> Message:
+        self._message_tokens_sum -= self.message_token_counts.pop(index)
+        return self.messages.pop(index)
 
     def add_tool_results(self, tool_results: Sequence[ToolResult]) -> None:
         self.tool_results_list.append(tool_results)
@@ -122,6 +225,10 @@ Your turn!
 Decide the next action to choose. Pick from the available tools.
 
 If you think you gathered all necessary information, generate a final answer."""
+    FINAL_ANSWER_TEMPLATE = """{tool_response}My question: {query}
+
+There is no time left for further actions.
+Answer the question now with the information gathered so far, and say so if it is incomplete."""
 
     def __init__(
         self,
@@ -130,49 +237,294 @@ If you think you gathered all necessary information, generate a final answer."""
         history: ConversationHistory,
         model: Model = Model.GPT_4,
         require_reasoning: bool = True,
+        max_parallel_tools: int = 4,
+        tool_timeout: Optional[float] = 60.0,
+        context_budget: Optional[ContextBudget] = None,
+        eviction_policy: Optional[EvictionPolicy] = None,
+        stream: bool = False,
+        tracer: Optional[Tracer] = None,
+        tool_selector: ToolSelector = AllToolsSelector(),
+        result_compactor: Optional[ToolResultCompactor] = None,
+        limits: Optional[ReplyLimits] = None,
     ) -> None:
+        if max_parallel_tools < 1:
+            raise ValueError("max_parallel_tools must be at least 1.")
         self.openai_wrapper = openai_wrapper
         self.model = model
 
-        serialized_tool_names = [t.serialized_name for t in tools]
-        if len(set(serialized_tool_names)) != len(serialized_tool_names):
-            raise ValueError("There is an overlap in tool names (after serializing).")
+        self.tool_registry = ToolRegistry(tools)
         self.tools = tools
+        self.tool_selector = tool_selector
+        self.result_compactor = result_compactor
 
         self.history = history
         self.require_reasoning = require_reasoning
+        self.max_parallel_tools = max_parallel_tools
+        self.tool_timeout = tool_timeout
 
-    def reply_to(self, query: str) -> Iterable[NeatAgentOutput]:
-        state = _ReplyState.from_system_message(self.SYSTEM_MESSAGE)
+        self.context_budget = context_budget or DEFAULT_CONTEXT_BUDGETS[model]
+        self.eviction_policy = eviction_policy or OldestFirstEviction()
+        self.tool_schema_tokens = self.openai_wrapper.count_tokens(
+            json.dumps(self.tool_registry.serialize()), self.model
+        )
+        self.prompt_budget = self.context_budget.get_prompt_budget(
+            self.tool_schema_tokens
+        )
+        self.stream = stream
+        self.tracer = tracer
+        self.limits = limits or ReplyLimits()
+
+    def bind(self, history: ConversationHistory, tools: Sequence[Tool]) -> "NeatAgent":
+        """
+        Cheap copy of this agent sharing its wrapper and configuration, bound to another history.
+        The tools must serialize to the same names as the original ones, so the measured schema size stays valid.
+        """
+        if sorted(t.serialized_name for t in tools) != sorted(
+            t.serialized_name for t in self.tools
+        ):
+            raise ValueError("Bound tools must match the tools of the agent.")
+        agent = copy.copy(self)
+        agent.history = history
+        agent.tool_registry = ToolRegistry(tools)
+        agent.tools = tools
+        return agent
+
+    def reply_to(
+        self,
+        query: str,
+        cancellation: Optional[CancellationToken] = None,
+        limits: Optional[ReplyLimits] = None,
+    ) -> Iterable[NeatAgentOutput]:
+        """Synchronous facade over `areply_to`, driven by a private event loop."""
+        loop = asyncio.new_event_loop()
+        outputs = self.areply_to(query, cancellation, limits)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(outputs.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(outputs.aclose())
+            loop.close()
+
+    async def areply_to(
+        self,
+        query: str,
+        cancellation: Optional[CancellationToken] = None,
+        limits: Optional[ReplyLimits] = None,
+    ) -> AsyncGenerator[NeatAgentOutput, None]:
+        """
+        Yields the steps towards an answer to `query`, and the answer last.
+        Once `cancellation` is cancelled, pending LLM calls and tool runs are abandoned and `RunCancelledError` is raised;
+        the history is only written when the answer is complete.
+        `limits` overrides the limits of the agent for this reply.
+        """
+        cancellation = cancellation or CancellationToken()
+        limits = limits or self.limits
+        if self.tracer is None:
+            async for output in self._areply_to(
+                query, cancellation, limits, None, NULL_SPAN
+            ):
+                yield output
+            return
+
+        trace = self.tracer.start_trace(model=self.model.value, query_chars=len(query))
+        activate_trace(trace)
+        reply_span = trace.start_span("agent.reply")
+        try:
+            async for output in self._areply_to(
+                query, cancellation, limits, trace, reply_span
+            ):
+                yield output
+        except BaseException as e:
+            reply_span.finish(e)
+            raise
+        finally:
+            reply_span.finish()
+            activate_trace(None)
+            self.tracer.finish_trace(trace)
+
+    async def _areply_to(
+        self,
+        query: str,
+        cancellation: CancellationToken,
+        limits: ReplyLimits,
+        trace: Optional[Trace],
+        reply_span: SpanRecorder,
+    ) -> AsyncGenerator[NeatAgentOutput, None]:
+        started_at = time.monotonic()
+        deadline = (
+            started_at + limits.deadline_seconds
+            if limits.deadline_seconds is not None
+            else None
+        )
+        # tools and LLM calls before the final answer must leave it its share of the deadline
+        work_deadline = (
+            deadline - limits.final_answer_seconds if deadline is not None else None
+        )
+        deadline_hit = False
+        iterations = 0
+        total_tokens = 0
+        repeated_tool_rounds = 0
+        # identical calls within a reply are served from here instead of running again
+        tool_call_memo: dict[str, asyncio.Future[ToolResult]] = {}
+        offered_tools = self.tool_selector.select(query, self.tool_registry)
+        reply_span.set(offered_tools=len(offered_tools))
+        state = _ReplyState.from_system_message(
+            self.SYSTEM_MESSAGE, self._count_tokens(self.SYSTEM_MESSAGE)
+        )
 
         while not state.final_answer:
-            message = self._build_message(query, state.get_last_tool_results())
-            state.add_message(message)
-            self._count_message_tokens(state.messages)
-
-            response = self.openai_wrapper.chat_complete_with_tools(
-                state.messages, self.model, [t.serialize(True) for t in self.tools]
+            cancellation.raise_if_cancelled()
+            reached_limit = (
+                "deadline"
+                if deadline_hit
+                else limits.get_reached_limit(
+                    iterations,
+                    time.monotonic() - started_at,
+                    total_tokens,
+                    repeated_tool_rounds,
+                )
+            )
+            if reached_limit is not None:
+                reply_span.set(reached_limit=reached_limit)
+                activate_trace(trace)
+                count_event("agent.limit_reached")
+                yield NeatAgentOutput(
+                    type="limit_reached",
+                    text=f"Reached the {reached_limit} limit, answering with the information gathered so far.",
+                    prompt_tokens=state.prompt_token_count,
+                )
+            message = self._build_message(
+                query, state.get_last_tool_results(), final=reached_limit is not None
             )
+            state.add_message(message, self._count_tokens(message))
+            evicted_messages = self._fit_context(state)
+            if evicted_messages:
+                yield NeatAgentOutput(
+                    type="context_eviction",
+                    text=f"Evicted {len(evicted_messages)} message(s) to fit the context budget of {self.prompt_budget} tokens.",
+                    prompt_tokens=state.prompt_token_count,
+                    evicted_messages=evicted_messages,
+                )
+
+            # without tools, the model can only answer
+            serialized_tools = (
+                self.tool_registry.serialize(offered_tools)
+                if reached_limit is None
+                else []
+            )
+            # known without tokenizing again; all tools are counted, which errs on the safe side for the rate limiter
+            estimated_tokens = state.prompt_token_count + self.tool_schema_tokens
+            total_tokens += estimated_tokens
+            iterations += 1
+            reply_span.set(iterations=iterations)
+            # the caller may resume this generator from another context, as `reply_to` does
+            activate_trace(trace)
+            activate_cancellation(cancellation)
+            if reached_limit is None:
+                llm_deadline = work_deadline
+            elif deadline is not None:
+                llm_deadline = max(
+                    deadline, time.monotonic() + limits.final_answer_seconds
+                )
+            else:
+                llm_deadline = None
+            answer_streamed = False
+            try:
+                if self.stream:
+                    accumulator = ChatCompletionStreamAccumulator()
+                    chunks = await _abound(
+                        self.openai_wrapper.astream_chat_complete_with_tools(
+                            state.messages,
+                            self.model,
+                            serialized_tools,
+                            estimated_tokens=estimated_tokens,
+                        ),
+                        cancellation,
+                        llm_deadline,
+                    )
+                    async for chunk in _abound_chunks(
+                        chunks, cancellation, llm_deadline
+                    ):
+                        content_delta = accumulator.add(chunk)
+                        # content sent along with tool calls is not the answer, clients drop what they were shown of it
+                        if accumulator.has_tool_calls:
+                            if answer_streamed:
+                                answer_streamed = False
+                                yield NeatAgentOutput(
+                                    type="answer_reset",
+                                    text=None,
+                                    prompt_tokens=state.prompt_token_count,
+                                )
+                            continue
+                        if content_delta:
+                            answer_streamed = True
+                            yield NeatAgentOutput(
+                                type="answer_delta",
+                                text=content_delta,
+                                prompt_tokens=state.prompt_token_count,
+                            )
+                    openai_message = accumulator.to_message()
+                else:
+                    response = await _abound(
+                        self.openai_wrapper.achat_complete_with_tools(
+                            state.messages,
+                            self.model,
+                            serialized_tools,
+                            estimated_tokens=estimated_tokens,
+                        ),
+                        cancellation,
+                        llm_deadline,
+                    )
+                    openai_message = response.choices[0].message
+            except _DeadlineExceededError:
+                if reached_limit is not None:
+                    raise RunCancelledError("deadline exceeded")
+                # the unanswered prompt makes way for the one asking for the final answer
+                state.pop_message(len(state.messages) - 1)
+                if answer_streamed:
+                    yield NeatAgentOutput(
+                        type="answer_reset",
+                        text=None,
+                        prompt_tokens=state.prompt_token_count,
+                    )
+                deadline_hit = True
+                continue
             chat_completion_message = _ChatCompletionMessage.from_openai_object(
-                response.choices[0].message
+                openai_message
             )
-            if chat_completion_message.functions:
-                state.add_message(chat_completion_message.to_message())
-
-                tool_results = []
-                for tool_call in chat_completion_message.functions:
+            if chat_completion_message.functions and reached_limit is None:
+                assistant_message = chat_completion_message.to_message()
+                assistant_message_tokens = self._count_tokens(assistant_message)
+                state.add_message(assistant_message, assistant_message_tokens)
+                total_tokens += assistant_message_tokens
+
+                tool_calls = chat_completion_message.functions
+                if all(self._get_call_key(f) in tool_call_memo for f in tool_calls):
+                    repeated_tool_rounds += 1
+                for tool_call in tool_calls:
                     yield NeatAgentOutput(
-                        type="thought", text=tool_call.json.get(self.REASONING_KEY)
+                        type="thought",
+                        text=tool_call.json.get(self.REASONING_KEY),
+                        prompt_tokens=state.prompt_token_count,
                     )
-                    tool_results.append(self._call_tool(tool_call))
-                state.add_tool_results(tool_results)
 
-                if not state.final_answer:
-                    for tool_result in state.get_last_tool_results():
+                tool_results: list[Optional[ToolResult]] = [None] * len(tool_calls)
+                activate_trace(trace)
+                activate_cancellation(cancellation)
+                async for index, tool_result in self._acall_tools(
+                    query, tool_calls, cancellation, tool_call_memo, work_deadline
+                ):
+                    tool_results[index] = tool_result
+                    if not tool_result.final:
                         yield NeatAgentOutput(
                             type="function_call",
-                            text=f"Query:\n{tool_call.arguments}\n\n{tool_result.get_as_string()}",
+                            text=f"Query:\n{tool_calls[index].arguments}\n\n{tool_result.get_as_string()}",
+                            prompt_tokens=state.prompt_token_count,
                         )
+                state.add_tool_results([t for t in tool_results if t is not None])
 
             elif chat_completion_message.content:
                 state.set_final_answer(chat_completion_message.content)
@@ -180,12 +532,32 @@ If you think you gathered all necessary information, generate a final answer."""
             else:
                 raise RuntimeError(f"Openai response could not be read.")
 
-        self.history.add_message(Message(role="user", content=query))
-        self.history.add_message(chat_completion_message.to_message())
-        yield NeatAgentOutput(type="answer", text=state.final_answer)
+        # a reply cancelled at the last moment must not leave a turn behind
+        cancellation.raise_if_cancelled()
+        turn = [
+            Message(role="user", content=query),
+            chat_completion_message.to_message(),
+        ]
+        if self.history.in_memory:
+            self._add_to_history(turn)
+        else:
+            # a persistent storage writes to disk, which must not block the event loop
+            await asyncio.to_thread(self._add_to_history, turn)
+        yield NeatAgentOutput(
+            type="answer",
+            text=state.final_answer,
+            prompt_tokens=state.prompt_token_count,
+        )
+
+    def _add_to_history(self, messages: Sequence[Message]) -> None:
+        for message in messages:
+            self.history.add_message(message)
 
-    def _build_message(self, query: str, last_tools: Sequence[ToolResult]) -> Message:
-        message_content = self.REACT_TEMPLATE.format(
+    def _build_message(
+        self, query: str, last_tools: Sequence[ToolResult], final: bool = False
+    ) -> Message:
+        template = self.FINAL_ANSWER_TEMPLATE if final else self.REACT_TEMPLATE
+        message_content = template.format(
             tool_response=self.TOOL_RESPONSE_TEMPLATE.format(
                 tool_results="\n\n".join(tool.get_as_string() for tool in last_tools)
             ),
@@ -193,27 +565,169 @@ If you think you gathered all necessary information, generate a final answer."""
         )
         return Message(role="user", content=message_content)
 
-    def _count_message_tokens(
+    def _count_tokens(self, message: Message) -> int:
+        return self.openai_wrapper.count_message_tokens(message, self.model)
+
+    def _fit_context(self, state: _ReplyState) -> list[Message]:
+        evicted_messages: list[Message] = []
+        while state.prompt_token_count > self.prompt_budget:
+            index = self.eviction_policy.select(
+                state.messages, state.message_token_counts
+            )
+            if index is None:
+                break
+            evicted_messages.append(state.pop_message(index))
+        return evicted_messages
+
+    async def _acall_tools(
         self,
-        messages: list[Message],
-    ) -> list[Message]:
-        ommited_messages: list[Message] = []
-        count = self.openai_wrapper.open_ai_count_tokens(messages, self.model)
-        while count > 4096:
-            ommited_messages.append(messages.pop(1))
-            count = self.openai_wrapper.open_ai_count_tokens(messages, self.model)
-        return ommited_messages
-
-    def _call_tool(self, function_helper: _Function) -> ToolResult:
-        tool_to_use = next(
-            (
-                t
-                for t in self.tools
-                if function_helper.name in [t.name, t.serialized_name]
-            ),
-            None,
+        query: str,
+        function_helpers: Sequence[_Function],
+        cancellation: CancellationToken,
+        memo: dict[str, asyncio.Future[ToolResult]],
+        deadline: Optional[float] = None,
+    ) -> AsyncGenerator[tuple[int, ToolResult], None]:
+        """
+        Runs all tool calls of one turn concurrently, yielding `(index, result)` in completion order.
+        Results are compacted to their token budget, if a compactor is set.
+        A call already made with the same arguments, in this turn or in `memo`, shares the result of the first one.
+        Tool runs time out at `deadline`, a `time.monotonic` timestamp, if it comes before the tool timeout.
+        """
+        semaphore = asyncio.Semaphore(self.max_parallel_tools)
+
+        async def run(function_helper: _Function) -> ToolResult:
+            async with semaphore:
+                tool_result = await self._acall_tool(
+                    function_helper, self._get_tool_timeout(deadline)
+                )
+            if self.result_compactor is not None:
+                tool_result = await self.result_compactor.acompact(
+                    self._get_compaction_query(query, function_helper), tool_result
+                )
+            return tool_result
+
+        async def call(
+            index: int, run_future: asyncio.Future[ToolResult]
+        ) -> tuple[int, ToolResult]:
+            # shielded, as other calls of the memo may still wait for it
+            return index, await asyncio.shield(run_future)
+
+        runs: list[asyncio.Future[ToolResult]] = []
+        tasks = []
+        for i, function_helper in enumerate(function_helpers):
+            key = self._get_call_key(function_helper)
+            run_future = memo.get(key)
+            if run_future is None or run_future.cancelled():
+                run_future = memo[key] = asyncio.ensure_future(run(function_helper))
+                runs.append(run_future)
+            else:
+                count_event("agent.tool_memo_hit")
+            tasks.append(asyncio.ensure_future(call(i, run_future)))
+        try:
+            for next_completed in asyncio.as_completed(tasks):
+                yield await cancellation.race(next_completed)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for run_future in runs:
+                run_future.cancel()
+
+    def _get_call_key(self, function_helper: _Function) -> str:
+        tool = self.tool_registry.get(function_helper.name)
+        arguments = function_helper.get_arguments_except([self.REASONING_KEY])
+        return json.dumps(
+            [tool.serialized_name if tool else function_helper.name, arguments],
+            sort_keys=True,
+        )
+
+    def _get_tool_timeout(self, deadline: Optional[float]) -> Optional[float]:
+        remaining_seconds = _get_remaining_seconds(deadline)
+        if remaining_seconds is None:
+            return self.tool_timeout
+        if self.tool_timeout is None:
+            return remaining_seconds
+        return min(self.tool_timeout, remaining_seconds)
+
+    def _get_compaction_query(self, query: str, function_helper: _Function) -> str:
+        # the arguments of the call, like a search query, tell what the result is needed for
+        arguments = function_helper.get_arguments_except([self.REASONING_KEY])
+        return " ".join(
+            [query, *(str(v) for v in arguments.values() if isinstance(v, str))]
         )
-        if tool_to_use is not None:
-            arguments = function_helper.get_arguments_except([self.REASONING_KEY])
-            return tool_to_use.run(arguments)
-        return ToolResult(results=[], source=function_helper.name)
+
+    async def _acall_tool(
+        self, function_helper: _Function, timeout: Optional[float]
+    ) -> ToolResult:
+        # tools that were not offered this turn can still be called, e.g. when named in the history
+        tool_to_use = self.tool_registry.get(function_helper.name)
+        if tool_to_use is None:
+            return ToolResult(results=[], source=function_helper.name)
+
+        arguments = function_helper.get_arguments_except([self.REASONING_KEY])
+        try:
+            return await asyncio.wait_for(tool_to_use.arun(arguments), timeout=timeout)
+        except asyncio.TimeoutError:
+            return ToolResult(
+                results=[f"Tool run timed out after {timeout:.1f} seconds."],
+                source=tool_to_use.name,
+            )
+        except RunCancelledError:
+            raise
+        except Exception as e:
+            return ToolResult(
+                results=[f"Tool run failed: {type(e).__name__}: {e}"],
+                source=tool_to_use.name,
+            )
+
+
+def _get_remaining_seconds(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class _DeadlineExceededError(Exception):
+    """Raised by `_abound` at the deadline, as opposed to timeouts from within the awaited work."""
+
+
+async def _abound(
+    awaitable: Awaitable[T], cancellation: CancellationToken, deadline: Optional[float]
+) -> T:
+    """Awaits `awaitable` until `cancellation` is cancelled, or raises `_DeadlineExceededError` at `deadline`."""
+    if deadline is None:
+        return await cancellation.race(awaitable)
+    return await cancellation.race(_await_until(awaitable, deadline))
+
+
+async def _await_until(awaitable: Awaitable[T], deadline: float) -> T:
+    task = asyncio.ensure_future(awaitable)
+    try:
+        await asyncio.wait([task], timeout=_get_remaining_seconds(deadline))
+    except BaseException:
+        task.cancel()
+        raise
+    if task.done():
+        return task.result()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    raise _DeadlineExceededError()
+
+
+async def _abound_chunks(
+    chunks: AsyncIterator[ChatCompletionChunk],
+    cancellation: CancellationToken,
+    deadline: Optional[float],
+) -> AsyncIterator[ChatCompletionChunk]:
+    """Passes the chunks through, bounding the wait for each like `_abound`."""
+    if deadline is None:
+        # only checked between chunks, which keeps the common case free of a task per chunk
+        async for chunk in chunks:
+            cancellation.raise_if_cancelled()
+            yield chunk
+        return
+    while True:
+        try:
+            chunk = await _abound(anext(chunks), cancellation, deadline)
+        except StopAsyncIteration:
+            return
+        yield chunk
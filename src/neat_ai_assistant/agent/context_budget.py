@@ -0,0 +1,85 @@
+from abc import abstractmethod
+from typing import Mapping, Optional, Sequence
+
+from pydantic import BaseModel
+
+from ..llm.openai_wrapper import Message, Model
+
+
+class ContextBudget(BaseModel):
+    max_context_tokens: int
+    reserved_completion_tokens: int
+    # fixed cost of wrapping the tool definitions into the prompt, on top of their own tokens
+    tool_schema_overhead_tokens: int
+
+    def get_prompt_budget(self, tool_schema_tokens: int) -> int:
+        return (
+            self.max_context_tokens
+            - self.reserved_completion_tokens
+            - self.tool_schema_overhead_tokens
+            - tool_schema_tokens
+        )
+
+
+DEFAULT_CONTEXT_BUDGETS: Mapping[Model, ContextBudget] = {
+    Model.GPT_3_5: ContextBudget(
+        max_context_tokens=16_385,
+        reserved_completion_tokens=4_096,
+        tool_schema_overhead_tokens=32,
+    ),
+    Model.GPT_4: ContextBudget(
+        max_context_tokens=128_000,
+        reserved_completion_tokens=4_096,
+        tool_schema_overhead_tokens=32,
+    ),
+}
+
+
+class EvictionPolicy:
+    """
+    Decides which message to drop next when a prompt exceeds its budget.
+    The system message (first) and the latest message (last) are never evicted.
+    """
+
+    @abstractmethod
+    def select(
+        self, messages: Sequence[Message], token_counts: Sequence[int]
+    ) -> Optional[int]:
+        """Returns the index of the message to evict or None if nothing can be evicted."""
+        ...
+
+    @staticmethod
+    def _candidate_indices(messages: Sequence[Message]) -> range:
+        return range(1, len(messages) - 1)
+
+
+class OldestFirstEviction(EvictionPolicy):
+    def select(
+        self, messages: Sequence[Message], token_counts: Sequence[int]
+    ) -> Optional[int]:
+        candidates = self._candidate_indices(messages)
+        return candidates[0] if candidates else None
+
+
+class LargestToolResultFirstEviction(EvictionPolicy):
+    """Evicts the largest user message, which is where tool results are fed back to the model."""
+
+    def select(
+        self, messages: Sequence[Message], token_counts: Sequence[int]
+    ) -> Optional[int]:
+        candidates = [
+            i for i in self._candidate_indices(messages) if messages[i].role == "user"
+        ]
+        if not candidates:
+            return OldestFirstEviction().select(messages, token_counts)
+        return max(candidates, key=lambda i: token_counts[i])
+
+
+class KeepFirstUserTurnEviction(EvictionPolicy):
+    """Evicts oldest first, but keeps the first user turn as it usually holds the most relevant context."""
+
+    def select(
+        self, messages: Sequence[Message], token_counts: Sequence[int]
+    ) -> Optional[int]:
+        candidates = self._candidate_indices(messages)[1:]
+        return candidates[0] if candidates else None
@@ -1,20 +1,122 @@
-from typing import Sequence
+import threading
+from collections import deque
+from typing import Callable, Optional, Sequence
 
 from ..llm.openai_wrapper import Message
+from ..utils.bm25 import BM25Index
+from .history_storage import HistoryStorage, InMemoryHistoryStorage
+
+
+def _build_message_string(m: Message) -> str:
+    return f"{m.role}: {m.content}"
 
 
 class ConversationHistory:
-    def __init__(self) -> None:
-        self.history: list[Message] = []
+    """
+    Messages of one conversation, bounded by `max_messages` and `max_tokens`, and searchable.
+    Thread-safe, so that persistent storages can be used from worker threads.
+
+    Several instances, e.g. in different processes, may share one persistent storage: each instance follows
+    the storage by sequence number before enforcing the limits or searching, so both cover the messages
+    all instances wrote. With a batching storage, the limits apply once a batch is written.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        token_counter: Optional[Callable[[Message], int]] = None,
+        storage: Optional[HistoryStorage] = None,
+    ) -> None:
+        if max_tokens is not None and token_counter is None:
+            raise ValueError("A token_counter is required to enforce max_tokens.")
+        self.storage = storage if storage is not None else InMemoryHistoryStorage()
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter
+        self._lock = threading.RLock()
+
+        # the stored messages this instance has tracked, keyed by their storage sequence number
+        self._token_counts: deque[tuple[int, int]] = deque()
+        self._token_sum = 0
+        self._messages: dict[int, Message] = {}
+        self._search_index: BM25Index[int] = BM25Index()
+        self._last_seq = -1
+
+        # a persistent storage may already hold messages
+        self._sync()
+        self._enforce_limits()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.storage.in_memory
 
     def add_message(self, message: Message) -> None:
-        self.history.append(message)
+        with self._lock:
+            self.storage.append([message])
+            self._sync()
+            self._enforce_limits()
+
+    def _sync(self) -> None:
+        # other instances sharing the storage may have added messages or dropped old ones
+        seq_range = self.storage.get_seq_range()
+        if seq_range is None or seq_range[1] < self._last_seq:
+            while self._token_counts:
+                self._untrack_oldest()
+            self._last_seq = -1
+            if seq_range is None:
+                return
+        first_seq = seq_range[0]
+        while self._token_counts and self._token_counts[0][0] < first_seq:
+            self._untrack_oldest()
+        for seq, message in self.storage.get_entries_after(self._last_seq):
+            self._track(seq, message)
+
+    def _track(self, seq: int, message: Message) -> None:
+        token_count = 0 if self.token_counter is None else self.token_counter(message)
+        self._token_counts.append((seq, token_count))
+        self._token_sum += token_count
+        self._messages[seq] = message
+        self._search_index.add(seq, message.content)
+        self._last_seq = seq
+
+    def _untrack_oldest(self) -> None:
+        seq, token_count = self._token_counts.popleft()
+        self._token_sum -= token_count
+        del self._messages[seq]
+        self._search_index.remove(seq)
+
+    def _exceeds_limits(self) -> bool:
+        return (
+            self.max_messages is not None and len(self._messages) > self.max_messages
+        ) or (self.max_tokens is not None and self._token_sum > self.max_tokens)
+
+    def _enforce_limits(self) -> None:
+        # oldest messages go first, the latest message is always kept
+        dropped = False
+        while len(self._messages) > 1 and self._exceeds_limits():
+            self._untrack_oldest()
+            dropped = True
+        if dropped:
+            self.storage.drop_before(self._token_counts[0][0])
 
     def get(self) -> Sequence[Message]:
-        return self.history
+        with self._lock:
+            return self.storage.get_all()
 
     def get_as_string_list(self, n: int) -> list[str]:
-        def build_message_string(m: Message) -> str:
-            return f"{m.role}: {m.content}"
+        with self._lock:
+            return [_build_message_string(m) for m in self.storage.get_tail(n)]
+
+    def search(self, query: str, n: int) -> Sequence[Message]:
+        """Returns the `n` past messages most relevant to `query`, most relevant first."""
+        with self._lock:
+            # the index follows the storage, which other instances may have changed since
+            self.storage.flush()
+            self._sync()
+            return [
+                self._messages[seq] for seq, _ in self._search_index.search(query, n)
+            ]
 
-        return [build_message_string(m) for m in self.history[-n:]]
+    def search_as_string_list(self, query: str, n: int) -> list[str]:
+        return [_build_message_string(m) for m in self.search(query, n)]
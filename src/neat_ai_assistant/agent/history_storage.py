@@ -0,0 +1,222 @@
+import sqlite3
+import threading
+from abc import abstractmethod
+from pathlib import Path
+from typing import Optional, Sequence
+
+from ..llm.openai_wrapper import Message
+
+
+class HistoryStorage:
+    """
+    Append-only message log of a single conversation.
+    Every stored message has a sequence number, increasing with each append and never reused,
+    so that several readers of one storage can tell which messages they have already seen.
+    Storages that are not `in_memory` may block on I/O, so async callers run them in a worker thread.
+    """
+
+    in_memory = False
+
+    @abstractmethod
+    def append(self, messages: Sequence[Message]) -> None:
+        ...
+
+    @abstractmethod
+    def get_all(self) -> Sequence[Message]:
+        ...
+
+    @abstractmethod
+    def get_tail(self, n: int) -> Sequence[Message]:
+        """Returns the last `n` messages, oldest first. Like a list slice `[-n:]`, `n=0` returns all messages."""
+        ...
+
+    @abstractmethod
+    def get_seq_range(self) -> Optional[tuple[int, int]]:
+        """Returns the first and last stored sequence numbers, or None if nothing is stored."""
+        ...
+
+    @abstractmethod
+    def get_entries_after(self, seq: int) -> Sequence[tuple[int, Message]]:
+        """Returns the stored messages with a sequence number above `seq` and their sequence numbers, oldest first."""
+        ...
+
+    @abstractmethod
+    def drop_before(self, seq: int) -> None:
+        """Drops the messages with a sequence number below `seq`."""
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def flush(self) -> None:
+        ...
+
+
+class InMemoryHistoryStorage(HistoryStorage):
+    in_memory = True
+
+    def __init__(self) -> None:
+        self.messages: list[Message] = []
+        self._first_seq = 0
+
+    def append(self, messages: Sequence[Message]) -> None:
+        self.messages.extend(messages)
+
+    def get_all(self) -> Sequence[Message]:
+        return self.messages
+
+    def get_tail(self, n: int) -> Sequence[Message]:
+        return self.messages[-n:]
+
+    def get_seq_range(self) -> Optional[tuple[int, int]]:
+        if not self.messages:
+            return None
+        return self._first_seq, self._first_seq + len(self.messages) - 1
+
+    def get_entries_after(self, seq: int) -> Sequence[tuple[int, Message]]:
+        start = max(seq + 1 - self._first_seq, 0)
+        return [
+            (self._first_seq + i, m)
+            for i, m in enumerate(self.messages[start:], start=start)
+        ]
+
+    def drop_before(self, seq: int) -> None:
+        n = min(max(seq - self._first_seq, 0), len(self.messages))
+        del self.messages[:n]
+        self._first_seq += n
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+class SQLiteHistoryDatabase:
+    """
+    SQLite file holding the histories of many sessions.
+    Uses WAL journaling, so several uvicorn workers can share one file.
+    """
+
+    def __init__(self, path: str | Path, busy_timeout_ms: int = 5_000) -> None:
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        # the primary key doubles as the (session_id, seq) index for tail queries
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID"""
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class SQLiteHistoryStorage(HistoryStorage):
+    """
+    History of one session in a `SQLiteHistoryDatabase`.
+    Messages are inserted with increasing sequence numbers and never updated.
+    With `batch_size > 1`, inserts are buffered and written in one transaction; message reads flush the buffer first,
+    while sequence numbers only exist for written messages.
+    """
+
+    def __init__(
+        self, database: SQLiteHistoryDatabase, session_id: str, batch_size: int = 1
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1.")
+        self.database = database
+        self.session_id = session_id
+        self.batch_size = batch_size
+        self._pending: list[Message] = []
+
+    def append(self, messages: Sequence[Message]) -> None:
+        self._pending.extend(messages)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            self._write(pending)
+        except BaseException:
+            # kept for the next flush to retry, ahead of what was appended meanwhile
+            self._pending = pending + self._pending
+            raise
+
+    def _write(self, pending: Sequence[Message]) -> None:
+        with self.database.lock:
+            connection = self.database.connection
+            # IMMEDIATE takes the write lock up front, so concurrent workers cannot allocate the same seq
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                (next_seq,) = connection.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?",
+                    (self.session_id,),
+                ).fetchone()
+                connection.executemany(
+                    "INSERT INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                    [
+                        (self.session_id, next_seq + i, m.role, m.content)
+                        for i, m in enumerate(pending)
+                    ],
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def get_all(self) -> Sequence[Message]:
+        return self.get_tail(0)
+
+    def get_tail(self, n: int) -> Sequence[Message]:
+        self.flush()
+        with self.database.lock:
+            rows = self.database.connection.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (self.session_id, n if n > 0 else -1),
+            ).fetchall()
+        return [Message(role=role, content=content) for role, content in reversed(rows)]
+
+    def get_seq_range(self) -> Optional[tuple[int, int]]:
+        with self.database.lock:
+            first_seq, last_seq = self.database.connection.execute(
+                "SELECT MIN(seq), MAX(seq) FROM messages WHERE session_id = ?",
+                (self.session_id,),
+            ).fetchone()
+        return None if first_seq is None else (first_seq, last_seq)
+
+    def get_entries_after(self, seq: int) -> Sequence[tuple[int, Message]]:
+        with self.database.lock:
+            rows = self.database.connection.execute(
+                "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (self.session_id, seq),
+            ).fetchall()
+        return [
+            (row_seq, Message(role=role, content=content))
+            for row_seq, role, content in rows
+        ]
+
+    def drop_before(self, seq: int) -> None:
+        with self.database.lock:
+            self.database.connection.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq < ?",
+                (self.session_id, seq),
+            )
+
+    def __len__(self) -> int:
+        # sequence numbers are contiguous, so this avoids a full count
+        seq_range = self.get_seq_range()
+        stored = 0 if seq_range is None else seq_range[1] - seq_range[0] + 1
+        return stored + len(self._pending)
@@ -0,0 +1,165 @@
+import re
+from typing import Mapping, Optional, Sequence
+
+from ..llm.openai_wrapper import Message, Model, OpenaiWrapper
+from ..utils.bm25 import BM25Index
+from ..utils.tracing import start_span
+from .tool import ToolResult
+
+_PARAGRAPH_SEPARATOR = re.compile(r"\n\s*\n")
+_SENTENCE_SEPARATOR = re.compile(r"(?<=[.!?])\s+")
+
+OMISSION_MARKER = "[...]"
+
+
+def split_into_chunks(text: str, max_chars: int) -> list[str]:
+    """Splits text into chunks of up to `max_chars` at paragraph, then sentence boundaries, merging short paragraphs."""
+    pieces: list[str] = []
+    for paragraph in _PARAGRAPH_SEPARATOR.split(text):
+        paragraph = paragraph.strip()
+        if len(paragraph) <= max_chars:
+            if paragraph:
+                pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_SEPARATOR.split(paragraph):
+            pieces.extend(
+                sentence[i : i + max_chars] for i in range(0, len(sentence), max_chars)
+            )
+
+    chunks: list[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 2 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]}\n\n{piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+class ToolResultCompactor:
+    """
+    Shrinks tool results that exceed their token budget before they are fed back to the model.
+    Results are split into chunks, ranked by BM25 against the user query and the tool call, and the best chunks
+    are kept in their original order until the budget is spent. The best chunk is always kept.
+    With `summarize_above_tokens`, larger results are condensed by the cheaper `summary_model` instead,
+    falling back to the extractive selection if the summary fails or does not fit.
+    Final results are never compacted, since they are the answer.
+    """
+
+    SUMMARY_SYSTEM_MESSAGE = """You condense tool results for an assistant that answers a user question.
+Keep every fact, number, name, date and source that helps to answer the question and drop everything else.
+Answer with the condensed results only, in at most {max_words} words."""
+
+    def __init__(
+        self,
+        openai_wrapper: OpenaiWrapper,
+        model: Model = Model.GPT_4,
+        max_tokens_per_tool: int = 1_000,
+        tool_budgets: Mapping[str, int] = {},
+        chunk_chars: int = 800,
+        summarize_above_tokens: Optional[int] = None,
+        summary_model: Model = Model.GPT_3_5,
+        max_summary_input_tokens: int = 8_000,
+    ) -> None:
+        self.openai_wrapper = openai_wrapper
+        self.model = model
+        self.max_tokens_per_tool = max_tokens_per_tool
+        self.tool_budgets = tool_budgets
+        self.chunk_chars = chunk_chars
+        self.summarize_above_tokens = summarize_above_tokens
+        self.summary_model = summary_model
+        self.max_summary_input_tokens = max_summary_input_tokens
+
+    def get_budget(self, tool_name: str) -> int:
+        return self.tool_budgets.get(tool_name, self.max_tokens_per_tool)
+
+    async def acompact(self, query: str, result: ToolResult) -> ToolResult:
+        if result.final:
+            return result
+        budget = self.get_budget(result.source)
+        tokens = sum(self._count_tokens(r) for r in result.results)
+        if tokens <= budget:
+            return result
+
+        with start_span("tool.compact", tool=result.source, tokens=tokens) as span:
+            if (
+                self.summarize_above_tokens is not None
+                and tokens > self.summarize_above_tokens
+            ):
+                summary_input = self.extract(
+                    query, result.results, self.max_summary_input_tokens
+                )
+                summary = await self._asummarize(query, summary_input, budget)
+                if summary is not None:
+                    span.set(summarized=True, compacted_tokens=summary[1])
+                    return result.model_copy(update={"results": [summary[0]]})
+            results = self.extract(query, result.results, budget)
+            span.set(
+                summarized=False,
+                compacted_tokens=sum(self._count_tokens(r) for r in results),
+            )
+            return result.model_copy(update={"results": results})
+
+    def extract(self, query: str, results: Sequence[str], budget: int) -> Sequence[str]:
+        """Keeps the chunks of `results` that match `query` best within `budget` tokens, marking omissions."""
+        chunks = [split_into_chunks(r, self.chunk_chars) for r in results]
+        positions = [(i, j) for i, c in enumerate(chunks) for j in range(len(c))]
+        index: BM25Index[int] = BM25Index()
+        for n, (i, j) in enumerate(positions):
+            index.add(n, chunks[i][j])
+        ranked = [n for n, _ in index.search(query, len(positions))]
+        ranked_set = set(ranked)
+        # chunks sharing no term with the query follow in their original order
+        ranked += [n for n in range(len(positions)) if n not in ranked_set]
+
+        selected: set[tuple[int, int]] = set()
+        used_tokens = 0
+        for n in ranked:
+            i, j = positions[n]
+            chunk_tokens = self._count_tokens(chunks[i][j])
+            if not selected or used_tokens + chunk_tokens <= budget:
+                selected.add((i, j))
+                used_tokens += chunk_tokens
+
+        compacted = []
+        for i, result_chunks in enumerate(chunks):
+            parts: list[str] = []
+            for j, chunk in enumerate(result_chunks):
+                if (i, j) in selected:
+                    parts.append(chunk)
+                elif not parts or parts[-1] != OMISSION_MARKER:
+                    parts.append(OMISSION_MARKER)
+            if any(part != OMISSION_MARKER for part in parts):
+                compacted.append("\n\n".join(parts))
+        return compacted
+
+    async def _asummarize(
+        self, query: str, results: Sequence[str], budget: int
+    ) -> Optional[tuple[str, int]]:
+        messages = [
+            Message(
+                role="system",
+                content=self.SUMMARY_SYSTEM_MESSAGE.format(
+                    max_words=int(budget * 0.75)
+                ),
+            ),
+            Message(
+                role="user",
+                content="Question: {query}\n\nTool results:\n{results}".format(
+                    query=query, results="\n\n".join(results)
+                ),
+            ),
+        ]
+        try:
+            response = await self.openai_wrapper.achat_complete(
+                messages, self.summary_model
+            )
+        except Exception:
+            return None
+        summary = response.choices[0].message.content
+        if not summary:
+            return None
+        tokens = self._count_tokens(summary)
+        return (summary, tokens) if tokens <= budget else None
+
+    def _count_tokens(self, text: str) -> int:
+        return self.openai_wrapper.count_tokens(text, self.model)
@@ -0,0 +1,197 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from types import TracebackType
+from typing import Optional, Type
+
+from ..utils.prometheus import MetricsRegistry
+
+
+class RunQueueFullError(Exception):
+    def __init__(self, retry_after_seconds: float) -> None:
+        super().__init__(
+            f"Too many runs are queued, retry in {math.ceil(retry_after_seconds)} seconds."
+        )
+        self.retry_after_seconds = retry_after_seconds
+
+
+class RunTicket:
+    """
+    A place in the queue of a `RunScheduler`. Entering it waits for a run slot and leaving it frees the slot.
+    `release` may be called any number of times, also for tickets that were never entered.
+    """
+
+    def __init__(
+        self, scheduler: "RunScheduler", session_id: str, future: asyncio.Future[None]
+    ) -> None:
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._future = future
+
+    @property
+    def admitted(self) -> bool:
+        return self.admitted_at is not None
+
+    async def wait(self) -> None:
+        try:
+            await self._future
+        except asyncio.CancelledError:
+            self.release()
+            raise
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        if self.admitted:
+            self.scheduler._finish(self)
+        else:
+            self.scheduler._remove(self)
+
+    def _admit(self) -> None:
+        self.admitted_at = time.monotonic()
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def __aenter__(self) -> "RunTicket":
+        await self.wait()
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.release()
+
+
+class RunScheduler:
+    """
+    Runs at most `max_concurrent_runs` agent replies at once and queues up to `max_queued_runs` more,
+    rejecting further ones right away with a retry hint. Queued runs are admitted round robin across sessions,
+    and each session may only queue `max_queued_runs_per_session`, so that one busy session cannot starve the others.
+    Meant for a single event loop, like the one of the web server.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_runs: int = 8,
+        max_queued_runs: int = 32,
+        max_queued_runs_per_session: int = 4,
+        initial_run_seconds: float = 10.0,
+        metrics_registry: Optional[MetricsRegistry] = None,
+        metrics_prefix: str = "neat",
+    ) -> None:
+        if max_concurrent_runs < 1:
+            raise ValueError("max_concurrent_runs must be at least 1.")
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_queued_runs = max_queued_runs
+        self.max_queued_runs_per_session = max_queued_runs_per_session
+        # moving average of the run durations, to tell rejected callers when to come back
+        self.average_run_seconds = initial_run_seconds
+        self.running = 0
+        self.queued = 0
+        self._queues: OrderedDict[str, deque[RunTicket]] = OrderedDict()
+
+        self._metrics = None
+        if metrics_registry is not None:
+            self._metrics = _SchedulerMetrics(metrics_registry, metrics_prefix)
+            self._update_gauges()
+
+    def enqueue(self, session_id: str) -> RunTicket:
+        """Takes a place in the queue, or raises `RunQueueFullError` without waiting if there is none."""
+        session_queue = self._queues.get(session_id)
+        if self.queued >= self.max_queued_runs:
+            self._reject("queue_full")
+        if (
+            session_queue is not None
+            and len(session_queue) >= self.max_queued_runs_per_session
+        ):
+            self._reject("session_queue_full")
+
+        ticket = RunTicket(self, session_id, asyncio.get_running_loop().create_future())
+        if self.running < self.max_concurrent_runs and not self.queued:
+            self._start(ticket)
+        else:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self.queued += 1
+        self._update_gauges()
+        return ticket
+
+    def get_retry_after_seconds(self) -> float:
+        expected_seconds = (
+            self.average_run_seconds * (self.queued + 1) / self.max_concurrent_runs
+        )
+        return min(max(expected_seconds, 1.0), 60.0)
+
+    def _reject(self, reason: str) -> None:
+        if self._metrics is not None:
+            self._metrics.rejections.inc((reason,))
+        raise RunQueueFullError(self.get_retry_after_seconds())
+
+    def _start(self, ticket: RunTicket) -> None:
+        ticket._admit()
+        self.running += 1
+        if self._metrics is not None:
+            self._metrics.wait_seconds.observe(
+                (ticket.admitted_at or ticket.enqueued_at) - ticket.enqueued_at
+            )
+
+    def _finish(self, ticket: RunTicket) -> None:
+        self.running -= 1
+        if ticket.admitted_at is not None:
+            run_seconds = time.monotonic() - ticket.admitted_at
+            self.average_run_seconds += 0.2 * (run_seconds - self.average_run_seconds)
+        self._admit_next()
+
+    def _remove(self, ticket: RunTicket) -> None:
+        session_queue = self._queues.get(ticket.session_id)
+        if session_queue is None or ticket not in session_queue:
+            return
+        session_queue.remove(ticket)
+        self.queued -= 1
+        if not session_queue:
+            del self._queues[ticket.session_id]
+        self._update_gauges()
+
+    def _admit_next(self) -> None:
+        while self.running < self.max_concurrent_runs and self._queues:
+            session_id, session_queue = next(iter(self._queues.items()))
+            ticket = session_queue.popleft()
+            self.queued -= 1
+            # the session goes to the back of the line, behind every other waiting session
+            if session_queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+            self._start(ticket)
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        if self._metrics is not None:
+            self._metrics.queued.set(self.queued)
+            self._metrics.running.set(self.running)
+
+
+class _SchedulerMetrics:
+    def __init__(self, registry: MetricsRegistry, prefix: str) -> None:
+        self.queued = registry.gauge(
+            f"{prefix}_run_queue_depth", "Agent replies waiting for a run slot."
+        )
+        self.running = registry.gauge(
+            f"{prefix}_running_runs", "Agent replies currently running."
+        )
+        self.wait_seconds = registry.histogram(
+            f"{prefix}_run_queue_wait_seconds",
+            "Time agent replies waited for a run slot.",
+        )
+        self.rejections = registry.counter(
+            f"{prefix}_run_rejections_total",
+            "Agent replies rejected because the queue was full.",
+            ["reason"],
+        )
@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Sequence
+
+from ..llm.openai_wrapper import Message, Model, OpenaiWrapper
+from .agent import NeatAgent
+from .conversation_history import ConversationHistory
+from .history_storage import HistoryStorage
+from .tool import Tool
+from .tools.query_conversation_history_tool import QueryConversationHistoryTool
+
+
+class _Session:
+    def __init__(self, history: ConversationHistory, agent: NeatAgent) -> None:
+        self.history = history
+        self.agent = agent
+        self.last_access = time.monotonic()
+
+
+class SessionManager:
+    """
+    Keeps one conversation history and agent per session id.
+    Sessions are evicted least-recently-used first once `max_sessions` is reached, or after `idle_ttl_seconds` without access.
+    All agents share the wrapper and tool instances; only the history tool is created per session.
+    """
+
+    def __init__(
+        self,
+        openai_wrapper: OpenaiWrapper,
+        tools: Sequence[Tool],
+        model: Model = Model.GPT_4,
+        max_sessions: int = 1_000,
+        max_messages_per_session: Optional[int] = 100,
+        max_tokens_per_session: Optional[int] = 16_000,
+        idle_ttl_seconds: Optional[float] = 3_600,
+        storage_factory: Optional[Callable[[str], HistoryStorage]] = None,
+        **agent_kwargs: Any,
+    ) -> None:
+        if any(isinstance(t, QueryConversationHistoryTool) for t in tools):
+            raise ValueError(
+                "The conversation history tool is created per session, do not pass one."
+            )
+        self.openai_wrapper = openai_wrapper
+        self.model = model
+        self.max_sessions = max_sessions
+        self.max_messages_per_session = max_messages_per_session
+        self.max_tokens_per_session = max_tokens_per_session
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.storage_factory = storage_factory
+
+        self._shared_tools = list(tools)
+        template_history = ConversationHistory()
+        self._template_agent = NeatAgent(
+            openai_wrapper=openai_wrapper,
+            tools=self._build_tools(template_history),
+            history=template_history,
+            model=model,
+            **agent_kwargs,
+        )
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get_agent(self, session_id: str) -> NeatAgent:
+        return self._get_session(session_id).agent
+
+    def get_history(self, session_id: str) -> ConversationHistory:
+        return self._get_session(session_id).history
+
+    def remove(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def _get_session(self, session_id: str) -> _Session:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                while len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                session = self._create_session(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            return session
+
+    def _evict_idle(self, now: float) -> int:
+        if self.idle_ttl_seconds is None:
+            return 0
+        evicted = 0
+        # sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            evicted += 1
+        return evicted
+
+    def _create_session(self, session_id: str) -> _Session:
+        history = self._build_history(session_id)
+        agent = self._template_agent.bind(
+            history=history, tools=self._build_tools(history)
+        )
+        return _Session(history=history, agent=agent)
+
+    def _build_history(self, session_id: str) -> ConversationHistory:
+        return ConversationHistory(
+            max_messages=self.max_messages_per_session,
+            max_tokens=self.max_tokens_per_session,
+            token_counter=self._count_tokens,
+            storage=self.storage_factory(session_id) if self.storage_factory else None,
+        )
+
+    def _build_tools(self, history: ConversationHistory) -> Sequence[Tool]:
+        return [*self._shared_tools, QueryConversationHistoryTool(history=history)]
+
+    def _count_tokens(self, message: Message) -> int:
+        return self.openai_wrapper.count_message_tokens(message, self.model)
@@ -1,9 +1,13 @@
+import asyncio
 import re
 from abc import abstractmethod
 from typing import Any, Literal, Mapping, Optional, Sequence, final
 
 from pydantic import BaseModel
 
+from ..utils.cancellation import raise_if_cancelled
+from ..utils.tracing import start_span
+
 
 class ToolParam(BaseModel):
     name: str
@@ -11,6 +15,7 @@ class ToolParam(BaseModel):
     description: str
     required: bool
     enum: Optional[Sequence[str]] = None
+    items: Optional[Mapping[str, Any]] = None
 
 
 class ToolResult(BaseModel):
@@ -37,19 +42,36 @@ class Tool:
         transformed_string = transformed_string[:64]
         return transformed_string.lower()
 
+    def get_params(self) -> Sequence[ToolParam]:
+        """The params as presented to the model. Override to describe them with per-call information."""
+        return self.params
+
     @abstractmethod
     def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
         ...
 
+    async def _arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        # synchronous tools are offloaded to a worker thread so they do not block the event loop
+        return await asyncio.to_thread(self._run, json_query)
+
     @final
     def run(self, json_query: Mapping[str, Any]) -> ToolResult:
-        self.legal_params(json_query)
-        return self._run(json_query)
+        raise_if_cancelled()
+        with start_span("tool.run", tool=self.name):
+            self.legal_params(json_query)
+            return self._run(json_query)
+
+    @final
+    async def arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        raise_if_cancelled()
+        with start_span("tool.run", tool=self.name):
+            self.legal_params(json_query)
+            return await self._arun(json_query)
 
     @final
     def legal_params(self, json_query: Mapping[str, Any]) -> None:
         received_params = set(json_query.keys())
-        expected_params = set(p.name for p in self.params)
+        expected_params = set(p.name for p in self.params if p.required)
         if not expected_params.issubset(received_params):
             missing_params = expected_params - received_params
             raise ValueError(
@@ -60,12 +82,19 @@ class Tool:
     @final
     def serialize(self, require_reasoning: bool) -> Mapping[str, Any]:
         def build_param_json(
-            type: str, description: str, enum: Optional[Sequence[str]] = None
+            type: str,
+            description: str,
+            enum: Optional[Sequence[str]] = None,
+            items: Optional[Mapping[str, Any]] = None,
         ) -> Mapping[str, Any]:
-            return {"type": type, "description": description} | (
-                {"enum": enum} if enum else {}
+            return (
+                {"type": type, "description": description}
+                | ({"enum": enum} if enum else {})
+                | ({"items": items} if items else {})
             )
 
+        params = self.get_params()
+
         return {
             "type": "function",
             "function": {
@@ -75,8 +104,10 @@ class Tool:
                     "type": "object",
                     "properties": {
                         **{
-                            p.name: build_param_json(p.type, p.description, p.enum)
-                            for p in self.params
+                            p.name: build_param_json(
+                                p.type, p.description, p.enum, p.items
+                            )
+                            for p in params
                         },
                         **(
                             {
@@ -89,7 +120,7 @@ class Tool:
                             else {}
                         ),
                     },
-                    "required": [p.name for p in self.params if p.required]
+                    "required": [p.name for p in params if p.required]
                     + (["reasoning"] if require_reasoning else []),
                 },
             },
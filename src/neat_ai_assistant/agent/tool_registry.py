@@ -0,0 +1,117 @@
+from abc import abstractmethod
+from typing import Any, Iterator, Mapping, Optional, Sequence
+
+from ..utils.bm25 import BM25Index
+from .tool import Tool
+
+
+class ToolRegistry:
+    """
+    The tools of an agent, indexed by name for dispatch.
+    Serialized schemas are built once per tool and reused, except for tools overriding `get_params`,
+    whose schemas carry per-call information and are rebuilt on every call.
+    """
+
+    def __init__(self, tools: Sequence[Tool]) -> None:
+        serialized_names = [t.serialized_name for t in tools]
+        if len(set(serialized_names)) != len(serialized_names):
+            raise ValueError("There is an overlap in tool names (after serializing).")
+        self.tools = list(tools)
+        self._tools_by_name: dict[str, Tool] = {}
+        for tool in self.tools:
+            self._tools_by_name.setdefault(tool.name, tool)
+            self._tools_by_name.setdefault(tool.serialized_name, tool)
+        self._positions = {t.serialized_name: i for i, t in enumerate(self.tools)}
+        self._schemas: dict[tuple[str, bool], Mapping[str, Any]] = {}
+        self._index: Optional[BM25Index[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.tools)
+
+    def __iter__(self) -> Iterator[Tool]:
+        return iter(self.tools)
+
+    def get(self, name: str) -> Optional[Tool]:
+        """Finds a tool by its name or its serialized name."""
+        return self._tools_by_name.get(name)
+
+    def serialize(
+        self, tools: Optional[Sequence[Tool]] = None, require_reasoning: bool = True
+    ) -> list[Mapping[str, Any]]:
+        return [
+            self._serialize(t, require_reasoning)
+            for t in (self.tools if tools is None else tools)
+        ]
+
+    def sort(self, tools: Sequence[Tool]) -> list[Tool]:
+        """Orders tools as they were registered, so that equal selections serialize to equal prompts."""
+        return sorted(tools, key=lambda t: self._positions[t.serialized_name])
+
+    def search(self, query: str, k: int) -> Sequence[tuple[Tool, float]]:
+        """Returns up to `k` tools whose name, description and params share terms with the query, best first."""
+        if self._index is None:
+            self._index = BM25Index()
+            for tool in self.tools:
+                self._index.add(tool.serialized_name, self._get_searchable_text(tool))
+        return [
+            (self._tools_by_name[name], score)
+            for name, score in self._index.search(query, k)
+        ]
+
+    def _serialize(self, tool: Tool, require_reasoning: bool) -> Mapping[str, Any]:
+        if type(tool).get_params is not Tool.get_params:
+            return tool.serialize(require_reasoning)
+        key = (tool.serialized_name, require_reasoning)
+        schema = self._schemas.get(key)
+        if schema is None:
+            schema = tool.serialize(require_reasoning)
+            self._schemas[key] = schema
+        return schema
+
+    @staticmethod
+    def _get_searchable_text(tool: Tool) -> str:
+        return " ".join(
+            [
+                tool.name,
+                tool.description,
+                *(f"{p.name.replace('_', ' ')} {p.description}" for p in tool.params),
+            ]
+        )
+
+
+class ToolSelector:
+    """Decides which tools are offered to the model for a query."""
+
+    @abstractmethod
+    def select(self, query: str, registry: ToolRegistry) -> Sequence[Tool]:
+        ...
+
+
+class AllToolsSelector(ToolSelector):
+    def select(self, query: str, registry: ToolRegistry) -> Sequence[Tool]:
+        return registry.tools
+
+
+class KeywordToolSelector(ToolSelector):
+    """
+    Offers the `k` tools that match the query best by BM25 over their names, descriptions and params,
+    plus the tools named in `always_include`. If no tool matches, all tools are offered.
+    """
+
+    def __init__(self, k: int = 5, always_include: Sequence[str] = ()) -> None:
+        if k < 1:
+            raise ValueError("k must be at least 1.")
+        self.k = k
+        self.always_include = always_include
+
+    def select(self, query: str, registry: ToolRegistry) -> Sequence[Tool]:
+        if len(registry) <= self.k:
+            return registry.tools
+        selected = {t.serialized_name: t for t, _ in registry.search(query, self.k)}
+        if not selected:
+            return registry.tools
+        for name in self.always_include:
+            tool = registry.get(name)
+            if tool is not None:
+                selected.setdefault(tool.serialized_name, tool)
+        return registry.sort(list(selected.values()))
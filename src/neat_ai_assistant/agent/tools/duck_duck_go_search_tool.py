@@ -1,7 +1,6 @@
-from typing import Any, Dict, Mapping, Sequence
-
-from duckduckgo_search import DDGS  # type: ignore
+from typing import Any, Mapping, Optional, Sequence
 
+from ...utils.web_search import SearchHit, WebSearchClient, get_shared_search_client
 from ..tool import Tool, ToolParam, ToolResult
 
 TOOL_PARAM_N = ToolParam(
@@ -21,6 +20,7 @@ TOOL_PARAM_QUERY = ToolParam(
 class DuckDuckGoSearchTool(Tool):
     """
     Uses DuckDuckGo search engine to query the internet. Only retrieves descriptive texts for hits.
+    Searches go through a `WebSearchClient`, shared with the webpage retrieval tool by default.
     Params:
     - n (int): number of pages
     - query (str): search query
@@ -31,18 +31,18 @@ class DuckDuckGoSearchTool(Tool):
         name: str = "DuckDuckGo Search Engine",
         description: str = "Find information directly from the internet.",
         params: Sequence[ToolParam] = [TOOL_PARAM_N, TOOL_PARAM_QUERY],
+        search_client: Optional[WebSearchClient] = None,
     ) -> None:
         super().__init__(name, description, params)
+        self.search_client = search_client or get_shared_search_client()
 
     def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
-        def construct_result_string(r: Dict[str, str]) -> str:
+        def construct_result_string(r: SearchHit) -> str:
             return "{title}\n{body}".format(title=r["title"], body=r["body"])
 
-        results = []
-        with DDGS(timeout=5) as ddgs:
-            for i, r in enumerate(ddgs.text(json_query["query"])):
-                if i >= json_query["n"]:
-                    break
-                results.append(construct_result_string(r))
+        results = [
+            construct_result_string(r)
+            for r in self.search_client.text(json_query["query"], json_query["n"])
+        ]
 
         return self.to_result(results)
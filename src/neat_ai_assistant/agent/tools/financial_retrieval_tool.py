@@ -1,50 +1,176 @@
-from typing import Any, Mapping, Sequence
+import time
+from array import array
+from typing import Any, Mapping, Optional, Sequence
 
 import requests
+from pydantic import BaseModel
 
+from ...utils.cache import LRUCache
+from ...utils.rate_limit import TokenBucket
+from ...utils.tracing import count_event
 from ..tool import Tool, ToolParam, ToolResult
 
 # TODO:
 # - add search/retrieval modes
 
 
-TOOL_PARAM_STOCK_TRADING_SYMBOL = ToolParam(
-    name="stock_trading_symbol",
-    type="string",
-    description="The stock trading symbol of a company (e.g. AAPL for Apple).",
+TOOL_PARAM_STOCK_TRADING_SYMBOLS = ToolParam(
+    name="stock_trading_symbols",
+    type="array",
+    items={"type": "string"},
+    description="The stock trading symbols of the companies, all at once (e.g. AAPL for Apple).",
     required=True,
 )
+# the intraday series gets a new bar every 5 minutes
+INTERVAL_SECONDS = 5 * 60
+TIME_SERIES_KEY = "Time Series (5min)"
+
+
+class _PriceSummary(BaseModel):
+    symbol: str
+    first_bar: str
+    last_bar: str
+    n_bars: int
+    open_value: float
+    close_value: float
+    high_value: float
+    low_value: float
+    volume: int
+    return_pct: float
+
+    def to_string(self) -> str:
+        return f"""Symbol: {self.symbol}
+Period: {self.first_bar} to {self.last_bar} ({self.n_bars} bars of 5 minutes)
+open_value: {self.open_value}
+close_value: {self.close_value}
+high_value: {self.high_value}
+low_value: {self.low_value}
+volume: {self.volume}
+return: {self.return_pct}%"""
+
+
+class _PriceSeries:
+    """An intraday time series, parsed once into parallel arrays with the oldest bar first."""
+
+    def __init__(self, time_series: Mapping[str, Mapping[str, str]]) -> None:
+        # the timestamps are formatted "%Y-%m-%d %H:%M:%S", so they sort chronologically
+        self.timestamps = sorted(time_series)
+        self.opens = array("d")
+        self.highs = array("d")
+        self.lows = array("d")
+        self.closes = array("d")
+        self.volumes = array("q")
+        for timestamp in self.timestamps:
+            bar = time_series[timestamp]
+            self.opens.append(float(bar["1. open"]))
+            self.highs.append(float(bar["2. high"]))
+            self.lows.append(float(bar["3. low"]))
+            self.closes.append(float(bar["4. close"]))
+            self.volumes.append(int(bar["5. volume"]))
+
+    def summarize(self, symbol: str) -> _PriceSummary:
+        open_value, close_value = self.opens[0], self.closes[-1]
+        return _PriceSummary(
+            symbol=symbol,
+            first_bar=self.timestamps[0],
+            last_bar=self.timestamps[-1],
+            n_bars=len(self.timestamps),
+            open_value=open_value,
+            close_value=close_value,
+            high_value=max(self.highs),
+            low_value=min(self.lows),
+            volume=sum(self.volumes),
+            return_pct=round((close_value / open_value - 1) * 100, 2),
+        )
 
 
 class FinancialRetrievalTool(Tool):
     """
     Uses Alphavantage API to retrieve stock data.
+    Series are cached until the next 5 minute bar is due, and requests are queued to stay within the API quota.
+    A call queues for at most `max_queueing_seconds`, which should stay below the agent's tool timeout;
+    symbols that would have to wait longer are reported as not requested.
     Params:
-    - stock_trading_symbol (str): The trading symbol for the stock to be retrieved
+    - stock_trading_symbols (list[str]): The trading symbols for the stocks to be retrieved
     """
 
     def __init__(
         self,
         alpha_vantage_api_key: str,
         name: str = "Stock Trading API",
-        description: str = "Retrieve the current weather for a location.",
-        params: Sequence[ToolParam] = [TOOL_PARAM_STOCK_TRADING_SYMBOL],
+        description: str = "Retrieve the intraday stock prices of one or more companies.",
+        params: Sequence[ToolParam] = [TOOL_PARAM_STOCK_TRADING_SYMBOLS],
+        requests_per_minute: float = 5,
+        rate_limiter: Optional[TokenBucket] = None,
+        max_queueing_seconds: float = 30.0,
+        max_cached_symbols: int = 1_000,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        session: Optional[requests.Session] = None,
     ) -> None:
         super().__init__(name, description, params)
         self.api_key = alpha_vantage_api_key
         self.url = "https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&symbol={symbol}&interval=5min&apikey={api_key}"
+        self.rate_limiter = rate_limiter or TokenBucket.per_minute(requests_per_minute)
+        self.max_queueing_seconds = max_queueing_seconds
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = session or requests.Session()
+        self._series_cache: LRUCache[str, _PriceSeries] = LRUCache(
+            max_entries=max_cached_symbols, clock=time.time
+        )
 
-    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
-        symbol = json_query["stock_trading_symbol"]
+    def _get_series(self, symbol: str, deadline: float) -> _PriceSeries | str:
+        """
+        Returns the parsed series, or the API's message if it has none.
+        The request is not made if the quota only allows it after `deadline`, a `time.monotonic` timestamp.
+        """
+        cached_series = self._series_cache.get(symbol)
+        if cached_series is not None:
+            count_event("stock_series_cache.hit")
+            return cached_series
+        count_event("stock_series_cache.miss")
+
+        wait_seconds = self.rate_limiter.reserve()
+        if time.monotonic() + wait_seconds > deadline:
+            self.rate_limiter.release(1)
+            return f"Not requested, the API quota allows no further requests within {self.max_queueing_seconds:.0f} seconds."
+        time.sleep(wait_seconds)
         url = self.url.format(symbol=symbol, api_key=self.api_key)
-        response = requests.get(url)
+        response = self.session.get(url, timeout=self.timeout)
+        if not response.ok:
+            # error pages are not necessarily JSON
+            return f"Request failed with status {response.status_code}."
         response_json = response.json()
-        open_value = response_json["Time Series (5min)"][
-            list(response_json["Time Series (5min)"].keys())[-1]
-        ]["1. open"]
-        close_value = response_json["Time Series (5min)"][
-            list(response_json["Time Series (5min)"].keys())[0]
-        ]["4. close"]
-        return self.to_result(
-            [f"open_value: {open_value}", f"close_value: {close_value}"]
+        time_series = response_json.get(TIME_SERIES_KEY)
+        if not time_series:
+            # errors and quota notes come back as a message with status 200
+            message = next(iter(response_json.values()), "No data.")
+            return str(message)
+
+        series = _PriceSeries(time_series)
+        now = time.time()
+        self._series_cache.set(
+            symbol, series, ttl_seconds=INTERVAL_SECONDS - now % INTERVAL_SECONDS
         )
+        return series
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        symbols = json_query["stock_trading_symbols"]
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        if not isinstance(symbols, list) or not all(
+            isinstance(s, str) for s in symbols
+        ):
+            raise ValueError(
+                f"stock_trading_symbols must be a list of strings, got {symbols!r}."
+            )
+
+        deadline = time.monotonic() + self.max_queueing_seconds
+        results = []
+        for symbol in dict.fromkeys(s.strip().upper() for s in symbols):
+            series = self._get_series(symbol, deadline)
+            if isinstance(series, str):
+                results.append(f"Symbol: {symbol}\n{series}")
+            else:
+                results.append(series.summarize(symbol).to_string())
+        return self.to_result(results)
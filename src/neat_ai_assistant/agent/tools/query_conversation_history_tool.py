@@ -9,6 +9,12 @@ TOOL_PARAM_N = ToolParam(
     description="The number of last messages to retrieve. Default: 4.",
     required=True,
 )
+TOOL_PARAM_QUERY = ToolParam(
+    name="query",
+    type="string",
+    description="Optional. Search the history for this text and return the n most relevant messages instead of the last n.",
+    required=False,
+)
 
 
 class QueryConversationHistoryTool(Tool):
@@ -16,6 +22,7 @@ class QueryConversationHistoryTool(Tool):
     Injects prior chat history into the context as it is not included by default.
     Params:
     - n (int): the number of last messages to be retrieved
+    - query (str, optional): search text; if given, the n most relevant messages are retrieved instead
     """
 
     def __init__(
@@ -23,11 +30,21 @@ class QueryConversationHistoryTool(Tool):
         history: ConversationHistory,
         name: str = "Retrieve Conversation History",
         description: str = "If a question is lacking context, retrieve the prior conversation history to gather more information.",
-        params: Sequence[ToolParam] = [TOOL_PARAM_N],
+        params: Sequence[ToolParam] = [TOOL_PARAM_N, TOOL_PARAM_QUERY],
     ) -> None:
         super().__init__(name, description, params)
         self.history = history
 
     def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
-        results = self.history.get_as_string_list(n=json_query["n"])
+        query = json_query.get("query")
+        if query:
+            results = self.history.search_as_string_list(query=query, n=json_query["n"])
+        else:
+            results = self.history.get_as_string_list(n=json_query["n"])
         return self.to_result(results)
+
+    async def _arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        # an in-memory lookup is cheaper than a thread hop, a persistent storage reads from disk
+        if self.history.in_memory:
+            return self._run(json_query)
+        return await super()._arun(json_query)
@@ -1,6 +1,6 @@
 from typing import Any, Mapping, Sequence
 
-from ...llm.openai_wrapper import Model, OpenaiWrapper
+from ...llm.openai_wrapper import Message, Model, OpenaiWrapper
 from ..tool import Tool, ToolParam, ToolResult
 
 TOOL_PARAM_PRODUCT = ToolParam(
@@ -58,17 +58,17 @@ class SEOWriter(Tool):
         self.company_name = company_name
         self.company_desciption = company_description
 
-    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are a SEO writing engine. Based on some inputs, you write an article that advertises a given product and is readable and includes relevant keywords and more. Use markdown notation.
+    def _build_messages(self, json_query: Mapping[str, Any]) -> Sequence[Message]:
+        return [
+            Message(
+                role="system",
+                content=f"""You are a SEO writing engine. Based on some inputs, you write an article that advertises a given product and is readable and includes relevant keywords and more. Use markdown notation.
 You work for {self.company_name}. {self.company_desciption}
 Do not mention the competition.""",
-            },
-            {
-                "role": "user",
-                "content": f"""Please write a SEO text about this:
+            ),
+            Message(
+                role="user",
+                content=f"""Please write a SEO text about this:
 Product: {json_query["product"]}
 Relevant keywords: {json_query["keywords"]}
 Other requirements: {json_query["structure"]}
@@ -83,8 +83,19 @@ Your SEO article
 **Question**: each question
 **Answer**: each answer
 ```""",
-            },
+            ),
         ]
-        response = self.openai_wrapper.chat_complete(messages, Model.GPT_3_5)
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        response = self.openai_wrapper.chat_complete(
+            self._build_messages(json_query), Model.GPT_3_5
+        )
+        content = response.choices[0].message.content
+        return self.to_result([content] if content else [], final=True)
+
+    async def _arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        response = await self.openai_wrapper.achat_complete(
+            self._build_messages(json_query), Model.GPT_3_5
+        )
         content = response.choices[0].message.content
         return self.to_result([content] if content else [], final=True)
@@ -1,9 +1,16 @@
+import json
+import time
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from statistics import mean
 from typing import Any, Mapping, Optional, Sequence
 
 import requests
 from pydantic import BaseModel
 
+from ...utils.cache import LRUCache, SQLiteCache
+from ...utils.tracing import count_event
 from ..tool import Tool, ToolParam, ToolResult
 
 try:
@@ -21,13 +28,83 @@ TOOL_PARAM_LOCATION = ToolParam(
     required=True,
 )
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
-CURRENT_DATETIME = datetime.now()  # TODO: should be somewhere else
-TOOL_PARAM_DATETIME = ToolParam(
-    name="datetime",
+TOOL_PARAM_DATETIMES = ToolParam(
+    name="datetimes",
+    type="array",
+    items={"type": "string"},
+    description=f'The times associated with the weather request, all at once, in this format: "{DATETIME_FORMAT}". Defaults to now.',
+    required=False,
+)
+TOOL_PARAM_START_DATETIME = ToolParam(
+    name="start_datetime",
     type="string",
-    description=f'Current datetime: "{CURRENT_DATETIME.strftime(DATETIME_FORMAT)}". Return the desired time associated with the weather request in this format: "{DATETIME_FORMAT}".',
-    required=True,
+    description=f'Start of a period to summarize, e.g. a whole day, in this format: "{DATETIME_FORMAT}".',
+    required=False,
+)
+TOOL_PARAM_END_DATETIME = ToolParam(
+    name="end_datetime",
+    type="string",
+    description=f'End of a period to summarize, in this format: "{DATETIME_FORMAT}".',
+    required=False,
 )
+# OpenWeatherMap publishes forecasts in 3 hour steps
+FORECAST_PERIOD_SECONDS = 3 * 60 * 60
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def normalize_location(location_name: str) -> str:
+    parts = " ".join(location_name.split()).casefold().split(",")
+    return ", ".join(part.strip() for part in parts if part.strip())
+
+
+def _to_seconds(value: datetime) -> float:
+    return (value - _EPOCH).total_seconds()
+
+
+def _to_datetime(datetime_str: str) -> datetime:
+    return datetime.strptime(datetime_str, DATETIME_FORMAT)
+
+
+class _Forecast:
+    """A forecast response, parsed once into entries sorted by time and a parallel array of their timestamps."""
+
+    def __init__(self, response_json: Mapping[str, Any]) -> None:
+        self.city_info: Mapping[str, Any] = response_json["city"]
+        timed_entries = sorted(
+            (
+                (_to_seconds(datetime.fromisoformat(entry["dt_txt"])), entry)
+                for entry in response_json["list"]
+            ),
+            key=lambda timed_entry: timed_entry[0],
+        )
+        self.timestamps = array("d", (timestamp for timestamp, _ in timed_entries))
+        self.entries: Sequence[Mapping[str, Any]] = [
+            entry for _, entry in timed_entries
+        ]
+
+    def get_nearest(self, desired_datetime: datetime) -> Mapping[str, Any]:
+        if not self.entries:
+            raise ValueError("The forecast has no entries.")
+        desired_timestamp = _to_seconds(desired_datetime)
+        i = bisect_left(self.timestamps, desired_timestamp)
+        # on a tie the earlier entry wins
+        if i == len(self.timestamps) or (
+            i > 0
+            and desired_timestamp - self.timestamps[i - 1]
+            <= self.timestamps[i] - desired_timestamp
+        ):
+            i -= 1
+        return self.entries[i]
+
+    def get_between(
+        self, start_datetime: datetime, end_datetime: datetime
+    ) -> Sequence[Mapping[str, Any]]:
+        """Returns the entries within the period, or the one nearest to its start if the period falls between two entries."""
+        start = bisect_left(self.timestamps, _to_seconds(start_datetime))
+        end = bisect_right(self.timestamps, _to_seconds(end_datetime))
+        return self.entries[start:end] or [self.get_nearest(start_datetime)]
 
 
 class _WeatherResult(BaseModel):
@@ -57,12 +134,41 @@ Wind speed: {self.wind_speed_km_h} km/h
 Wind direction: {self.wind_direction}"""
 
 
+class _WeatherSummary(BaseModel):
+    city: str
+    country: str
+    start_datetime: datetime
+    end_datetime: datetime
+    min_temperature_celsius: float
+    max_temperature_celsius: float
+    mean_temperature_celsius: float
+    precipitation_mm: float
+    max_wind_speed_km_h: float
+    weather_descriptions: Sequence[str]
+
+    def to_string(self) -> str:
+        return f"""1. Location Information
+Location: {self.city} ({self.country})
+
+2. Forecast Summary
+Period: {self.start_datetime.strftime(DATETIME_FORMAT)} to {self.end_datetime.strftime(DATETIME_FORMAT)}
+Temperature: {self.min_temperature_celsius}°C to {self.max_temperature_celsius}°C (mean {self.mean_temperature_celsius}°C)
+Precipitation: {self.precipitation_mm} mm
+Maximum wind speed: {self.max_wind_speed_km_h} km/h
+Weather Descriptions: {", ".join(self.weather_descriptions)}"""
+
+
 class WeatherRetrievalTool(Tool):
     """
     Uses OpenWeatherMap to retrieve weather information.
+    Geocoded coordinates are cached by normalized location name, optionally in a persistent `SQLiteCache`.
+    Forecasts are cached by rounded coordinates until the next 3 hour forecast period starts.
+    Several times, and a period to summarize, can be requested in one call.
     Params:
     - location (str): location of interest (will be transformed into coordinates)
-    - datetime (str): date and time to retrieve info for
+    - datetimes (list[str]): dates and times to retrieve info for
+    - start_datetime (str): start of a period to summarize
+    - end_datetime (str): end of a period to summarize
     """
 
     def __init__(
@@ -70,19 +176,99 @@ class WeatherRetrievalTool(Tool):
         open_weather_map_api_key: str,
         name: str = "Weather Retrieval API",
         description: str = "Retrieve the current weather for a location.",
-        params: Sequence[ToolParam] = [TOOL_PARAM_LOCATION, TOOL_PARAM_DATETIME],
+        params: Sequence[ToolParam] = [
+            TOOL_PARAM_LOCATION,
+            TOOL_PARAM_DATETIMES,
+            TOOL_PARAM_START_DATETIME,
+            TOOL_PARAM_END_DATETIME,
+        ],
+        geocode_cache: Optional[SQLiteCache] = None,
+        max_cached_locations: int = 10_000,
+        max_cached_forecasts: int = 1_000,
+        geolocator: Optional[Any] = None,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
     ) -> None:
         super().__init__(name, description, params)
         self.api_key = open_weather_map_api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.geocode_cache = geocode_cache
+        self._geolocator = geolocator
+        self._coordinates_cache: LRUCache[str, tuple[float, float]] = LRUCache(
+            max_entries=max_cached_locations
+        )
+        self._forecast_cache: LRUCache[tuple[float, float, int], _Forecast] = LRUCache(
+            max_entries=max_cached_forecasts
+        )
 
-    @staticmethod
-    def _get_coordinates(location_name: str) -> Optional[tuple[float, float]]:
-        geolocator = Nominatim(user_agent="my-app")
-        location: Location = geolocator.geocode(location_name)
-        if location:
-            return location.latitude, location.longitude
+    def get_params(self) -> Sequence[ToolParam]:
+        # the model needs the current time to resolve requests like "tomorrow morning";
+        # the hour is enough for 3-hour forecasts and keeps the schema, and so cached prompts, stable
+        current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        return [
+            p.model_copy(
+                update={
+                    "description": f'Current datetime, to the hour: "{current_hour.strftime(DATETIME_FORMAT)}". {p.description}'
+                }
+            )
+            if p.name == TOOL_PARAM_DATETIMES.name
+            else p
+            for p in self.params
+        ]
+
+    @property
+    def geolocator(self) -> Any:
+        if self._geolocator is None:
+            self._geolocator = Nominatim(user_agent="my-app")
+        return self._geolocator
+
+    def _get_coordinates(self, location_name: str) -> Optional[tuple[float, float]]:
+        key = normalize_location(location_name)
+        coordinates = self._coordinates_cache.get(key)
+        if coordinates is not None:
+            return coordinates
+
+        cached_coordinates = self.geocode_cache.get(key) if self.geocode_cache else None
+        if cached_coordinates is not None:
+            lat, lon = json.loads(cached_coordinates)
         else:
-            return None
+            location: Location = self.geolocator.geocode(location_name)
+            if not location:
+                return None
+            lat, lon = location.latitude, location.longitude
+            if self.geocode_cache is not None:
+                self.geocode_cache.set(key, json.dumps([lat, lon]).encode("utf-8"))
+        self._coordinates_cache.set(key, (lat, lon))
+        return lat, lon
+
+    def _get_forecast(self, lat: float, lon: float) -> _Forecast | str:
+        """Returns the parsed forecast, or the API's message if the request failed."""
+        # nearby coordinates share a forecast, and a new forecast period invalidates it
+        now = time.time()
+        period = int(now // FORECAST_PERIOD_SECONDS)
+        key = (round(lat, 2), round(lon, 2), period)
+        cached_forecast = self._forecast_cache.get(key)
+        if cached_forecast is not None:
+            count_event("forecast_cache.hit")
+            return cached_forecast
+        count_event("forecast_cache.miss")
+
+        url = "https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}"
+        request_url = url.format(lat=str(key[0]), lon=str(key[1]), api_key=self.api_key)
+        response = requests.get(request_url, timeout=self.timeout)
+        if not response.ok:
+            # e.g. an invalid key or an exceeded quota, explained in the body
+            try:
+                message = response.json().get("message")
+            except ValueError:
+                message = None
+            return str(message or f"Request failed with status {response.status_code}.")
+
+        forecast = _Forecast(response.json())
+        self._forecast_cache.set(
+            key, forecast, ttl_seconds=(period + 1) * FORECAST_PERIOD_SECONDS - now
+        )
+        return forecast
 
     @staticmethod
     def _build_weather_result(
@@ -115,9 +301,7 @@ class WeatherRetrievalTool(Tool):
             country=city_info["country"],
             sunrise_today=datetime.fromtimestamp(city_info["sunrise"]),
             sunset_today=datetime.fromtimestamp(city_info["sunset"]),
-            forecast_datetime=datetime.strptime(
-                weather_info["dt_txt"], "%Y-%m-%d %H:%M:%S"
-            ),
+            forecast_datetime=datetime.fromisoformat(weather_info["dt_txt"]),
             temperature_celsius=round(weather_info["main"]["temp"] - 273.15, 1),
             # Kelvin to Celsius conversion
             humidity_pct=weather_info["main"]["humidity"],
@@ -127,26 +311,34 @@ class WeatherRetrievalTool(Tool):
             wind_direction=degrees_to_cardinal(weather_info["wind"]["deg"]),
         )
 
-    def _get_weather(
-        self, lat: float, lon: float, desired_datetime_str: str
-    ) -> _WeatherResult:
-        url = "https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={api_key}"
-        request_url = url.format(lat=str(lat), lon=str(lon), api_key=self.api_key)
-        response = requests.get(request_url)
-        response_json = response.json()
-
-        def to_datetime(datetime_str: str) -> datetime:
-            return datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
-
-        desired_datetime = to_datetime(desired_datetime_str) or CURRENT_DATETIME
-        weather_info, city_info = response_json["list"], response_json["city"]
-        relevant_weather_info = min(
-            weather_info,
-            key=lambda d: abs(
-                desired_datetime - datetime.strptime(d["dt_txt"], "%Y-%m-%d %H:%M:%S")
+    @staticmethod
+    def _build_weather_summary(
+        weather_infos: Sequence[Mapping[str, Any]],
+        city_info: Mapping[str, Any],
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> _WeatherSummary:
+        temperatures = [w["main"]["temp"] - 273.15 for w in weather_infos]
+        precipitation = sum(
+            w.get("rain", {}).get("3h", 0.0) + w.get("snow", {}).get("3h", 0.0)
+            for w in weather_infos
+        )
+        return _WeatherSummary(
+            city=city_info["name"],
+            country=city_info["country"],
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            min_temperature_celsius=round(min(temperatures), 1),
+            max_temperature_celsius=round(max(temperatures), 1),
+            mean_temperature_celsius=round(mean(temperatures), 1),
+            precipitation_mm=round(precipitation, 1),
+            max_wind_speed_km_h=round(
+                max(w["wind"]["speed"] for w in weather_infos) * 3.6, 1
+            ),
+            weather_descriptions=list(
+                dict.fromkeys(w["weather"][0]["description"] for w in weather_infos)
             ),
         )
-        return self._build_weather_result(relevant_weather_info, city_info)
 
     def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
         if not GEOPY_AVAILABLE:
@@ -159,7 +351,43 @@ class WeatherRetrievalTool(Tool):
             results = []
         else:
             lat, lon = coordinates
-            weather_result = self._get_weather(lat, lon, json_query["datetime"])
-            results = [weather_result.to_string()]
+            forecast = self._get_forecast(lat, lon)
+            if isinstance(forecast, str):
+                return self.to_result(
+                    [f"Location: {json_query['location']}\n{forecast}"]
+                )
+            datetime_strs = json_query.get("datetimes") or []
+            period_strs = [
+                d
+                for d in (
+                    json_query.get("start_datetime"),
+                    json_query.get("end_datetime"),
+                )
+                if d
+            ]
+
+            results = [
+                self._build_weather_result(
+                    forecast.get_nearest(_to_datetime(d)), forecast.city_info
+                ).to_string()
+                for d in datetime_strs
+            ]
+            if period_strs:
+                start_datetime = _to_datetime(period_strs[0])
+                end_datetime = _to_datetime(period_strs[-1])
+                results.append(
+                    self._build_weather_summary(
+                        forecast.get_between(start_datetime, end_datetime),
+                        forecast.city_info,
+                        start_datetime,
+                        end_datetime,
+                    ).to_string()
+                )
+            elif not results:
+                results.append(
+                    self._build_weather_result(
+                        forecast.get_nearest(datetime.now()), forecast.city_info
+                    ).to_string()
+                )
 
         return self.to_result(results)
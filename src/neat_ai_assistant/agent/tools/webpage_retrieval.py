@@ -1,18 +1,20 @@
-import re
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Mapping, Optional, Sequence
+from urllib.parse import urlsplit
 
 import requests
-from duckduckgo_search import DDGS  # type: ignore
+from requests.adapters import HTTPAdapter
 
+from ...utils.cancellation import raise_if_cancelled
+from ...utils.html_sections import BS4_AVAILABLE, extract_section_text
+from ...utils.page_cache import CachedPage, PageCache
+from ...utils.tracing import count_event, start_span
+from ...utils.web_search import SearchHit, WebSearchClient, get_shared_search_client
 from ..tool import Tool, ToolParam, ToolResult
 
-try:
-    from bs4 import BeautifulSoup, Tag
-
-    BS4_AVAILABLE = True
-except:
-    BS4_AVAILABLE = False
-
 TOOL_PARAM_N = ToolParam(
     name="n",
     type="integer",
@@ -28,49 +30,138 @@ TOOL_PARAM_QUERY = ToolParam(
 
 
 class WebpageRetrievalTool(Tool):
+    """
+    Searches DuckDuckGo and scrapes the hits concurrently over one pooled HTTP session.
+    Each page is bounded by connect/read timeouts, a total time budget and a byte budget; pages that fail fall back to the search snippet.
+    Downloaded pages and their extracted text are kept in a `PageCache`, so repeated pages cost neither a download nor a parse.
+    Params:
+    - n (int): number of pages
+    - query (str): search query
+    """
+
     def __init__(
         self,
         name: str = "Webpage Retrieval Engine",
         description: str = "Search with a string to retrieve detailed webpages for this query.",
         params: Sequence[ToolParam] = [TOOL_PARAM_N, TOOL_PARAM_QUERY],
+        max_workers: int = 8,
+        max_connections_per_host: int = 2,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 5.0,
+        page_timeout: float = 10.0,
+        max_page_bytes: int = 1_000_000,
+        session: Optional[requests.Session] = None,
+        page_cache: Optional[PageCache] = None,
+        search_client: Optional[WebSearchClient] = None,
     ) -> None:
         super().__init__(name, description, params)
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = (connect_timeout, read_timeout)
+        self.page_timeout = page_timeout
+        self.max_page_bytes = max_page_bytes
+        self.session = session or self._build_session(
+            max_workers, max_connections_per_host
+        )
+        self.page_cache = page_cache or PageCache()
+        self.search_client = search_client or get_shared_search_client()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="webpage-retrieval"
+        )
+        self._host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+        self._host_semaphores_lock = threading.Lock()
 
     @staticmethod
-    def _scrape_body_text(url: str, maximum_length_char: int = 1000) -> Optional[str]:
-        def clean_scraped_text(text: str) -> str:
-            cleaned_text = text.replace("\xa0", " ")
-            html_entities = re.compile(r"&[a-zA-Z]+;")
-            cleaned_text = html_entities.sub(" ", cleaned_text)
-            cleaned_text = re.sub(r"\n+", "\n", cleaned_text)
-            return cleaned_text.strip()
-
-        def cut_text(text: str) -> str:
-            return text[:maximum_length_char] + "..."
-
-        response = requests.get(url)
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        headers: Sequence[Tag] = soup.find_all(["h2", "h3", "h4", "h5", "h6"])
-        if not bool(headers):
+    def _build_session(
+        max_workers: int, max_connections_per_host: int
+    ) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_connections_per_host
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_connections_per_host)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def _fetch_page(
+        self, url: str, cached_page: Optional[CachedPage] = None
+    ) -> Optional[CachedPage]:
+        """
+        Downloads at most `max_page_bytes` of a page, or returns None if it fails or is too slow.
+        With a `cached_page`, the request is conditional and `cached_page` itself is returned if it was not modified.
+        """
+        deadline = time.monotonic() + self.page_timeout
+        headers = cached_page.get_conditional_headers() if cached_page else {}
+        try:
+            with self._get_host_semaphore(url):
+                with self.session.get(
+                    url, stream=True, timeout=self.timeout, headers=headers
+                ) as response:
+                    if cached_page is not None and response.status_code == 304:
+                        return cached_page
+                    if not response.ok:
+                        return None
+                    chunks: list[bytes] = []
+                    received = 0
+                    for chunk in response.iter_content(chunk_size=16_384):
+                        chunks.append(chunk)
+                        received += len(chunk)
+                        if received >= self.max_page_bytes:
+                            break
+                        if time.monotonic() > deadline:
+                            return None
+                    return CachedPage(
+                        url=url,
+                        content=b"".join(chunks)[: self.max_page_bytes],
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                        fetched_at=time.time(),
+                    )
+        except requests.RequestException:
             return None
 
-        sections: list[str] = []
-
-        for header in headers:
-            section_text: list[str] = [header.text]
-            for sibling in header.find_all_next():
-                if isinstance(sibling, Tag):
-                    if sibling.name and sibling.name.startswith("h"):
-                        break
-                    elif sibling.name == "p":
-                        section_text.append(sibling.text)
-
-            if len(section_text) > 1:
-                sections.append("\n".join(section_text))
-        body_text: str = "\n\n".join(sections)
+    @staticmethod
+    def _scrape_body_text(
+        content: bytes | str, maximum_length_char: int = 1000
+    ) -> Optional[str]:
+        return extract_section_text(content, maximum_length_char)
 
-        return cut_text(clean_scraped_text(body_text))
+    def _retrieve_body_text(self, url: Optional[str]) -> Optional[str]:
+        if not url:
+            return None
+        # pages still waiting for a worker are skipped once nobody needs the result
+        raise_if_cancelled()
+        with start_span("webpage.retrieve", url=url) as span:
+            page = self.page_cache.get(url)
+            if page is not None:
+                span.set(cache="hit")
+                count_event("page_cache.hit")
+                return page.body_text
+
+            stale_page = self.page_cache.get_stale(url)
+            page = self._fetch_page(url, stale_page)
+            if page is None:
+                span.set(cache="miss", failed=True)
+                count_event("page_cache.miss")
+                return None
+            if page is stale_page:
+                span.set(cache="revalidated")
+                count_event("page_cache.revalidation")
+                return self.page_cache.refresh(page).body_text
+            span.set(cache="miss", size=len(page.content))
+            count_event("page_cache.miss")
+            with start_span("webpage.scrape", url=url, size=len(page.content)):
+                page.body_text = self._scrape_body_text(page.content)
+            self.page_cache.put(page)
+            return page.body_text
 
     def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
         if not BS4_AVAILABLE:
@@ -81,20 +172,25 @@ class WebpageRetrievalTool(Tool):
         def construct_result_string(title: str, body: str) -> str:
             return "{title}\n\n{body}".format(title=title, body=body)
 
-        prelim_results: list[Mapping[str, str | None]] = []
-        with DDGS(timeout=5) as ddgs:
-            for i, r in enumerate(ddgs.text(json_query["query"])):
-                if i >= json_query["n"]:
-                    break
-                prelim_results.append(r)
+        prelim_results: Sequence[SearchHit] = self.search_client.text(
+            json_query["query"], json_query["n"]
+        )
+
+        # each page gets its own copy of the context, so that its spans land in the current trace
+        context = contextvars.copy_context()
+        long_texts = self._executor.map(
+            lambda url: context.copy().run(self._retrieve_body_text, url),
+            [r.get("href") for r in prelim_results],
+        )
 
         results = []
-        for r in prelim_results:
-            long_text = self._scrape_body_text(r.get("href"))
+        for r, long_text in zip(prelim_results, long_texts):
             if not bool(long_text):
                 long_text = r.get("body")
             results.append(
-                construct_result_string(title=r.get("title", ""), body=long_text or "")
+                construct_result_string(
+                    title=r.get("title") or "", body=long_text or ""
+                )
             )
 
         return self.to_result(results)
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import threading
+import time
+from abc import abstractmethod
+from typing import Any, AsyncIterator, Callable, Mapping, Optional, Sequence, cast
+
+import openai
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+from .response_cache import fingerprint_request
+
+
+class ChatRequest(BaseModel):
+    """Everything sent to the chat completions endpoint, except whether to stream."""
+
+    model: str
+    messages: list[dict[str, Any]]
+    tools: Optional[list[dict[str, Any]]] = None
+    temperature: float = 0.0
+
+    @property
+    def fingerprint(self) -> str:
+        return fingerprint_request(
+            self.model, self.messages, self.tools, self.temperature
+        )
+
+    def to_kwargs(self) -> dict[str, Any]:
+        kwargs: dict[str, Any] = {
+            "model": self.model,
+            "messages": self.messages,
+            "temperature": self.temperature,
+        }
+        if self.tools is not None:
+            kwargs["tools"] = self.tools
+        return kwargs
+
+
+class ChatBackend:
+    """Where `OpenaiWrapper` sends its requests, so that they can be answered without the API."""
+
+    @abstractmethod
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        ...
+
+    @abstractmethod
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        ...
+
+    @abstractmethod
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        ...
+
+
+class OpenaiBackend(ChatBackend):
+    # retries are left to `OpenaiWrapper`, which coordinates them with its rate limiter
+    MAX_CLIENT_RETRIES = 0
+
+    def __init__(self) -> None:
+        self._client: Optional[openai.OpenAI] = None
+        self._async_client: Optional[openai.AsyncOpenAI] = None
+
+    # clients are created lazily, so that constructing the backend does not require credentials
+
+    @property
+    def client(self) -> openai.OpenAI:
+        if self._client is None:
+            self._client = openai.OpenAI(max_retries=self.MAX_CLIENT_RETRIES)
+        return self._client
+
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(max_retries=self.MAX_CLIENT_RETRIES)
+        return self._async_client
+
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        result = self.client.chat.completions.create(**request.to_kwargs())
+        return cast(ChatCompletion, result)
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        result = await self.async_client.chat.completions.create(**request.to_kwargs())
+        return cast(ChatCompletion, result)
+
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        result = await self.async_client.chat.completions.create(
+            **request.to_kwargs(), stream=True
+        )
+        return cast(AsyncIterator[ChatCompletionChunk], result)
+
+
+class ScriptedReply(BaseModel):
+    content: Optional[str] = None
+    # (function name, arguments) pairs
+    tool_calls: Sequence[tuple[str, Mapping[str, Any]]] = ()
+
+    def to_completion(self, completion_id: str, model: str) -> ChatCompletion:
+        return ChatCompletion.model_validate(
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "tool_calls" if self.tool_calls else "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": self.content,
+                            "tool_calls": [
+                                {
+                                    "id": f"call_{i}",
+                                    "type": "function",
+                                    "function": {
+                                        "name": name,
+                                        "arguments": json.dumps(arguments),
+                                    },
+                                }
+                                for i, (name, arguments) in enumerate(self.tool_calls)
+                            ]
+                            or None,
+                        },
+                    }
+                ],
+            }
+        )
+
+    def to_chunks(
+        self, completion_id: str, model: str, chunk_size_chars: int
+    ) -> list[ChatCompletionChunk]:
+        """Splits the reply the way the API streams it: content and arguments in pieces, names once."""
+        deltas: list[dict[str, Any]] = [{"role": "assistant"}]
+        content = self.content or ""
+        for start in range(0, len(content), chunk_size_chars):
+            deltas.append({"content": content[start : start + chunk_size_chars]})
+        for i, (name, arguments) in enumerate(self.tool_calls):
+            deltas.append(
+                {
+                    "tool_calls": [
+                        {
+                            "index": i,
+                            "id": f"call_{i}",
+                            "type": "function",
+                            "function": {"name": name, "arguments": ""},
+                        }
+                    ]
+                }
+            )
+            serialized_arguments = json.dumps(arguments)
+            for start in range(0, len(serialized_arguments), chunk_size_chars):
+                deltas.append(
+                    {
+                        "tool_calls": [
+                            {
+                                "index": i,
+                                "function": {
+                                    "arguments": serialized_arguments[
+                                        start : start + chunk_size_chars
+                                    ]
+                                },
+                            }
+                        ]
+                    }
+                )
+        finish_reason = "tool_calls" if self.tool_calls else "stop"
+        return [
+            ChatCompletionChunk.model_validate(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": delta,
+                            "finish_reason": finish_reason
+                            if i == len(deltas) - 1
+                            else None,
+                        }
+                    ],
+                }
+            )
+            for i, delta in enumerate(deltas)
+        ]
+
+
+class ScriptedBackend(ChatBackend):
+    """
+    Offline stand-in for the API that answers with scripted replies after an artificial latency.
+    `replies` is either a list, played in order and from the start again once exhausted, or a function of the request.
+    Streams wait `latency_seconds` for the first chunk and `chunk_delay_seconds` between chunks.
+    """
+
+    def __init__(
+        self,
+        replies: Sequence[ScriptedReply] | Callable[[ChatRequest], ScriptedReply],
+        latency_seconds: float = 0.0,
+        chunk_delay_seconds: float = 0.0,
+        chunk_size_chars: int = 16,
+    ) -> None:
+        if not callable(replies) and not replies:
+            raise ValueError("At least one scripted reply is required.")
+        self.replies = replies
+        self.latency_seconds = latency_seconds
+        self.chunk_delay_seconds = chunk_delay_seconds
+        self.chunk_size_chars = chunk_size_chars
+        self.requests: list[ChatRequest] = []
+        self._lock = threading.Lock()
+
+    def _next_reply(self, request: ChatRequest) -> tuple[str, ScriptedReply]:
+        with self._lock:
+            n = len(self.requests)
+            self.requests.append(request)
+        completion_id = f"chatcmpl-scripted-{n}"
+        if callable(self.replies):
+            return completion_id, self.replies(request)
+        return completion_id, self.replies[n % len(self.replies)]
+
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        completion_id, reply = self._next_reply(request)
+        time.sleep(self.latency_seconds)
+        return reply.to_completion(completion_id, request.model)
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        completion_id, reply = self._next_reply(request)
+        await asyncio.sleep(self.latency_seconds)
+        return reply.to_completion(completion_id, request.model)
+
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        completion_id, reply = self._next_reply(request)
+        chunks = reply.to_chunks(completion_id, request.model, self.chunk_size_chars)
+        return self._play(chunks)
+
+    async def _play(
+        self, chunks: Sequence[ChatCompletionChunk]
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        await asyncio.sleep(self.latency_seconds)
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                await asyncio.sleep(self.chunk_delay_seconds)
+            yield chunk
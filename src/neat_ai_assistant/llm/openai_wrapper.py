@@ -1,13 +1,35 @@
+import asyncio
+import json
+import random
 import time
 from enum import Enum
-from functools import wraps
-from typing import Any, Callable, Generator, Literal, Mapping, Sequence, TypeVar, cast
+from functools import lru_cache, wraps
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Generator,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+)
 
 import openai
 import tiktoken
-from openai.types.chat import ChatCompletion
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from pydantic import BaseModel
 
+from ..utils.cancellation import raise_if_cancelled
+from ..utils.tracing import SpanRecorder, count_event, start_span
+from .backends import ChatBackend, ChatRequest, OpenaiBackend
+from .rate_limiter import RateLimiter
+from .response_cache import ChatCompletionCache
+from .streaming import ChatCompletionStreamAccumulator, completion_to_chunks
+
 
 class Model(Enum):
     GPT_3_5 = "gpt-3.5-turbo-1106"
@@ -21,78 +43,469 @@ class Message(BaseModel):
 
 T = TypeVar("T")
 
+# every message follows <im_start>{role/name}\n{content}<im_end>\n
+TOKENS_PER_MESSAGE = 4
+# every reply is primed with <im_start>assistant
+TOKENS_PER_REPLY = 2
+
+RETRYABLE_EXCEPTIONS: tuple[Type[BaseException], ...] = (
+    TimeoutError,
+    # includes timeouts
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+# how long to hold off all requests after a rate limit error without a hint
+DEFAULT_RATE_LIMIT_PAUSE_SECONDS = 1.0
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: Model) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model.value)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _full_jitter_backoff(
+    base_delay: float, factor: float, max_delay: float
+) -> Generator[float, None, None]:
+    # a random delay up to the exponential one spreads out callers that failed together
+    delay = base_delay
+    while True:
+        yield random.uniform(0, delay)
+        delay = min(delay * factor, max_delay)
+
+
+def _get_retry_after(exception: BaseException) -> Optional[float]:
+    """Returns the delay the API asked for in its response headers, if any."""
+    if not isinstance(exception, openai.APIStatusError):
+        return None
+    headers = exception.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1_000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _get_retry_delay(exception: BaseException, backoff_delay: float) -> float:
+    retry_after = _get_retry_after(exception)
+    return backoff_delay if retry_after is None else max(retry_after, backoff_delay)
+
+
+def _get_usage(completion: ChatCompletion) -> dict[str, int]:
+    if completion.usage is None:
+        return {}
+    return {
+        "prompt_tokens": completion.usage.prompt_tokens,
+        "completion_tokens": completion.usage.completion_tokens,
+    }
+
+
+async def _replay_chunks(
+    chunks: Sequence[ChatCompletionChunk],
+) -> AsyncIterator[ChatCompletionChunk]:
+    for chunk in chunks:
+        yield chunk
+
 
 class OpenaiWrapper:
+    """
+    Chat completions with retries and token counting, sent to the OpenAI API unless another `backend` is given.
+    With a `response_cache`, identical requests are answered from the cache instead of the backend, streamed ones included.
+    Requests to the OpenAI backend are throttled by the process-wide `RateLimiter.shared()` unless another
+    `rate_limiter` is given; other backends are only throttled by an explicit one.
+    """
+
+    def __init__(
+        self,
+        response_cache: Optional[ChatCompletionCache] = None,
+        backend: Optional[ChatBackend] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        self.response_cache = response_cache
+        self.backend = backend or OpenaiBackend()
+        if rate_limiter is None and isinstance(self.backend, OpenaiBackend):
+            rate_limiter = RateLimiter.shared()
+        self.rate_limiter = rate_limiter
+
     @staticmethod
     def retry_with_backoff(
         max_retries: int = 5,
         base_delay: float = 0.25,
         factor: float = 4,
         max_delay: float = 30,
+        retry_on: tuple[Type[BaseException], ...] = RETRYABLE_EXCEPTIONS,
     ) -> Callable[[Callable[..., T]], Callable[..., T],]:
+        """Retries `retry_on` errors with full jitter backoff, waiting at least as long as the API asks for."""
+
         def decorator(func: Callable[..., T]) -> Callable[..., T]:
             @wraps(func)
             def wrapper(*args: tuple[T, ...], **kwargs: Mapping[str, T]) -> T:
-                def exponential_backoff() -> Generator[float, None, None]:
-                    delay = base_delay
-                    while True:
-                        yield delay
-                        delay = min(delay * factor, max_delay)
+                retry_delays = _full_jitter_backoff(base_delay, factor, max_delay)
 
-                retry_delays = exponential_backoff()
-
-                for _ in range(max_retries):
+                for attempt in range(max_retries):
                     try:
                         return func(*args, **kwargs)
-                    except TimeoutError as e:
-                        time.sleep(next(retry_delays))
-                raise TimeoutError(
-                    f"Function {func.__name__} failed after {max_retries} retries"
-                )
+                    except retry_on as e:
+                        if attempt == max_retries - 1:
+                            raise
+                        count_event("llm.retry")
+                        time.sleep(_get_retry_delay(e, next(retry_delays)))
+                raise AssertionError("unreachable")
 
             return wrapper
 
         return decorator
 
-    @retry_with_backoff()
+    @staticmethod
+    def async_retry_with_backoff(
+        max_retries: int = 5,
+        base_delay: float = 0.25,
+        factor: float = 4,
+        max_delay: float = 30,
+        retry_on: tuple[Type[BaseException], ...] = RETRYABLE_EXCEPTIONS,
+    ) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]],]:
+        def decorator(func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+            @wraps(func)
+            async def wrapper(*args: tuple[T, ...], **kwargs: Mapping[str, T]) -> T:
+                retry_delays = _full_jitter_backoff(base_delay, factor, max_delay)
+
+                for attempt in range(max_retries):
+                    try:
+                        return await func(*args, **kwargs)
+                    except retry_on as e:
+                        if attempt == max_retries - 1:
+                            raise
+                        count_event("llm.retry")
+                        await asyncio.sleep(_get_retry_delay(e, next(retry_delays)))
+                raise AssertionError("unreachable")
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _build_request(
+        messages: Sequence[Message],
+        model: Model,
+        tools: Optional[Sequence[Mapping[str, Any]]],
+        temperature: float,
+    ) -> ChatRequest:
+        return ChatRequest(
+            model=model.value,
+            messages=[m.model_dump() for m in messages],
+            # the API rejects an empty list of tools
+            tools=[dict(t) for t in tools] if tools else None,
+            temperature=temperature,
+        )
+
+    def _get_fingerprint(self, request: ChatRequest) -> Optional[str]:
+        """Returns the cache key of the request, or None if it must not be cached."""
+        if self.response_cache is None or not self.response_cache.is_cacheable(
+            request.temperature
+        ):
+            return None
+        return request.fingerprint
+
+    def _get_cached(self, fingerprint: Optional[str]) -> Optional[ChatCompletion]:
+        if fingerprint is None or self.response_cache is None:
+            return None
+        return self.response_cache.get(fingerprint)
+
+    def _cache(self, fingerprint: Optional[str], completion: ChatCompletion) -> None:
+        if fingerprint is not None and self.response_cache is not None:
+            self.response_cache.put(fingerprint, completion)
+
     def chat_complete_with_tools(
         self,
         messages: Sequence[Message],
         model: Model,
         tools: Sequence[Mapping[str, Any]],
         temperature: float = 0.0,
+        estimated_tokens: Optional[int] = None,
     ) -> ChatCompletion:
-        result = openai.chat.completions.create(  # type: ignore
-            messages=[m.model_dump() for m in messages],
-            model=model.value,
-            temperature=temperature,
-            tools=tools,  # this for some reason causes mypy issues
+        """`estimated_tokens` of the prompt are counted for the rate limiter unless given."""
+        request = self._build_request(messages, model, tools, temperature)
+        return self._complete(
+            request, self._estimate_tokens(messages, model, tools, estimated_tokens)
         )
-        return cast(ChatCompletion, result)
 
-    @retry_with_backoff()
     def chat_complete(
-        self, messages: Sequence[Message], model: Model, temperature: float = 0
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        temperature: float = 0,
+        estimated_tokens: Optional[int] = None,
     ) -> ChatCompletion:
-        return openai.chat.completions.create(
-            messages=[m.model_dump() for m in messages],  # type: ignore
-            model=model.value,
-            temperature=temperature,
+        request = self._build_request(messages, model, None, temperature)
+        return self._complete(
+            request, self._estimate_tokens(messages, model, None, estimated_tokens)
+        )
+
+    async def achat_complete_with_tools(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        tools: Sequence[Mapping[str, Any]],
+        temperature: float = 0.0,
+        estimated_tokens: Optional[int] = None,
+    ) -> ChatCompletion:
+        request = self._build_request(messages, model, tools, temperature)
+        return await self._acomplete(
+            request, self._estimate_tokens(messages, model, tools, estimated_tokens)
+        )
+
+    async def astream_chat_complete_with_tools(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        tools: Sequence[Mapping[str, Any]],
+        temperature: float = 0.0,
+        estimated_tokens: Optional[int] = None,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        request = self._build_request(messages, model, tools, temperature)
+        span = start_span("llm.chat_completion", model=request.model, stream=True)
+        # streams come without usage; the caller's estimate spares tokenizing the prompt again for the span
+        prompt_tokens = estimated_tokens
+        try:
+            fingerprint = self._get_fingerprint(request)
+            cached_completion = self._get_cached(fingerprint)
+            if cached_completion is not None:
+                span.set(cache_hit=True)
+                chunks = _replay_chunks(completion_to_chunks(cached_completion))
+                fingerprint = None
+                estimated_tokens = None
+            else:
+                span.set(cache_hit=False)
+                estimated_tokens = self._estimate_tokens(
+                    messages, model, tools, estimated_tokens
+                )
+                chunks = await self._astream(request, estimated_tokens)
+        except BaseException as e:
+            span.finish(e)
+            raise
+        if fingerprint is None and not span.enabled and estimated_tokens is None:
+            return chunks
+        return self._record_chunks(
+            chunks, fingerprint, span, messages, model, estimated_tokens, prompt_tokens
+        )
+
+    async def achat_complete(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        temperature: float = 0,
+        estimated_tokens: Optional[int] = None,
+    ) -> ChatCompletion:
+        request = self._build_request(messages, model, None, temperature)
+        return await self._acomplete(
+            request, self._estimate_tokens(messages, model, None, estimated_tokens)
+        )
+
+    def _estimate_tokens(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        tools: Optional[Sequence[Mapping[str, Any]]],
+        estimated_tokens: Optional[int],
+    ) -> Optional[int]:
+        """Returns the prompt tokens to reserve, or None without a rate limiter."""
+        if self.rate_limiter is None:
+            return None
+        if estimated_tokens is not None:
+            return estimated_tokens
+        tool_tokens = self.count_tokens(json.dumps(tools), model) if tools else 0
+        return self.open_ai_count_tokens(messages, model) + tool_tokens
+
+    def _complete(
+        self, request: ChatRequest, estimated_tokens: Optional[int]
+    ) -> ChatCompletion:
+        with start_span(
+            "llm.chat_completion", model=request.model, stream=False
+        ) as span:
+            fingerprint = self._get_fingerprint(request)
+            cached_completion = self._get_cached(fingerprint)
+            if cached_completion is not None:
+                span.set(cache_hit=True, **_get_usage(cached_completion))
+                return cached_completion
+            completion = self._complete_with_retries(request, estimated_tokens)
+            self._cache(fingerprint, completion)
+            self._settle(request, estimated_tokens, completion)
+            span.set(cache_hit=False, **_get_usage(completion))
+            return completion
+
+    async def _acomplete(
+        self, request: ChatRequest, estimated_tokens: Optional[int]
+    ) -> ChatCompletion:
+        with start_span(
+            "llm.chat_completion", model=request.model, stream=False
+        ) as span:
+            fingerprint = self._get_fingerprint(request)
+            cached_completion = self._get_cached(fingerprint)
+            if cached_completion is not None:
+                span.set(cache_hit=True, **_get_usage(cached_completion))
+                return cached_completion
+            completion = await self._acomplete_with_retries(request, estimated_tokens)
+            self._cache(fingerprint, completion)
+            self._settle(request, estimated_tokens, completion)
+            span.set(cache_hit=False, **_get_usage(completion))
+            return completion
+
+    async def _record_chunks(
+        self,
+        chunks: AsyncIterator[ChatCompletionChunk],
+        fingerprint: Optional[str],
+        span: SpanRecorder,
+        messages: Sequence[Message],
+        model: Model,
+        estimated_tokens: Optional[int],
+        prompt_tokens: Optional[int],
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        """
+        Passes the chunks through, then caches the completion and finishes its span once the stream has ended.
+        The prompt is only tokenized for the span if `prompt_tokens` is not given.
+        """
+        accumulator = ChatCompletionStreamAccumulator()
+        try:
+            async for chunk in chunks:
+                accumulator.add(chunk)
+                yield chunk
+        except BaseException as e:
+            # only what was streamed before the abort stays taken from the token budget
+            if estimated_tokens is not None and self.rate_limiter is not None:
+                self.rate_limiter.settle(
+                    model.value,
+                    estimated_tokens,
+                    self._count_completion_tokens(accumulator, model),
+                )
+            span.finish(e)
+            raise
+        completion = accumulator.to_completion()
+        if completion is not None:
+            self._cache(fingerprint, completion)
+        if span.enabled or estimated_tokens is not None:
+            # streams come without usage, so the tokens are counted here
+            completion_tokens = self._count_completion_tokens(accumulator, model)
+            if estimated_tokens is not None and self.rate_limiter is not None:
+                self.rate_limiter.settle(
+                    model.value, estimated_tokens, estimated_tokens + completion_tokens
+                )
+            if span.enabled:
+                span.set(
+                    prompt_tokens=prompt_tokens
+                    if prompt_tokens is not None
+                    else self.open_ai_count_tokens(messages, model),
+                    completion_tokens=completion_tokens,
+                )
+        span.finish()
+
+    def _count_completion_tokens(
+        self, accumulator: ChatCompletionStreamAccumulator, model: Model
+    ) -> int:
+        message = accumulator.to_message()
+        completion_text = (message.content or "") + "".join(
+            t.function.arguments for t in message.tool_calls or []
+        )
+        return self.count_tokens(completion_text, model)
+
+    def _settle(
+        self,
+        request: ChatRequest,
+        estimated_tokens: Optional[int],
+        completion: ChatCompletion,
+    ) -> None:
+        if (
+            self.rate_limiter is not None
+            and estimated_tokens is not None
+            and completion.usage is not None
+        ):
+            self.rate_limiter.settle(
+                request.model, estimated_tokens, completion.usage.total_tokens
+            )
+
+    def _release(self, request: ChatRequest, estimated_tokens: Optional[int]) -> None:
+        """Gives back the reservation of a failed attempt, so that its retry is not charged twice."""
+        if self.rate_limiter is not None and estimated_tokens is not None:
+            self.rate_limiter.release(request.model, estimated_tokens)
+
+    def _on_rate_limited(self, request: ChatRequest, e: openai.RateLimitError) -> None:
+        if self.rate_limiter is not None:
+            retry_after = _get_retry_after(e)
+            self.rate_limiter.pause(
+                request.model,
+                DEFAULT_RATE_LIMIT_PAUSE_SECONDS
+                if retry_after is None
+                else retry_after,
+            )
+        count_event("llm.rate_limited")
+
+    # every attempt goes through the rate limiter, retries included, unless the reply was cancelled;
+    # attempts that fail release their reservation
+
+    @retry_with_backoff()
+    def _complete_with_retries(
+        self, request: ChatRequest, estimated_tokens: Optional[int]
+    ) -> ChatCompletion:
+        raise_if_cancelled()
+        if self.rate_limiter is not None and estimated_tokens is not None:
+            self.rate_limiter.acquire(request.model, estimated_tokens)
+        try:
+            return self.backend.complete(request)
+        except BaseException as e:
+            self._release(request, estimated_tokens)
+            if isinstance(e, openai.RateLimitError):
+                self._on_rate_limited(request, e)
+            raise
+
+    @async_retry_with_backoff()
+    async def _acomplete_with_retries(
+        self, request: ChatRequest, estimated_tokens: Optional[int]
+    ) -> ChatCompletion:
+        raise_if_cancelled()
+        if self.rate_limiter is not None and estimated_tokens is not None:
+            await self.rate_limiter.aacquire(request.model, estimated_tokens)
+        try:
+            return await self.backend.acomplete(request)
+        except BaseException as e:
+            self._release(request, estimated_tokens)
+            if isinstance(e, openai.RateLimitError):
+                self._on_rate_limited(request, e)
+            raise
+
+    @async_retry_with_backoff()
+    async def _astream(
+        self, request: ChatRequest, estimated_tokens: Optional[int]
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        raise_if_cancelled()
+        if self.rate_limiter is not None and estimated_tokens is not None:
+            await self.rate_limiter.aacquire(request.model, estimated_tokens)
+        try:
+            return await self.backend.astream(request)
+        except BaseException as e:
+            self._release(request, estimated_tokens)
+            if isinstance(e, openai.RateLimitError):
+                self._on_rate_limited(request, e)
+            raise
+
+    def count_tokens(self, text: str, model: Model) -> int:
+        return len(_get_encoding(model).encode(text))
+
+    def count_message_tokens(self, message: Message, model: Model) -> int:
+        """Returns the number of tokens a single message adds to a prompt."""
+        return (
+            TOKENS_PER_MESSAGE
+            + self.count_tokens(message.role, model)
+            + self.count_tokens(message.content, model)
         )
 
     def open_ai_count_tokens(self, messages: Sequence[Message], model: Model) -> int:
         """Returns the number of tokens used by a list of messages."""
-        try:
-            encoding = tiktoken.encoding_for_model(model.value)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = 0
-        for message_obj in messages:
-            # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            num_tokens += 4
-            for key, value in message_obj.model_dump().items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-        num_tokens += 2  # every reply is primed with <im_start>assistant
-        return num_tokens
+        return (
+            sum(self.count_message_tokens(m, model) for m in messages)
+            + TOKENS_PER_REPLY
+        )
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Mapping, Optional
+
+from pydantic import BaseModel
+
+from ..utils.rate_limit import TokenBucket
+from ..utils.tracing import count_event, start_span
+
+
+class RateLimits(BaseModel):
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# the limits of usage tier 1; raise them to the limits of your organization
+DEFAULT_RATE_LIMITS: Mapping[str, RateLimits] = {
+    "gpt-3.5-turbo-1106": RateLimits(
+        requests_per_minute=3_500, tokens_per_minute=60_000
+    ),
+    "gpt-4-1106-preview": RateLimits(
+        requests_per_minute=500, tokens_per_minute=150_000
+    ),
+}
+
+
+class RateLimiterStats(BaseModel):
+    requests: int = 0
+    throttled_requests: int = 0
+    throttled_seconds: float = 0.0
+    rate_limit_errors: int = 0
+
+
+class _ModelBuckets:
+    def __init__(self, limits: RateLimits, clock: Callable[[], float]) -> None:
+        self.requests = TokenBucket(
+            rate=limits.requests_per_minute / 60,
+            capacity=limits.requests_per_minute,
+            clock=clock,
+        )
+        self.tokens = TokenBucket(
+            rate=limits.tokens_per_minute / 60,
+            capacity=limits.tokens_per_minute,
+            clock=clock,
+        )
+        self.paused_until = 0.0
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets per model, meant to be shared by all wrappers of a process.
+    Each request reserves one request and its estimated tokens and then waits for them, so that callers queue
+    in arrival order instead of running into rate limit errors. After a rate limit error, `pause` holds off all
+    requests to the model, so that they do not hit the API again in lockstep. Models without limits are not throttled.
+    """
+
+    _shared: Optional["RateLimiter"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        limits: Mapping[str, RateLimits] = DEFAULT_RATE_LIMITS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self._buckets = {
+            model: _ModelBuckets(model_limits, clock)
+            for model, model_limits in limits.items()
+        }
+        self._stats = RateLimiterStats()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "RateLimiter":
+        """The process-wide limiter with the default limits."""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def stats(self) -> RateLimiterStats:
+        with self._lock:
+            return self._stats.model_copy()
+
+    def reserve(self, model: str, tokens: int) -> float:
+        """Takes a request and `tokens` of `model` and returns how many seconds to wait before sending it."""
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            wait_seconds = 0.0
+        else:
+            tokens = _fit_tokens(buckets, tokens)
+            wait_seconds = max(
+                buckets.requests.reserve(1),
+                buckets.tokens.reserve(tokens),
+                buckets.paused_until - self.clock(),
+            )
+        with self._lock:
+            self._stats.requests += 1
+            if wait_seconds > 0:
+                self._stats.throttled_requests += 1
+                self._stats.throttled_seconds += wait_seconds
+        return wait_seconds
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Blocks until the request may be sent and returns the time waited."""
+        wait_seconds = self.reserve(model, tokens)
+        if wait_seconds > 0:
+            with start_span("llm.throttle", model=model, tokens=tokens):
+                count_event("llm.throttled")
+                time.sleep(wait_seconds)
+        return wait_seconds
+
+    async def aacquire(self, model: str, tokens: int) -> float:
+        """Waits until the request may be sent, giving its reservation back if the wait is cancelled."""
+        wait_seconds = self.reserve(model, tokens)
+        if wait_seconds > 0:
+            with start_span("llm.throttle", model=model, tokens=tokens):
+                count_event("llm.throttled")
+                try:
+                    await asyncio.sleep(wait_seconds)
+                except asyncio.CancelledError:
+                    self.release(model, tokens)
+                    raise
+        return wait_seconds
+
+    def release(self, model: str, tokens: int) -> None:
+        """Gives back the request and the tokens of a reservation that will not be sent."""
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            return
+        buckets.requests.release(1)
+        buckets.tokens.release(_fit_tokens(buckets, tokens))
+
+    def settle(self, model: str, estimated_tokens: int, used_tokens: int) -> None:
+        """Corrects the tokens reserved for a request once its actual usage is known."""
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            return
+        if used_tokens > estimated_tokens:
+            buckets.tokens.reserve(used_tokens - estimated_tokens)
+        else:
+            buckets.tokens.release(estimated_tokens - used_tokens)
+
+    def pause(self, model: str, seconds: float) -> None:
+        """Holds off all requests to `model` for `seconds`, after the API reported that a limit was hit."""
+        with self._lock:
+            self._stats.rate_limit_errors += 1
+        buckets = self._buckets.get(model)
+        if buckets is not None:
+            buckets.paused_until = max(buckets.paused_until, self.clock() + seconds)
+
+
+def _fit_tokens(buckets: _ModelBuckets, tokens: int) -> int:
+    # a request larger than the bucket would never fit, it waits for a full bucket instead
+    return min(tokens, int(buckets.tokens.capacity))
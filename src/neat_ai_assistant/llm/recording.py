@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import AsyncIterator, Optional, Sequence
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pydantic import BaseModel
+
+from ..utils.tracing import count_event
+from .backends import ChatBackend, ChatRequest
+from .streaming import ChatCompletionStreamAccumulator, completion_to_chunks
+
+
+class RecordedExchange(BaseModel):
+    fingerprint: str
+    request: ChatRequest
+    # seconds from sending the request to receiving the completion or the last chunk
+    latency_seconds: float
+    completion: Optional[ChatCompletion] = None
+    chunks: list[ChatCompletionChunk] = []
+    # seconds from sending the request to receiving each chunk
+    chunk_offsets: list[float] = []
+
+    def get_completion(self) -> ChatCompletion:
+        if self.completion is not None:
+            return self.completion
+        accumulator = ChatCompletionStreamAccumulator()
+        for chunk in self.chunks:
+            accumulator.add(chunk)
+        completion = accumulator.to_completion()
+        if completion is None:
+            raise ValueError(f"The recorded stream {self.fingerprint} is incomplete.")
+        return completion
+
+    def get_chunks(self) -> tuple[Sequence[ChatCompletionChunk], Sequence[float]]:
+        if self.chunks:
+            return self.chunks, self.chunk_offsets
+        return completion_to_chunks(self.get_completion()), [self.latency_seconds]
+
+
+class MissingRecordingError(LookupError):
+    pass
+
+
+class RecordingBackend(ChatBackend):
+    """
+    Passes requests on to `backend` and appends every exchange, with its timings, to a JSON lines file.
+    Streams are written once they have finished.
+    """
+
+    def __init__(self, backend: ChatBackend, path: str | Path) -> None:
+        self.backend = backend
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        started_at = time.perf_counter()
+        completion = self.backend.complete(request)
+        self._write(request, time.perf_counter() - started_at, completion=completion)
+        return completion
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        started_at = time.perf_counter()
+        completion = await self.backend.acomplete(request)
+        self._write(request, time.perf_counter() - started_at, completion=completion)
+        return completion
+
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        started_at = time.perf_counter()
+        chunks = await self.backend.astream(request)
+        return self._record_chunks(request, started_at, chunks)
+
+    async def _record_chunks(
+        self,
+        request: ChatRequest,
+        started_at: float,
+        chunks: AsyncIterator[ChatCompletionChunk],
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        recorded_chunks: list[ChatCompletionChunk] = []
+        chunk_offsets: list[float] = []
+        async for chunk in chunks:
+            chunk_offsets.append(time.perf_counter() - started_at)
+            recorded_chunks.append(chunk)
+            yield chunk
+        self._write(
+            request,
+            time.perf_counter() - started_at,
+            chunks=recorded_chunks,
+            chunk_offsets=chunk_offsets,
+        )
+
+    def _write(
+        self,
+        request: ChatRequest,
+        latency_seconds: float,
+        completion: Optional[ChatCompletion] = None,
+        chunks: Sequence[ChatCompletionChunk] = (),
+        chunk_offsets: Sequence[float] = (),
+    ) -> None:
+        exchange = RecordedExchange(
+            fingerprint=request.fingerprint,
+            request=request,
+            latency_seconds=latency_seconds,
+            completion=completion,
+            chunks=list(chunks),
+            chunk_offsets=list(chunk_offsets),
+        )
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(exchange.model_dump_json() + "\n")
+
+
+class ReplayBackend(ChatBackend):
+    """
+    Answers requests from a file written by `RecordingBackend`, with the recorded timings scaled by `time_scale`.
+    Repeated requests get the recorded answers in order, and the last one once they run out.
+    A request that was never recorded raises `MissingRecordingError`. Prompts rarely repeat exactly when live tools
+    paste their results into them, so unless `strict` is set, such a request gets the earliest exchange to its model
+    that has not been replayed yet instead; `fallback_hits` counts these.
+    """
+
+    def __init__(
+        self, path: str | Path, time_scale: float = 1.0, strict: bool = True
+    ) -> None:
+        self.time_scale = time_scale
+        self.strict = strict
+        self.fallback_hits = 0
+        self._exchanges: dict[str, list[RecordedExchange]] = defaultdict(list)
+        self._n_replayed: dict[str, int] = defaultdict(int)
+        # in recorded order, for the fallback
+        self._unreplayed_by_model: dict[str, list[RecordedExchange]] = defaultdict(list)
+        self._lock = threading.Lock()
+        with Path(path).open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    exchange = RecordedExchange.model_validate_json(line)
+                    self._exchanges[exchange.fingerprint].append(exchange)
+                    self._unreplayed_by_model[exchange.request.model].append(exchange)
+
+    def _next_exchange(self, request: ChatRequest) -> RecordedExchange:
+        fingerprint = request.fingerprint
+        with self._lock:
+            unreplayed = self._unreplayed_by_model[request.model]
+            exchanges = self._exchanges.get(fingerprint)
+            if exchanges:
+                n = self._n_replayed[fingerprint]
+                self._n_replayed[fingerprint] += 1
+                exchange = exchanges[min(n, len(exchanges) - 1)]
+                index = next(
+                    (i for i, e in enumerate(unreplayed) if e is exchange), None
+                )
+                if index is not None:
+                    del unreplayed[index]
+                return exchange
+            if self.strict or not unreplayed:
+                raise MissingRecordingError(
+                    f"No recorded exchange for the request {fingerprint}."
+                )
+            self.fallback_hits += 1
+            count_event("replay.fallback")
+            return unreplayed.pop(0)
+
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        exchange = self._next_exchange(request)
+        time.sleep(exchange.latency_seconds * self.time_scale)
+        return exchange.get_completion()
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        exchange = self._next_exchange(request)
+        await asyncio.sleep(exchange.latency_seconds * self.time_scale)
+        return exchange.get_completion()
+
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        chunks, chunk_offsets = self._next_exchange(request).get_chunks()
+        return self._play(chunks, chunk_offsets)
+
+    async def _play(
+        self, chunks: Sequence[ChatCompletionChunk], chunk_offsets: Sequence[float]
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        started_at = time.perf_counter()
+        for chunk, offset in zip(chunks, chunk_offsets):
+            delay = offset * self.time_scale - (time.perf_counter() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+from typing import Any, Mapping, Optional, Sequence
+
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel
+
+from ..utils.cache import CacheStats, LRUCache, SQLiteCache
+
+# bump when the fingerprint or the stored format changes, so old entries are never replayed
+FINGERPRINT_VERSION = 1
+
+
+def fingerprint_request(
+    model: str,
+    messages: Sequence[Mapping[str, Any]],
+    tools: Optional[Sequence[Mapping[str, Any]]],
+    temperature: float,
+) -> str:
+    """A stable hash of everything that determines a chat completion."""
+    request = {
+        "version": FINGERPRINT_VERSION,
+        "model": model,
+        "messages": messages,
+        "tools": tools,
+        "temperature": temperature,
+    }
+    canonical_json = json.dumps(
+        request, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical_json.encode("utf-8")).hexdigest()
+
+
+class _CachedCompletion:
+    def __init__(self, completion: ChatCompletion, json_data: str) -> None:
+        self.completion = completion
+        self.size = len(json_data)
+
+
+class ResponseCacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    memory: CacheStats
+    disk: Optional[CacheStats] = None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ChatCompletionCache:
+    """
+    Chat completions keyed by `fingerprint_request`, in a size-bounded in-memory LRU and, optionally, a `SQLiteCache`.
+    Completions are stored as their full JSON, so a replayed completion is indistinguishable from the original.
+    Only requests with a temperature of at most `max_temperature` are cached, since sampled replies are not meant to repeat.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = 24 * 60 * 60,
+        max_memory_entries: Optional[int] = 1_000,
+        max_memory_bytes: Optional[int] = 50_000_000,
+        disk_cache: Optional[SQLiteCache] = None,
+        max_temperature: float = 0.0,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.disk_cache = disk_cache
+        self.max_temperature = max_temperature
+        self.memory_cache: LRUCache[str, _CachedCompletion] = LRUCache(
+            max_entries=max_memory_entries,
+            max_bytes=max_memory_bytes,
+            ttl_seconds=ttl_seconds,
+            sizeof=lambda cached: cached.size,
+        )
+        self._stats = ResponseCacheStats(memory=self.memory_cache.stats)
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> ResponseCacheStats:
+        with self._lock:
+            return self._stats.model_copy(
+                update={
+                    "memory": self.memory_cache.stats,
+                    "disk": self.disk_cache.stats if self.disk_cache else None,
+                }
+            )
+
+    def is_cacheable(self, temperature: float) -> bool:
+        return temperature <= self.max_temperature
+
+    def get(self, fingerprint: str) -> Optional[ChatCompletion]:
+        completion = self._get(fingerprint)
+        with self._lock:
+            if completion is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return completion
+
+    def put(self, fingerprint: str, completion: ChatCompletion) -> None:
+        json_data = completion.model_dump_json()
+        self.memory_cache.set(
+            fingerprint, _CachedCompletion(completion.model_copy(deep=True), json_data)
+        )
+        if self.disk_cache is not None:
+            self.disk_cache.set(
+                fingerprint, json_data.encode("utf-8"), ttl_seconds=self.ttl_seconds
+            )
+
+    def _get(self, fingerprint: str) -> Optional[ChatCompletion]:
+        cached = self.memory_cache.get(fingerprint)
+        if cached is not None:
+            # callers get their own copy, so they cannot alter what is replayed next
+            return cached.completion.model_copy(deep=True)
+        if self.disk_cache is None:
+            return None
+        data = self.disk_cache.get(fingerprint)
+        if data is None:
+            return None
+        json_data = data.decode("utf-8")
+        completion = ChatCompletion.model_validate_json(json_data)
+        self.memory_cache.set(
+            fingerprint, _CachedCompletion(completion.model_copy(deep=True), json_data)
+        )
+        return completion
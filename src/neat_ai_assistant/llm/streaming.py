@@ -0,0 +1,139 @@
+from typing import Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from openai.types.chat.chat_completion_chunk import (
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+)
+from openai.types.chat.chat_completion_message import ChatCompletionMessage
+from openai.types.chat.chat_completion_message_tool_call import (
+    ChatCompletionMessageToolCall,
+    Function,
+)
+
+
+class _ToolCallDelta:
+    def __init__(self) -> None:
+        self.id = ""
+        self.name = ""
+        self.arguments = ""
+
+
+class ChatCompletionStreamAccumulator:
+    """
+    Reassembles the first choice of a streamed chat completion.
+    Tool calls arrive as fragments keyed by their index: the id and name come once, the arguments in pieces.
+    """
+
+    def __init__(self) -> None:
+        self._content_parts: list[str] = []
+        self._tool_calls: dict[int, _ToolCallDelta] = {}
+        self._last_chunk: Optional[ChatCompletionChunk] = None
+        self.finish_reason: Optional[str] = None
+
+    @property
+    def has_tool_calls(self) -> bool:
+        return bool(self._tool_calls)
+
+    def add(self, chunk: ChatCompletionChunk) -> Optional[str]:
+        """Adds a chunk and returns its content delta, if any."""
+        content_delta: Optional[str] = None
+        self._last_chunk = chunk
+        for choice in chunk.choices:
+            if choice.index != 0:
+                continue
+            if choice.finish_reason is not None:
+                self.finish_reason = choice.finish_reason
+            delta = choice.delta
+            if delta.content:
+                content_delta = delta.content
+                self._content_parts.append(delta.content)
+            for tool_call in delta.tool_calls or []:
+                tool_call_delta = self._tool_calls.setdefault(
+                    tool_call.index, _ToolCallDelta()
+                )
+                if tool_call.id:
+                    tool_call_delta.id = tool_call.id
+                if tool_call.function is not None:
+                    tool_call_delta.name += tool_call.function.name or ""
+                    tool_call_delta.arguments += tool_call.function.arguments or ""
+        return content_delta
+
+    def to_message(self) -> ChatCompletionMessage:
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(self._content_parts) if self._content_parts else None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=tool_call.id,
+                    type="function",
+                    function=Function(
+                        name=tool_call.name, arguments=tool_call.arguments
+                    ),
+                )
+                for _, tool_call in sorted(self._tool_calls.items())
+            ]
+            or None,
+        )
+
+    def to_completion(self) -> Optional[ChatCompletion]:
+        """Returns the completion the stream amounts to, or None if it did not finish."""
+        if self._last_chunk is None or self.finish_reason is None:
+            return None
+        return ChatCompletion.model_validate(
+            {
+                "id": self._last_chunk.id,
+                "object": "chat.completion",
+                "created": self._last_chunk.created,
+                "model": self._last_chunk.model,
+                "system_fingerprint": self._last_chunk.system_fingerprint,
+                "choices": [
+                    Choice(
+                        index=0,
+                        message=self.to_message(),
+                        finish_reason=self.finish_reason,  # type: ignore
+                    )
+                ],
+            }
+        )
+
+
+def completion_to_chunks(completion: ChatCompletion) -> list[ChatCompletionChunk]:
+    """Replays a completion as a stream: one chunk carrying each choice whole."""
+    return [
+        ChatCompletionChunk(
+            id=completion.id,
+            object="chat.completion.chunk",
+            created=completion.created,
+            model=completion.model,
+            system_fingerprint=completion.system_fingerprint,
+            choices=[
+                ChunkChoice(
+                    index=choice.index,
+                    finish_reason=choice.finish_reason,
+                    delta=ChoiceDelta(
+                        role=choice.message.role,
+                        content=choice.message.content,
+                        tool_calls=[
+                            ChoiceDeltaToolCall(
+                                index=i,
+                                id=tool_call.id,
+                                type=tool_call.type,
+                                function=ChoiceDeltaToolCallFunction(
+                                    name=tool_call.function.name,
+                                    arguments=tool_call.function.arguments,
+                                ),
+                            )
+                            for i, tool_call in enumerate(choice.message.tool_calls)
+                        ]
+                        if choice.message.tool_calls
+                        else None,
+                    ),
+                )
+                for choice in completion.choices
+            ],
+        )
+    ]
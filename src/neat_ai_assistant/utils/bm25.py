@@ -0,0 +1,123 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Generic, Hashable, Iterable, Sequence, TypeVar
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it its me my "
+    "of on or our so that the their them then there these they this to was we were what "
+    "when where which who why will with you your".split()
+)
+
+
+K = TypeVar("K", bound=Hashable)
+
+
+def _stem(token: str) -> str:
+    # plural folding only, enough to match "likes" with "like" without a stemming dependency
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        _stem(token)
+        for token in _TOKEN_PATTERN.findall(text.lower())
+        if token not in _STOPWORDS
+    ]
+
+
+class BM25Index(Generic[K]):
+    """
+    Incrementally maintained inverted index with Okapi BM25 scoring.
+    Searching only touches the postings of the query terms, so its cost does not grow with unrelated documents.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[K, int]] = {}
+        self._document_terms: dict[K, tuple[str, ...]] = {}
+        self._document_lengths: dict[K, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._document_lengths)
+
+    def __contains__(self, document_id: object) -> bool:
+        return document_id in self._document_lengths
+
+    def add(self, document_id: K, text: str) -> None:
+        if document_id in self:
+            self.remove(document_id)
+        tokens = tokenize(text)
+        term_frequencies = Counter(tokens)
+        for term, frequency in term_frequencies.items():
+            self._postings.setdefault(term, {})[document_id] = frequency
+        self._document_terms[document_id] = tuple(term_frequencies)
+        self._document_lengths[document_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, document_id: K) -> None:
+        for term in self._document_terms.pop(document_id, ()):
+            postings = self._postings[term]
+            del postings[document_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._document_lengths.pop(document_id, 0)
+
+    def search(self, query: str, k: int) -> Sequence[tuple[K, float]]:
+        """Returns up to `k` `(document_id, score)` pairs, best first. Documents sharing no term with the query are left out."""
+        return self.search_tokens(tokenize(query), k)
+
+    def search_tokens(
+        self, query_tokens: Iterable[str], k: int
+    ) -> Sequence[tuple[K, float]]:
+        document_count = len(self._document_lengths)
+        if not document_count or k <= 0:
+            return []
+        average_length = self._total_length / document_count or 1.0
+
+        # rarest terms first: once the remaining terms cannot lift an unseen document into the top k,
+        # they only need to update documents that are already candidates (MaxScore pruning)
+        weighted_terms = []
+        for term in set(query_tokens):
+            postings = self._postings.get(term)
+            if postings:
+                idf = math.log(
+                    1 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+                weighted_terms.append((idf, postings))
+        weighted_terms.sort(key=lambda item: item[0], reverse=True)
+        remaining_upper_bound = sum(idf for idf, _ in weighted_terms) * (self.k1 + 1)
+
+        scores: dict[K, float] = {}
+        for idf, postings in weighted_terms:
+            threshold = (
+                heapq.nlargest(k, scores.values())[-1] if len(scores) >= k else 0.0
+            )
+            if 0.0 < remaining_upper_bound <= threshold:
+                for document_id in scores:
+                    frequency = postings.get(document_id)
+                    if frequency:
+                        scores[document_id] += self._score(
+                            idf, frequency, document_id, average_length
+                        )
+            else:
+                for document_id, frequency in postings.items():
+                    scores[document_id] = scores.get(document_id, 0.0) + self._score(
+                        idf, frequency, document_id, average_length
+                    )
+            remaining_upper_bound -= idf * (self.k1 + 1)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def _score(
+        self, idf: float, frequency: int, document_id: K, average_length: float
+    ) -> float:
+        length_norm = (
+            1 - self.b + self.b * (self._document_lengths[document_id] / average_length)
+        )
+        return idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
@@ -0,0 +1,243 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheEntry(Generic[V]):
+    def __init__(self, value: V, size: int, expires_at: Optional[float]) -> None:
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+    def is_expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Thread-safe in-memory cache, bounded by entry count and by the total size reported by `sizeof`.
+    Expired entries count as misses but stay in place until they are evicted or overwritten, so callers can still revalidate them through `get_entry`.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("A sizeof function is required to enforce max_bytes.")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof
+        self.clock = clock
+        self._entries: OrderedDict[K, CacheEntry[V]] = OrderedDict()
+        self._size_bytes = 0
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return self._stats.model_copy(
+                update={"entries": len(self._entries), "size_bytes": self._size_bytes}
+            )
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.is_expired(self.clock()):
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry.value
+
+    def get_entry(self, key: K) -> Optional[CacheEntry[V]]:
+        """Returns the entry even if it expired, without counting a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: K, value: V, ttl_seconds: Optional[float] = None) -> None:
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # an entry that alone exceeds the budget would evict everything else
+            self.pop(key)
+            return
+        expires_at = self.clock() + ttl_seconds if ttl_seconds is not None else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(value, size, expires_at)
+            self._size_bytes += size
+            self._enforce_limits()
+
+    def pop(self, key: K) -> Optional[V]:
+        with self._lock:
+            entry = self._remove(key)
+            return entry.value if entry is not None else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def _remove(self, key: K) -> Optional[CacheEntry[V]]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size_bytes -= entry.size
+        return entry
+
+    def _enforce_limits(self) -> None:
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._size_bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._size_bytes -= entry.size
+            self._stats.evictions += 1
+
+
+class SQLiteCache:
+    """
+    On-disk key→bytes cache in a single SQLite file, shared across processes.
+    Entries expire after their TTL; once `max_bytes` is exceeded, the least recently used entries are deleted.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        busy_timeout_ms: int = 5_000,
+    ) -> None:
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)"
+        )
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            entries, size_bytes = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            return self._stats.model_copy(
+                update={"entries": entries, "size_bytes": size_bytes}
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                self._stats.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._stats.hits += 1
+            value: bytes = row[0]
+            return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: Optional[float] = None) -> None:
+        now = time.time()
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = now + ttl_seconds if ttl_seconds is not None else None
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, len(value), expires_at, now),
+                )
+                self._enforce_limits(now)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.close()
+
+    def _enforce_limits(self, now: float) -> None:
+        evicted = self.connection.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        if self.max_bytes is not None:
+            (size_bytes,) = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+            excess = size_bytes - self.max_bytes
+            if excess > 0:
+                # least recently used first, until the deleted sizes cover the excess
+                evicted += self.connection.execute(
+                    """DELETE FROM cache WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY last_access, key) - size AS freed_before
+                            FROM cache
+                        ) WHERE freed_before < ?
+                    )""",
+                    (excess,),
+                ).rowcount
+        self._stats.evictions += evicted
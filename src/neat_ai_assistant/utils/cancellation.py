@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class RunCancelledError(Exception):
+    """Raised by work whose result is no longer needed."""
+
+
+class CancellationToken:
+    """
+    Tells running work that its result is no longer needed, because it was cancelled or ran past its deadline.
+    Work checks the token between steps with `raise_if_cancelled` and races its awaits against it with `race`.
+    `cancel` may be called from any thread.
+    """
+
+    def __init__(
+        self,
+        timeout_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.deadline = clock() + timeout_seconds if timeout_seconds else None
+        self.reason: Optional[str] = None
+        self._waiters: set[
+            tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]
+        ] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None or (
+            self.deadline is not None and self.clock() >= self.deadline
+        )
+
+    def get_remaining_seconds(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.clock())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+            waiters = list(self._waiters)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_set_done, future)
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise RunCancelledError(self.reason)
+        if self.deadline is not None and self.clock() >= self.deadline:
+            raise RunCancelledError("deadline exceeded")
+
+    async def race(self, awaitable: Awaitable[T]) -> T:
+        """Awaits `awaitable`, but cancels it and raises `RunCancelledError` as soon as the token is cancelled."""
+        self.raise_if_cancelled()
+        task = asyncio.ensure_future(awaitable)
+        loop = asyncio.get_running_loop()
+        cancelled = loop.create_future()
+        with self._lock:
+            self._waiters.add((loop, cancelled))
+        try:
+            await asyncio.wait(
+                [task, cancelled],
+                timeout=self.get_remaining_seconds(),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except BaseException:
+            task.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._waiters.discard((loop, cancelled))
+        if task.done():
+            return task.result()
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.raise_if_cancelled()
+        raise RunCancelledError("deadline exceeded")
+
+
+def _set_done(future: asyncio.Future[None]) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar(
+    "cancellation_token", default=None
+)
+
+
+def activate_cancellation(token: Optional[CancellationToken]) -> None:
+    """Makes `token` the one that `raise_if_cancelled` checks in this context, and in tasks and threads started from it."""
+    _current_token.set(token)
+
+
+def raise_if_cancelled() -> None:
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
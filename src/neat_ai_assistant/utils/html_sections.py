@@ -0,0 +1,321 @@
+import re
+from collections import deque
+from html.parser import HTMLParser
+from typing import Optional
+
+try:
+    from bs4.dammit import EntitySubstitution, UnicodeDammit
+
+    BS4_AVAILABLE = True
+except:
+    BS4_AVAILABLE = False
+
+SECTION_HEADERS = frozenset(["h2", "h3", "h4", "h5", "h6"])
+
+# tree building rules of bs4's "html.parser" builder, mirrored so the extracted text stays identical
+_VOID_TAGS = frozenset(
+    [
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+        "basefont",
+        "bgsound",
+        "command",
+        "frame",
+        "image",
+        "isindex",
+        "nextid",
+        "spacer",
+    ]
+)
+_PRESERVE_WHITESPACE_TAGS = frozenset(["pre", "textarea"])
+# strings inside these tags are not part of a tag's text
+_HIDDEN_STRING_TAGS = frozenset(["rt", "rp", "style", "script", "template"])
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+_HTML_ENTITIES = re.compile(r"&[a-zA-Z]+;")
+_NEWLINES = re.compile(r"\n+")
+_UNFINISHED_ENTITY = re.compile(r"&[a-zA-Z]*$")
+
+
+def clean_scraped_text(text: str) -> str:
+    cleaned_text = text.replace("\xa0", " ")
+    cleaned_text = _HTML_ENTITIES.sub(" ", cleaned_text)
+    cleaned_text = _NEWLINES.sub("\n", cleaned_text)
+    return cleaned_text.strip()
+
+
+class _TextCollector:
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+        self.closed = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class _Section:
+    def __init__(self, header: _TextCollector) -> None:
+        self.header = header
+        self.paragraphs: list[_TextCollector] = []
+        self.ended = False
+
+    def get_parts(self) -> list[_TextCollector]:
+        return [self.header, *self.paragraphs]
+
+    @property
+    def complete(self) -> bool:
+        return self.ended and all(part.closed for part in self.get_parts())
+
+    @property
+    def text(self) -> str:
+        return "\n".join(part.text for part in self.get_parts())
+
+
+class _BudgetFilled(Exception):
+    pass
+
+
+class _SectionParser(HTMLParser):
+    """
+    Collects header→paragraph sections in a single pass over the parser events.
+    A section starts at each h2–h6 header and takes the text of every following <p> until the next tag whose name starts with "h".
+    Once the cleaned text can no longer change within the first `maximum_length_char` characters, parsing stops.
+    """
+
+    def __init__(self, maximum_length_char: int, original_encoding: Optional[str]):
+        super().__init__(convert_charrefs=False)
+        self.maximum_length_char = maximum_length_char
+        self.original_encoding = original_encoding
+        self.found_header = False
+        self.cleaned_prefix = ""
+        self.sections: list[str] = []
+        self.current_section: Optional[_Section] = None
+        # sections with paragraphs whose text can still grow, in document order
+        self._unfinished_sections: deque[_Section] = deque()
+
+        self._stack: list[tuple[str, Optional[_TextCollector]]] = []
+        self._open_tag_counts: dict[str, int] = {}
+        self._open_collectors: list[_TextCollector] = []
+        self._preserve_whitespace_depth = 0
+        self._hidden_string_depth = 0
+        self._already_closed_void_tags: list[str] = []
+        self._pending_data: list[str] = []
+
+        self._collected_length = 0
+        self._next_check_length = maximum_length_char
+
+    def get_body_text(self) -> str:
+        return "\n\n".join(self.sections)
+
+    def finish(self) -> None:
+        self.close()
+        self._flush_data()
+        while self._stack:
+            self._pop()
+        self._finish_section()
+        self._collect_complete_sections()
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._start_tag(tag, handle_void=False)
+        self.handle_endtag(tag)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self._start_tag(tag, handle_void=True)
+
+    def handle_endtag(self, tag: str, check_already_closed: bool = True) -> None:
+        if check_already_closed and tag in self._already_closed_void_tags:
+            # explicit end tag of a void element that was already closed
+            self._already_closed_void_tags.remove(tag)
+            return
+        self._flush_data()
+        if not self._open_tag_counts.get(tag):
+            return
+        while self._pop() != tag:
+            pass
+
+    def handle_data(self, data: str) -> None:
+        self._pending_data.append(data)
+
+    def handle_charref(self, name: str) -> None:
+        if name.startswith(("x", "X")):
+            codepoint = int(name.lstrip("xX"), 16)
+        else:
+            codepoint = int(name)
+        data = None
+        if codepoint < 256:
+            # numeric references below 256 often mean windows-1252 rather than unicode
+            for encoding in (self.original_encoding, "windows-1252"):
+                if not encoding:
+                    continue
+                try:
+                    data = bytearray([codepoint]).decode(encoding)
+                except UnicodeDecodeError:
+                    pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name: str) -> None:
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def handle_comment(self, data: str) -> None:
+        self._flush_data()
+
+    def handle_decl(self, decl: str) -> None:
+        self._flush_data()
+
+    def handle_pi(self, data: str) -> None:
+        self._flush_data()
+
+    def unknown_decl(self, data: str) -> None:
+        self._flush_data()
+        if data.upper().startswith("CDATA["):
+            self._pending_data.append(data[len("CDATA[") :])
+            self._flush_data(is_cdata=True)
+
+    def _start_tag(self, tag: str, handle_void: bool) -> None:
+        self._flush_data()
+
+        collector = None
+        if tag.startswith("h"):
+            self._finish_section()
+            if tag in SECTION_HEADERS:
+                self.found_header = True
+                collector = _TextCollector()
+                self.current_section = _Section(collector)
+        elif tag == "p" and self.current_section is not None:
+            collector = _TextCollector()
+            if not self.current_section.paragraphs:
+                self._unfinished_sections.append(self.current_section)
+            self.current_section.paragraphs.append(collector)
+
+        self._stack.append((tag, collector))
+        self._open_tag_counts[tag] = self._open_tag_counts.get(tag, 0) + 1
+        if collector is not None:
+            self._open_collectors.append(collector)
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace_depth += 1
+        if tag in _HIDDEN_STRING_TAGS:
+            self._hidden_string_depth += 1
+
+        if handle_void and tag in _VOID_TAGS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self._already_closed_void_tags.append(tag)
+
+    def _pop(self) -> str:
+        tag, collector = self._stack.pop()
+        self._open_tag_counts[tag] -= 1
+        if tag in _PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace_depth -= 1
+        if tag in _HIDDEN_STRING_TAGS:
+            self._hidden_string_depth -= 1
+        if collector is not None:
+            collector.closed = True
+            self._open_collectors.remove(collector)
+            self._check_budget()
+        return tag
+
+    def _flush_data(self, is_cdata: bool = False) -> None:
+        if not self._pending_data:
+            return
+        data = "".join(self._pending_data)
+        self._pending_data = []
+        if not self._preserve_whitespace_depth and not data.strip(_ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if self._hidden_string_depth and not is_cdata:
+            return
+        for collector in self._open_collectors:
+            collector.parts.append(data)
+            self._collected_length += len(data)
+
+    def _finish_section(self) -> None:
+        # the section takes no more paragraphs, but the text of its open tags can still grow
+        if self.current_section is None:
+            return
+        self.current_section.ended = True
+        self.current_section = None
+        self._check_budget()
+
+    def _collect_complete_sections(self) -> None:
+        while self._unfinished_sections and self._unfinished_sections[0].complete:
+            self.sections.append(self._unfinished_sections.popleft().text)
+
+    def _get_determined_text(self) -> str:
+        # text that later events can only append to
+        self._collect_complete_sections()
+        if not self._unfinished_sections:
+            return self.get_body_text()
+        parts: list[str] = []
+        for part in self._unfinished_sections[0].get_parts():
+            parts.append(part.text)
+            if not part.closed:
+                break
+        return "\n\n".join([*self.sections, "\n".join(parts)])
+
+    def _check_budget(self) -> None:
+        if self.maximum_length_char < 0:
+            return
+        # the collected length bounds the raw text length, which bounds the cleaned length
+        separator_length = 2 * (len(self.sections) + 1)
+        if self._collected_length + separator_length < self._next_check_length:
+            return
+        cleaned_text = clean_scraped_text(self._get_determined_text())
+        # a trailing "&name" could still become an entity, anything before it is final
+        unfinished_entity = _UNFINISHED_ENTITY.search(cleaned_text)
+        stable_length = len(cleaned_text) - (
+            len(unfinished_entity.group()) if unfinished_entity else 0
+        )
+        if self.found_header and stable_length >= self.maximum_length_char:
+            self.cleaned_prefix = cleaned_text
+            raise _BudgetFilled()
+        self._next_check_length = 2 * (self._collected_length + separator_length)
+
+
+def extract_section_text(
+    markup: bytes | str, maximum_length_char: int = 1000
+) -> Optional[str]:
+    """
+    Returns the header→paragraph sections of a page, cleaned and cut to `maximum_length_char` characters, or None if the page has no h2–h6 headers.
+    Produces the same text as walking a BeautifulSoup tree with `find_all_next` from every header, in one pass and without building the tree.
+    """
+    if not BS4_AVAILABLE:
+        raise RuntimeError(
+            "Extracting sections requires 'bs4'. Please install the extra 'tool-extension'."
+        )
+    if isinstance(markup, bytes):
+        dammit = UnicodeDammit(markup, is_html=True)
+        text: str = dammit.markup
+        original_encoding: Optional[str] = dammit.original_encoding
+    else:
+        text, original_encoding = markup, None
+
+    parser = _SectionParser(maximum_length_char, original_encoding)
+    try:
+        parser.feed(text)
+        parser.finish()
+    except _BudgetFilled:
+        cleaned_text = parser.cleaned_prefix
+    else:
+        if not parser.found_header:
+            return None
+        cleaned_text = clean_scraped_text(parser.get_body_text())
+    return cleaned_text[:maximum_length_char] + "..."
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from pydantic import BaseModel
+
+from .cache import CacheStats, LRUCache, SQLiteCache
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Lowercases scheme and host, drops default ports, fragments and utm_* parameters, and sorts the query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.startswith("utm_")
+        )
+    )
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class CachedPage(BaseModel):
+    url: str
+    content: bytes
+    body_text: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + len(self.body_text or "")
+
+    def get_conditional_headers(self) -> dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_bytes(self) -> bytes:
+        # compact json never contains a raw newline, so it separates the metadata from the content
+        metadata = self.model_dump(exclude={"content"})
+        return json.dumps(metadata).encode("utf-8") + b"\n" + self.content
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedPage":
+        metadata, _, content = data.partition(b"\n")
+        return cls(content=content, **json.loads(metadata))
+
+
+class PageCacheStats(BaseModel):
+    hits: int = 0
+    revalidations: int = 0
+    misses: int = 0
+    bytes_served: int = 0
+    bytes_downloaded: int = 0
+    memory: CacheStats
+    disk: Optional[CacheStats] = None
+
+
+class PageCache:
+    """
+    Downloaded pages and their extracted text, keyed by normalized URL.
+    Pages live in a size-bounded in-memory LRU and, optionally, in a `SQLiteCache` shared by all workers.
+    Pages older than `ttl_seconds` are stale: they are not served, but their ETag/Last-Modified make the next download conditional.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3_600,
+        max_memory_bytes: int = 50_000_000,
+        disk_cache: Optional[SQLiteCache] = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.disk_cache = disk_cache
+        self.memory_cache: LRUCache[str, CachedPage] = LRUCache(
+            max_bytes=max_memory_bytes, sizeof=lambda page: page.size
+        )
+        self._stats = PageCacheStats(memory=self.memory_cache.stats)
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> PageCacheStats:
+        with self._lock:
+            return self._stats.model_copy(
+                update={
+                    "memory": self.memory_cache.stats,
+                    "disk": self.disk_cache.stats if self.disk_cache else None,
+                }
+            )
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at < self.ttl_seconds
+
+    def get(self, url: str) -> Optional[CachedPage]:
+        """Returns the page if it is fresh; counts a hit or a miss."""
+        page = self.get_stale(url)
+        with self._lock:
+            if page is None or not self.is_fresh(page):
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+            self._stats.bytes_served += len(page.content)
+            return page
+
+    def get_stale(self, url: str) -> Optional[CachedPage]:
+        """Returns the page even if it is stale, for a conditional download."""
+        key = normalize_url(url)
+        entry = self.memory_cache.get_entry(key)
+        if entry is not None:
+            return entry.value
+        if self.disk_cache is None:
+            return None
+        data = self.disk_cache.get(key)
+        if data is None:
+            return None
+        page = CachedPage.from_bytes(data)
+        self.memory_cache.set(key, page)
+        return page
+
+    def put(self, page: CachedPage) -> None:
+        with self._lock:
+            self._stats.bytes_downloaded += len(page.content)
+        self._store(page)
+
+    def refresh(self, page: CachedPage) -> CachedPage:
+        """Marks a stale page as fresh again after the server answered "304 Not Modified"."""
+        refreshed_page = page.model_copy(update={"fetched_at": time.time()})
+        with self._lock:
+            self._stats.revalidations += 1
+            self._stats.bytes_served += len(page.content)
+        self._store(refreshed_page)
+        return refreshed_page
+
+    def _store(self, page: CachedPage) -> None:
+        key = normalize_url(page.url)
+        self.memory_cache.set(key, page)
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, page.to_bytes())
@@ -0,0 +1,242 @@
+import bisect
+import math
+import threading
+from typing import Sequence
+
+from .tracing import Span, Trace, TraceSink
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 7, 10, 15, 20)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    if not label_names:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            name,
+            value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in zip(label_names, label_values)
+    )
+    return "{" + labels + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values: LabelValues = (), amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, label_values: LabelValues = ()) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, label_values: LabelValues = ()) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def get(self, label_values: LabelValues = ()) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class _HistogramValues:
+    def __init__(self, n_buckets: int) -> None:
+        self.bucket_counts = [0] * n_buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = sorted(buckets)
+        self._values: dict[LabelValues, _HistogramValues] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_values: LabelValues = ()) -> None:
+        # buckets are stored non-cumulatively and summed up when rendering
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(label_values)
+            if values is None:
+                values = _HistogramValues(len(self.buckets) + 1)
+                self._values[label_values] = values
+            values.bucket_counts[index] += 1
+            values.count += 1
+            values.sum += value
+
+    def get_count(self, label_values: LabelValues = ()) -> int:
+        with self._lock:
+            values = self._values.get(label_values)
+            return values.count if values else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        label_names = (*self.label_names, "le")
+        with self._lock:
+            for label_values, values in sorted(self._values.items()):
+                cumulative_count = 0
+                for bound, bucket_count in zip(
+                    [*self.buckets, math.inf], values.bucket_counts
+                ):
+                    cumulative_count += bucket_count
+                    labels = _format_labels(
+                        label_names, (*label_values, _format_value(bound))
+                    )
+                    lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(values.sum)}")
+                lines.append(f"{self.name}_count{labels} {values.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format."""
+
+    def __init__(self) -> None:
+        self.metrics: list[Counter | Gauge | Histogram] = []
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+        counter = Counter(name, help, label_names)
+        self.metrics.append(counter)
+        return counter
+
+    def gauge(self, name: str, help: str, label_names: Sequence[str] = ()) -> Gauge:
+        gauge = Gauge(name, help, label_names)
+        self.metrics.append(gauge)
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, help, label_names, buckets)
+        self.metrics.append(histogram)
+        return histogram
+
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+
+class PrometheusTraceSink(TraceSink):
+    """
+    Aggregates spans into Prometheus metrics: latency histograms per span, LLM call and tool,
+    token and error counters, and the number of iterations per reply.
+    """
+
+    def __init__(self, registry: MetricsRegistry, prefix: str = "neat") -> None:
+        self.span_seconds = registry.histogram(
+            f"{prefix}_span_duration_seconds", "Duration of traced steps.", ["span"]
+        )
+        self.llm_seconds = registry.histogram(
+            f"{prefix}_llm_request_duration_seconds",
+            "Duration of chat completion requests, until the last streamed chunk.",
+            ["model", "cache_hit"],
+        )
+        self.llm_tokens = registry.counter(
+            f"{prefix}_llm_tokens_total",
+            "Tokens of chat completion requests, served from the cache or not.",
+            ["model", "kind", "cache_hit"],
+        )
+        self.tool_seconds = registry.histogram(
+            f"{prefix}_tool_duration_seconds", "Duration of tool runs.", ["tool"]
+        )
+        self.throttled_seconds = registry.counter(
+            f"{prefix}_llm_throttled_seconds_total",
+            "Time chat completion requests waited for the rate limiter.",
+            ["model"],
+        )
+        self.errors = registry.counter(
+            f"{prefix}_span_errors_total", "Traced steps that failed.", ["span"]
+        )
+        self.reply_iterations = registry.histogram(
+            f"{prefix}_agent_reply_iterations",
+            "LLM calls per agent reply.",
+            buckets=ITERATION_BUCKETS,
+        )
+        self.events = registry.counter(
+            f"{prefix}_trace_events_total",
+            "Events counted during requests, such as cache hits.",
+            ["event"],
+        )
+
+    def on_span(self, trace: Trace, span: Span) -> None:
+        duration_seconds = span.duration_seconds or 0.0
+        self.span_seconds.observe(duration_seconds, (span.name,))
+        if span.error is not None:
+            self.errors.inc((span.name,))
+        attributes = span.attributes
+        if span.name == "llm.chat_completion":
+            model = str(attributes.get("model"))
+            cache_hit = str(bool(attributes.get("cache_hit"))).lower()
+            self.llm_seconds.observe(duration_seconds, (model, cache_hit))
+            for kind in ["prompt", "completion"]:
+                tokens = attributes.get(f"{kind}_tokens")
+                if tokens:
+                    self.llm_tokens.inc((model, kind, cache_hit), tokens)
+        elif span.name == "llm.throttle":
+            self.throttled_seconds.inc(
+                (str(attributes.get("model")),), duration_seconds
+            )
+        elif span.name == "tool.run":
+            self.tool_seconds.observe(duration_seconds, (str(attributes.get("tool")),))
+        elif span.name == "agent.reply":
+            iterations = attributes.get("iterations")
+            if iterations is not None:
+                self.reply_iterations.observe(iterations)
+
+    def on_trace(self, trace: Trace) -> None:
+        for event, n in trace.to_dict()["counters"].items():
+            self.events.inc((event,), n)
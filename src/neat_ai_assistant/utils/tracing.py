@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+import uuid
+from abc import abstractmethod
+from contextvars import ContextVar
+from pathlib import Path
+from types import TracebackType
+from typing import Any, Optional, Sequence, Type
+
+
+class Span:
+    """A timed step of a request, such as an LLM call or a tool run."""
+
+    def __init__(
+        self, name: str, started_at: float, attributes: dict[str, Any]
+    ) -> None:
+        self.name = name
+        # seconds since the start of the trace
+        self.started_at = started_at
+        self.duration_seconds: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration_seconds,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """The spans and event counts of one request."""
+
+    def __init__(self, tracer: "Tracer", attributes: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.attributes = attributes
+        self.spans: list[Span] = []
+        self.counters: dict[str, int] = {}
+        self._started_at_perf = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def get_elapsed_seconds(self) -> float:
+        return time.perf_counter() - self._started_at_perf
+
+    def start_span(self, name: str, **attributes: Any) -> "SpanRecorder":
+        span = Span(name, self.get_elapsed_seconds(), attributes)
+        return SpanRecorder(self, span)
+
+    def count(self, event: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[event] = self.counters.get(event, 0) + n
+
+    def finish_span(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+        for sink in self.tracer.sinks:
+            sink.on_span(self, span)
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.started_at)
+            return {
+                "trace_id": self.trace_id,
+                "started_at": self.started_at,
+                "attributes": self.attributes,
+                "counters": dict(self.counters),
+                "spans": [s.to_dict() for s in spans],
+            }
+
+
+class SpanRecorder:
+    """
+    Times a span until `finish` is called, or until its `with` block is left.
+    An exception leaving the block is recorded as the span's error.
+    """
+
+    def __init__(self, trace: Optional[Trace], span: Optional[Span]) -> None:
+        self.trace = trace
+        self.span = span
+        self._finished = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.span is not None
+
+    def set(self, **attributes: Any) -> None:
+        if self.span is not None:
+            self.span.attributes.update(attributes)
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self.trace is None or self.span is None or self._finished:
+            return
+        self._finished = True
+        span = self.span
+        span.duration_seconds = self.trace.get_elapsed_seconds() - span.started_at
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        self.trace.finish_span(span)
+
+    def __enter__(self) -> "SpanRecorder":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.finish(exc)
+
+
+# returned whenever tracing is disabled, so that hooks cost a context variable lookup and nothing else
+NULL_SPAN = SpanRecorder(None, None)
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def activate_trace(trace: Optional[Trace]) -> None:
+    """
+    Makes `trace` the one that hooks in this context record to.
+    Tasks and threads started afterwards inherit it; hooks capture it when they start, not when they finish.
+    """
+    _current_trace.set(trace)
+
+
+def start_span(name: str, **attributes: Any) -> SpanRecorder:
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return trace.start_span(name, **attributes)
+
+
+def count_event(event: str, n: int = 1) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(event, n)
+
+
+class TraceSink:
+    """Receives spans as they finish and traces once their request is done."""
+
+    @abstractmethod
+    def on_span(self, trace: Trace, span: Span) -> None:
+        ...
+
+    def on_trace(self, trace: Trace) -> None:
+        ...
+
+
+class Tracer:
+    def __init__(self, sinks: Sequence[TraceSink]) -> None:
+        self.sinks = sinks
+
+    def start_trace(self, **attributes: Any) -> Trace:
+        return Trace(self, attributes)
+
+    def finish_trace(self, trace: Trace) -> None:
+        for sink in self.sinks:
+            sink.on_trace(trace)
+
+
+class JsonLinesTraceSink(TraceSink):
+    """Appends every finished trace, with all of its spans, as one JSON line."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def on_span(self, trace: Trace, span: Span) -> None:
+        pass
+
+    def on_trace(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(line + "\n")
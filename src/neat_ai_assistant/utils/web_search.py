@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Mapping, Optional, Sequence
+
+from duckduckgo_search import DDGS  # type: ignore
+from pydantic import BaseModel
+
+from .cache import LRUCache
+from .tracing import count_event, start_span
+
+SearchHit = Mapping[str, Optional[str]]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+class _SearchResults:
+    def __init__(self, hits: Sequence[SearchHit], requested: int) -> None:
+        self.hits = hits
+        # fewer hits than requested means the search has nothing more to offer
+        self.complete = len(hits) < requested
+
+    def covers(self, n: int) -> bool:
+        return self.complete or len(self.hits) >= n
+
+
+class WebSearchStats(BaseModel):
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+
+
+class WebSearchClient:
+    """
+    DuckDuckGo text search over one long-lived client, with results cached by normalized query.
+    A cached result set answers any request for at most as many hits, and identical concurrent searches share one round trip.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 5,
+        ttl_seconds: float = 600,
+        max_entries: int = 1_000,
+        ddgs: Optional[Any] = None,
+    ) -> None:
+        self.timeout = timeout
+        self._ddgs = ddgs
+        self._cache: LRUCache[str, _SearchResults] = LRUCache(
+            max_entries=max_entries, ttl_seconds=ttl_seconds
+        )
+        self._in_flight: dict[str, tuple[int, Future[_SearchResults]]] = {}
+        self._stats = WebSearchStats()
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> WebSearchStats:
+        with self._lock:
+            return self._stats.model_copy()
+
+    @property
+    def ddgs(self) -> Any:
+        with self._lock:
+            if self._ddgs is None:
+                self._ddgs = DDGS(timeout=self.timeout)
+            return self._ddgs
+
+    def text(self, query: str, n: int) -> Sequence[SearchHit]:
+        """Returns up to `n` hits for `query`, each with a "title", "href" and "body"."""
+        key = normalize_query(query)
+        with self._lock:
+            results = self._cache.get(key)
+            if results is not None and results.covers(n):
+                self._stats.hits += 1
+                count_event("web_search_cache.hit")
+                return results.hits[:n]
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight[0] >= n:
+                self._stats.coalesced += 1
+                count_event("web_search_cache.coalesced")
+                future = in_flight[1]
+                is_owner = False
+            else:
+                self._stats.misses += 1
+                count_event("web_search_cache.miss")
+                future = Future()
+                self._in_flight[key] = (n, future)
+                is_owner = True
+
+        if not is_owner:
+            return future.result().hits[:n]
+
+        try:
+            results = self._search(query, n)
+        except BaseException as e:
+            self._finish_in_flight(key, future)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._cache.set(key, results)
+        self._finish_in_flight(key, future)
+        future.set_result(results)
+        return results.hits
+
+    def close(self) -> None:
+        with self._lock:
+            if self._ddgs is not None:
+                self._ddgs.__exit__(None, None, None)
+                self._ddgs = None
+
+    def _search(self, query: str, n: int) -> _SearchResults:
+        hits: list[SearchHit] = []
+        with start_span("web.search", n=n):
+            for i, r in enumerate(self.ddgs.text(query)):
+                if i >= n:
+                    break
+                hits.append(r)
+        return _SearchResults(hits, requested=n)
+
+    def _finish_in_flight(self, key: str, future: Future[_SearchResults]) -> None:
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None and in_flight[1] is future:
+                del self._in_flight[key]
+
+
+_shared_client: Optional[WebSearchClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_search_client() -> WebSearchClient:
+    """The client both search tools use unless they are given one."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = WebSearchClient()
+        return _shared_client
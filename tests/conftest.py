@@ -1,9 +1,49 @@
+import os
+from typing import Any, Mapping, Optional, Sequence
+
 from dotenv import load_dotenv
-from pytest import fixture
+from helpers import AgentFactory, WordCountingOpenaiWrapper
+from pytest import fixture, skip
+
+from neat_ai_assistant import (
+    ChatBackend,
+    ConversationHistory,
+    Model,
+    NeatAgent,
+    OpenaiBackend,
+    OpenaiWrapper,
+    RecordingBackend,
+    ReplayBackend,
+    Tool,
+)
+
+load_dotenv()
+
+
+@fixture
+def build_agent() -> AgentFactory:
+    """
+    Builds agents that answer without required reasoning, on a `WordCountingOpenaiWrapper`.
+    `wrapper_kwargs` go to the wrapper, any other keyword arguments to the agent.
+    """
 
-from neat_ai_assistant import Model, OpenaiWrapper
+    def build(
+        backend: ChatBackend,
+        tools: Sequence[Tool],
+        wrapper_kwargs: Optional[Mapping[str, Any]] = None,
+        **agent_kwargs: Any,
+    ) -> NeatAgent:
+        agent_kwargs.setdefault("history", ConversationHistory())
+        agent_kwargs.setdefault("require_reasoning", False)
+        return NeatAgent(
+            openai_wrapper=WordCountingOpenaiWrapper(
+                backend=backend, **(wrapper_kwargs or {})
+            ),
+            tools=tools,
+            **agent_kwargs,
+        )
 
-load_dotenv
+    return build
 
 
 @fixture
@@ -13,4 +53,13 @@ def openai_model() -> Model:
 
 @fixture(scope="session")
 def openai_wrapper() -> OpenaiWrapper:
+    # record a session once with OPENAI_RECORD_PATH, then replay it without an API key
+    record_path = os.getenv("OPENAI_RECORD_PATH")
+    replay_path = os.getenv("OPENAI_REPLAY_PATH")
+    if replay_path:
+        return OpenaiWrapper(backend=ReplayBackend(replay_path, time_scale=0))
+    if not os.getenv("OPENAI_API_KEY"):
+        skip("Neither OPENAI_API_KEY nor OPENAI_REPLAY_PATH is set.")
+    if record_path:
+        return OpenaiWrapper(backend=RecordingBackend(OpenaiBackend(), record_path))
     return OpenaiWrapper()
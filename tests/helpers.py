@@ -0,0 +1,55 @@
+import re
+from typing import Callable, Optional, Sequence
+
+from bs4 import BeautifulSoup, Tag
+
+from neat_ai_assistant import Model, NeatAgent, OpenaiWrapper
+
+# the type of the `build_agent` fixture
+AgentFactory = Callable[..., NeatAgent]
+
+
+class WordCountingOpenaiWrapper(OpenaiWrapper):
+    """Counts words instead of tokens, as tiktoken needs to download its encodings."""
+
+    def count_tokens(self, text: str, model: Model) -> int:
+        return len(text.split())
+
+
+def legacy_scrape_body_text(
+    content: bytes | str, maximum_length_char: int = 1000
+) -> Optional[str]:
+    """The BeautifulSoup implementation of `WebpageRetrievalTool._scrape_body_text` the section extractor replaced."""
+
+    def clean_scraped_text(text: str) -> str:
+        cleaned_text = text.replace("\xa0", " ")
+        html_entities = re.compile(r"&[a-zA-Z]+;")
+        cleaned_text = html_entities.sub(" ", cleaned_text)
+        cleaned_text = re.sub(r"\n+", "\n", cleaned_text)
+        return cleaned_text.strip()
+
+    def cut_text(text: str) -> str:
+        return text[:maximum_length_char] + "..."
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    headers: Sequence[Tag] = soup.find_all(["h2", "h3", "h4", "h5", "h6"])
+    if not bool(headers):
+        return None
+
+    sections: list[str] = []
+
+    for header in headers:
+        section_text: list[str] = [header.text]
+        for sibling in header.find_all_next():
+            if isinstance(sibling, Tag):
+                if sibling.name and sibling.name.startswith("h"):
+                    break
+                elif sibling.name == "p":
+                    section_text.append(sibling.text)
+
+        if len(section_text) > 1:
+            sections.append("\n".join(section_text))
+    body_text: str = "\n\n".join(sections)
+
+    return cut_text(clean_scraped_text(body_text))
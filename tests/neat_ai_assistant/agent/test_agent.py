@@ -0,0 +1,396 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Mapping, Optional, Sequence, cast
+
+from helpers import WordCountingOpenaiWrapper
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pytest import fixture
+
+from neat_ai_assistant import (
+    ContextBudget,
+    ConversationHistory,
+    LargestToolResultFirstEviction,
+    Message,
+    Model,
+    NeatAgent,
+    NeatAgentOutput,
+    Tool,
+    ToolParam,
+)
+from neat_ai_assistant.agent.tool import ToolResult
+
+
+def build_chat_completion(
+    content: str | None = None, tool_calls: Sequence[tuple[str, Mapping[str, Any]]] = ()
+) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": Model.GPT_4.value,
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "tool_calls" if tool_calls else "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": content,
+                        "tool_calls": [
+                            {
+                                "id": f"call_{i}",
+                                "type": "function",
+                                "function": {
+                                    "name": name,
+                                    "arguments": json.dumps(arguments),
+                                },
+                            }
+                            for i, (name, arguments) in enumerate(tool_calls)
+                        ]
+                        or None,
+                    },
+                }
+            ],
+        }
+    )
+
+
+def build_chat_completion_chunk(delta: Mapping[str, Any]) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": Model.GPT_4.value,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+        }
+    )
+
+
+async def stream_chunks(
+    chunks: Sequence[ChatCompletionChunk],
+) -> AsyncIterator[ChatCompletionChunk]:
+    for chunk in chunks:
+        yield chunk
+
+
+class ScriptedOpenaiWrapper(WordCountingOpenaiWrapper):
+    def __init__(
+        self, responses: Sequence[ChatCompletion | Sequence[ChatCompletionChunk]]
+    ) -> None:
+        super().__init__()
+        self.responses = list(responses)
+        self.received: list[Sequence[Message]] = []
+
+    async def achat_complete_with_tools(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        tools: Sequence[Mapping[str, Any]],
+        temperature: float = 0.0,
+        estimated_tokens: Optional[int] = None,
+    ) -> ChatCompletion:
+        self.received.append(list(messages))
+        return cast(ChatCompletion, self.responses.pop(0))
+
+    async def astream_chat_complete_with_tools(
+        self,
+        messages: Sequence[Message],
+        model: Model,
+        tools: Sequence[Mapping[str, Any]],
+        temperature: float = 0.0,
+        estimated_tokens: Optional[int] = None,
+    ) -> AsyncIterator[ChatCompletionChunk]:
+        self.received.append(list(messages))
+        return stream_chunks(cast(Sequence[ChatCompletionChunk], self.responses.pop(0)))
+
+
+class EchoTool(Tool):
+    def __init__(self) -> None:
+        super().__init__(
+            name="Echo",
+            description="Echoes the text.",
+            params=[
+                ToolParam(
+                    name="text",
+                    type="string",
+                    description="Text to echo.",
+                    required=True,
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([json_query["text"]])
+
+
+class SleepTool(Tool):
+    def __init__(self) -> None:
+        super().__init__(
+            name="Sleep",
+            description="Sleeps for a number of seconds.",
+            params=[
+                ToolParam(
+                    name="seconds",
+                    type="number",
+                    description="Seconds to sleep.",
+                    required=True,
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        raise NotImplementedError
+
+    async def _arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        await asyncio.sleep(json_query["seconds"])
+        return self.to_result([f"slept {json_query['seconds']}"])
+
+
+@fixture
+def history() -> ConversationHistory:
+    return ConversationHistory()
+
+
+@fixture
+def scripted_wrapper() -> ScriptedOpenaiWrapper:
+    return ScriptedOpenaiWrapper(
+        [
+            build_chat_completion(
+                tool_calls=[("echo", {"text": "hello", "reasoning": "Need an echo."})]
+            ),
+            build_chat_completion(content="The echo said hello."),
+        ]
+    )
+
+
+def test_agent_areply_to_calls_tool_and_answers(
+    scripted_wrapper: ScriptedOpenaiWrapper, history: ConversationHistory
+) -> None:
+    agent = NeatAgent(
+        openai_wrapper=scripted_wrapper, tools=[EchoTool()], history=history
+    )
+
+    async def collect() -> list[NeatAgentOutput]:
+        return [output async for output in agent.areply_to("Echo hello.")]
+
+    outputs = asyncio.run(collect())
+
+    assert [o.type for o in outputs] == ["thought", "function_call", "answer"]
+    assert outputs[0].text == "Need an echo."
+    assert outputs[1].text is not None and "hello" in outputs[1].text
+    assert outputs[-1].text == "The echo said hello."
+    assert [m.role for m in history.get()] == ["user", "assistant"]
+    assert "hello" in scripted_wrapper.received[-1][-1].content
+
+
+def test_agent_reply_to_matches_async_path(
+    scripted_wrapper: ScriptedOpenaiWrapper, history: ConversationHistory
+) -> None:
+    agent = NeatAgent(
+        openai_wrapper=scripted_wrapper, tools=[EchoTool()], history=history
+    )
+
+    outputs = list(agent.reply_to("Echo hello."))
+
+    assert [o.type for o in outputs] == ["thought", "function_call", "answer"]
+    assert outputs[-1].text == "The echo said hello."
+
+
+def test_agent_runs_tool_calls_of_one_turn_concurrently(
+    history: ConversationHistory,
+) -> None:
+    wrapper = ScriptedOpenaiWrapper(
+        [
+            build_chat_completion(
+                tool_calls=[
+                    ("sleep", {"seconds": 0.2, "reasoning": "slow"}),
+                    ("sleep", {"seconds": 0.05, "reasoning": "fast"}),
+                    ("sleep", {"seconds": 5, "reasoning": "hangs"}),
+                    ("echo", {"reasoning": "missing argument"}),
+                ]
+            ),
+            build_chat_completion(content="Done."),
+        ]
+    )
+    agent = NeatAgent(
+        openai_wrapper=wrapper,
+        tools=[SleepTool(), EchoTool()],
+        history=history,
+        tool_timeout=0.3,
+    )
+
+    outputs = list(agent.reply_to("Sleep."))
+
+    function_calls = [o.text or "" for o in outputs if o.type == "function_call"]
+    assert "slept 0.05" in function_calls[1]
+    assert "slept 0.2" in function_calls[2]
+    assert "timed out" in function_calls[3]
+    tool_message = wrapper.received[-1][-1].content
+    assert (
+        tool_message.index("slept 0.2")
+        < tool_message.index("slept 0.05")
+        < tool_message.index("timed out")
+        < tool_message.index("Tool run failed: ValueError")
+    )
+    assert outputs[-1].text == "Done."
+
+
+def test_agent_counts_each_message_once(
+    scripted_wrapper: ScriptedOpenaiWrapper, history: ConversationHistory
+) -> None:
+    counted: list[Message] = []
+    count_message_tokens = scripted_wrapper.count_message_tokens
+
+    def counting(message: Message, model: Model) -> int:
+        counted.append(message)
+        return count_message_tokens(message, model)
+
+    scripted_wrapper.count_message_tokens = counting  # type: ignore
+    agent = NeatAgent(
+        openai_wrapper=scripted_wrapper, tools=[EchoTool()], history=history
+    )
+
+    outputs = list(agent.reply_to("Echo hello."))
+
+    final_prompt = scripted_wrapper.received[-1]
+    assert len(counted) == len(final_prompt)
+    assert (
+        outputs[-1].prompt_tokens
+        == sum(count_message_tokens(m, Model.GPT_4) for m in final_prompt) + 2
+    )
+
+
+def test_agent_reports_evicted_messages(history: ConversationHistory) -> None:
+    wrapper = ScriptedOpenaiWrapper(
+        [
+            build_chat_completion(
+                tool_calls=[("echo", {"text": "word " * 200, "reasoning": "Echo."})]
+            ),
+            build_chat_completion(content="Done."),
+        ]
+    )
+    agent = NeatAgent(
+        openai_wrapper=wrapper,
+        tools=[EchoTool()],
+        history=history,
+        context_budget=ContextBudget(
+            max_context_tokens=500,
+            reserved_completion_tokens=100,
+            tool_schema_overhead_tokens=0,
+        ),
+        eviction_policy=LargestToolResultFirstEviction(),
+    )
+
+    outputs = list(agent.reply_to("Echo."))
+
+    evictions = [o for o in outputs if o.type == "context_eviction"]
+    assert len(evictions) == 1
+    assert evictions[0].evicted_messages is not None
+    assert [m.role for m in evictions[0].evicted_messages] == ["user", "assistant"]
+    assert evictions[0].prompt_tokens is not None
+    assert evictions[0].prompt_tokens <= agent.prompt_budget
+
+
+def test_agent_streams_answer_deltas(history: ConversationHistory) -> None:
+    arguments = json.dumps({"text": "hello", "reasoning": "Need an echo."})
+    wrapper = ScriptedOpenaiWrapper(
+        [
+            [
+                build_chat_completion_chunk(
+                    {
+                        "role": "assistant",
+                        "tool_calls": [
+                            {
+                                "index": 0,
+                                "id": "call_0",
+                                "type": "function",
+                                "function": {"name": "echo", "arguments": ""},
+                            }
+                        ],
+                    }
+                ),
+                build_chat_completion_chunk(
+                    {
+                        "tool_calls": [
+                            {"index": 0, "function": {"arguments": arguments[:10]}}
+                        ]
+                    }
+                ),
+                build_chat_completion_chunk(
+                    {
+                        "tool_calls": [
+                            {"index": 0, "function": {"arguments": arguments[10:]}}
+                        ]
+                    }
+                ),
+            ],
+            [
+                build_chat_completion_chunk({"role": "assistant", "content": "The "}),
+                build_chat_completion_chunk({"content": "echo said "}),
+                build_chat_completion_chunk({"content": "hello."}),
+            ],
+        ]
+    )
+    agent = NeatAgent(
+        openai_wrapper=wrapper, tools=[EchoTool()], history=history, stream=True
+    )
+
+    outputs = list(agent.reply_to("Echo hello."))
+
+    assert [o.type for o in outputs] == [
+        "thought",
+        "function_call",
+        "answer_delta",
+        "answer_delta",
+        "answer_delta",
+        "answer",
+    ]
+    assert outputs[0].text == "Need an echo."
+    assert "".join(o.text or "" for o in outputs if o.type == "answer_delta") == (
+        outputs[-1].text
+    )
+    assert outputs[-1].text == "The echo said hello."
+
+
+def test_agent_resets_streamed_content_that_comes_with_tool_calls(
+    history: ConversationHistory,
+) -> None:
+    arguments = json.dumps({"text": "hello", "reasoning": "Need an echo."})
+    wrapper = ScriptedOpenaiWrapper(
+        [
+            [
+                build_chat_completion_chunk({"role": "assistant", "content": "Let "}),
+                build_chat_completion_chunk({"content": "me check."}),
+                build_chat_completion_chunk(
+                    {
+                        "tool_calls": [
+                            {
+                                "index": 0,
+                                "id": "call_0",
+                                "type": "function",
+                                "function": {"name": "echo", "arguments": arguments},
+                            }
+                        ]
+                    }
+                ),
+            ],
+            [build_chat_completion_chunk({"role": "assistant", "content": "Hello."})],
+        ]
+    )
+    agent = NeatAgent(
+        openai_wrapper=wrapper, tools=[EchoTool()], history=history, stream=True
+    )
+
+    outputs = list(agent.reply_to("Echo hello."))
+
+    assert [o.type for o in outputs] == [
+        "answer_delta",
+        "answer_delta",
+        "answer_reset",
+        "thought",
+        "function_call",
+        "answer_delta",
+        "answer",
+    ]
+    assert outputs[-1].text == "Hello."
@@ -0,0 +1,58 @@
+from typing import Sequence
+
+from pytest import fixture
+
+from neat_ai_assistant import (
+    KeepFirstUserTurnEviction,
+    LargestToolResultFirstEviction,
+    Message,
+    OldestFirstEviction,
+)
+
+
+@fixture
+def messages() -> Sequence[Message]:
+    return [
+        Message(role="system", content="system"),
+        Message(role="user", content="first question"),
+        Message(role="assistant", content="call a tool"),
+        Message(role="user", content="huge tool result"),
+        Message(role="assistant", content="call another tool"),
+        Message(role="user", content="latest question"),
+    ]
+
+
+@fixture
+def token_counts() -> Sequence[int]:
+    return [10, 20, 15, 500, 15, 30]
+
+
+def test_oldest_first_eviction_drops_first_turn(
+    messages: Sequence[Message], token_counts: Sequence[int]
+) -> None:
+    assert OldestFirstEviction().select(messages, token_counts) == 1
+
+
+def test_largest_tool_result_first_eviction_drops_largest_user_message(
+    messages: Sequence[Message], token_counts: Sequence[int]
+) -> None:
+    assert LargestToolResultFirstEviction().select(messages, token_counts) == 3
+
+
+def test_keep_first_user_turn_eviction_skips_first_turn(
+    messages: Sequence[Message], token_counts: Sequence[int]
+) -> None:
+    assert KeepFirstUserTurnEviction().select(messages, token_counts) == 2
+
+
+def test_eviction_policies_never_drop_system_or_latest_message() -> None:
+    messages = [
+        Message(role="system", content="system"),
+        Message(role="user", content="latest question"),
+    ]
+    for policy in [
+        OldestFirstEviction(),
+        LargestToolResultFirstEviction(),
+        KeepFirstUserTurnEviction(),
+    ]:
+        assert policy.select(messages, [10, 10]) is None
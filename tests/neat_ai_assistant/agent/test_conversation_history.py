@@ -0,0 +1,41 @@
+from neat_ai_assistant import ConversationHistory, Message, QueryConversationHistoryTool
+
+
+def build_history(n: int, max_messages: int | None = None) -> ConversationHistory:
+    history = ConversationHistory(max_messages=max_messages)
+    history.add_message(Message(role="user", content="My dog is called Bruno."))
+    history.add_message(Message(role="assistant", content="Bruno is a great name!"))
+    for i in range(n):
+        history.add_message(
+            Message(role="user", content=f"Tell me fact number {i} about the weather.")
+        )
+    return history
+
+
+def test_history_search_ranks_relevant_messages_first() -> None:
+    history = build_history(1_000)
+    history.add_message(Message(role="user", content="Remember that Bruno likes cats."))
+
+    results = history.search_as_string_list("What does Bruno like?", n=2)
+
+    assert len(results) == 2
+    assert results[0] == "user: Remember that Bruno likes cats."
+
+
+def test_history_search_forgets_evicted_messages() -> None:
+    history = build_history(10, max_messages=10)
+
+    assert history.search("Bruno", n=5) == []
+    assert len(history.search("weather fact", n=5)) == 5
+
+
+def test_query_conversation_history_tool_supports_search() -> None:
+    history = ConversationHistory()
+    history.add_message(Message(role="user", content="My dog is called Bruno."))
+    history.add_message(Message(role="user", content="It is sunny today."))
+    tool = QueryConversationHistoryTool(history=history)
+
+    assert tool.run({"n": 1, "query": "dog name"}).results == [
+        "user: My dog is called Bruno."
+    ]
+    assert tool.run({"n": 1}).results == ["user: It is sunny today."]
@@ -0,0 +1,172 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Sequence
+
+from helpers import AgentFactory
+from pytest import fixture, raises
+
+from neat_ai_assistant import (
+    ConversationHistory,
+    Message,
+    QueryConversationHistoryTool,
+    ScriptedBackend,
+    ScriptedReply,
+    SQLiteHistoryDatabase,
+    SQLiteHistoryStorage,
+)
+
+
+class ThreadRecordingStorage(SQLiteHistoryStorage):
+    """Remembers the threads it was used from."""
+
+    def __init__(self, database: SQLiteHistoryDatabase, session_id: str) -> None:
+        super().__init__(database, session_id)
+        self.thread_ids: set[int] = set()
+
+    def append(self, messages: Sequence[Message]) -> None:
+        self.thread_ids.add(threading.get_ident())
+        super().append(messages)
+
+    def get_tail(self, n: int) -> Sequence[Message]:
+        self.thread_ids.add(threading.get_ident())
+        return super().get_tail(n)
+
+
+@fixture
+def database(tmp_path: Path) -> SQLiteHistoryDatabase:
+    return SQLiteHistoryDatabase(tmp_path / "history.db")
+
+
+def test_sqlite_history_persists_across_instances(tmp_path: Path) -> None:
+    history = ConversationHistory(
+        storage=SQLiteHistoryStorage(
+            SQLiteHistoryDatabase(tmp_path / "history.db"), session_id="a"
+        )
+    )
+    for i in range(5):
+        history.add_message(Message(role="user", content=f"message {i}"))
+
+    reopened = ConversationHistory(
+        storage=SQLiteHistoryStorage(
+            SQLiteHistoryDatabase(tmp_path / "history.db"), session_id="a"
+        )
+    )
+
+    assert reopened.get_as_string_list(2) == ["user: message 3", "user: message 4"]
+    assert len(reopened.get()) == 5
+
+
+def test_sqlite_history_batches_writes_and_separates_sessions(
+    database: SQLiteHistoryDatabase,
+) -> None:
+    storage_a = SQLiteHistoryStorage(database, session_id="a", batch_size=3)
+    storage_b = SQLiteHistoryStorage(database, session_id="b")
+
+    storage_a.append([Message(role="user", content="a0")])
+    storage_a.append([Message(role="assistant", content="a1")])
+    storage_b.append([Message(role="user", content="b0")])
+
+    assert SQLiteHistoryStorage(database, session_id="a").get_all() == []
+    assert len(storage_a) == 2
+    assert [m.content for m in storage_a.get_all()] == ["a0", "a1"]
+    assert [m.content for m in storage_b.get_all()] == ["b0"]
+
+
+def test_sqlite_history_enforces_limits(database: SQLiteHistoryDatabase) -> None:
+    history = ConversationHistory(
+        max_messages=2, storage=SQLiteHistoryStorage(database, session_id="a")
+    )
+    for i in range(4):
+        history.add_message(Message(role="user", content=f"message {i}"))
+
+    assert [m.content for m in history.get()] == ["message 2", "message 3"]
+    assert len(history.storage) == 2
+
+
+def test_sqlite_history_limits_cover_messages_of_all_instances(
+    database: SQLiteHistoryDatabase,
+) -> None:
+    histories = [
+        ConversationHistory(
+            max_messages=3,
+            max_tokens=5,
+            token_counter=lambda m: len(m.content.split()),
+            storage=SQLiteHistoryStorage(database, session_id="a"),
+        )
+        for _ in range(2)
+    ]
+    for i in range(6):
+        histories[i % 2].add_message(Message(role="user", content=f"message {i}"))
+
+    assert [m.content for m in histories[0].get()] == ["message 4", "message 5"]
+    histories[0].add_message(Message(role="user", content="hello"))
+    assert [m.content for m in histories[1].get()] == [
+        "message 4",
+        "message 5",
+        "hello",
+    ]
+    histories[1].add_message(Message(role="user", content="bye"))
+
+    assert [m.content for m in histories[0].get()] == ["message 5", "hello", "bye"]
+
+
+def test_sqlite_history_search_covers_messages_of_all_instances(
+    database: SQLiteHistoryDatabase,
+) -> None:
+    history_a, history_b = [
+        ConversationHistory(
+            max_messages=3, storage=SQLiteHistoryStorage(database, session_id="a")
+        )
+        for _ in range(2)
+    ]
+    for i, fruit in enumerate(["apple", "banana", "cherry", "date"]):
+        (history_a, history_b)[i % 2].add_message(
+            Message(role="user", content=f"I like {fruit}.")
+        )
+
+    assert history_a.search("apple", n=1) == []
+    assert history_a.search_as_string_list("date", n=1) == ["user: I like date."]
+    assert history_b.search_as_string_list("banana", n=1) == ["user: I like banana."]
+
+
+def test_sqlite_history_keeps_a_batch_whose_write_failed(
+    database: SQLiteHistoryDatabase,
+) -> None:
+    storage = SQLiteHistoryStorage(database, session_id="a", batch_size=2)
+    database.connection.execute(
+        "CREATE TRIGGER fail BEFORE INSERT ON messages BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+    storage.append([Message(role="user", content="a0")])
+    with raises(sqlite3.IntegrityError):
+        storage.append([Message(role="assistant", content="a1")])
+
+    database.connection.execute("DROP TRIGGER fail")
+    storage.append([Message(role="user", content="a2")])
+    storage.flush()
+
+    assert [m.content for m in storage.get_all()] == ["a0", "a1", "a2"]
+
+
+def test_agent_uses_persistent_history_off_the_event_loop(
+    build_agent: AgentFactory, database: SQLiteHistoryDatabase
+) -> None:
+    storage = ThreadRecordingStorage(database, session_id="a")
+    history = ConversationHistory(storage=storage)
+    storage.thread_ids.clear()
+    agent = build_agent(
+        ScriptedBackend(
+            [
+                ScriptedReply(tool_calls=[("retrieve_conversation_history", {"n": 2})]),
+                ScriptedReply(content="Nothing was said yet."),
+            ]
+        ),
+        [QueryConversationHistoryTool(history)],
+        history=history,
+    )
+
+    outputs = list(agent.reply_to("What did I say?"))
+
+    assert storage.thread_ids and threading.get_ident() not in storage.thread_ids
+    assert outputs[-1].text == "Nothing was said yet."
+    assert len(history.get()) == 2
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from typing import Any, Mapping, Sequence
+
+from helpers import AgentFactory
+from openai.types.chat import ChatCompletion
+from pytest import mark, raises
+
+from neat_ai_assistant import (
+    ReplyLimits,
+    RunCancelledError,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+)
+from neat_ai_assistant.agent.tool import ToolResult
+from neat_ai_assistant.llm.backends import ChatRequest
+
+SEARCH_CALL = ("search", {"text": "weather in Paris"})
+
+
+class SlowToolCallsBackend(ScriptedBackend):
+    """Takes `tool_latency_seconds` only for requests that offer tools, so final answers are quick."""
+
+    def __init__(
+        self, replies: Sequence[ScriptedReply], tool_latency_seconds: float
+    ) -> None:
+        super().__init__(replies)
+        self.tool_latency_seconds = tool_latency_seconds
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        if request.tools:
+            await asyncio.sleep(self.tool_latency_seconds)
+        return await super().acomplete(request)
+
+
+class SearchTool(Tool):
+    """Counts its runs, and takes `latency_seconds` for each."""
+
+    def __init__(self, latency_seconds: float = 0.0) -> None:
+        super().__init__(
+            name="Search",
+            description="Searches.",
+            params=[
+                ToolParam(
+                    name="text", type="string", description="Text.", required=True
+                )
+            ],
+        )
+        self.latency_seconds = latency_seconds
+        self.runs = 0
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        raise NotImplementedError
+
+    async def _arun(self, json_query: Mapping[str, Any]) -> ToolResult:
+        self.runs += 1
+        await asyncio.sleep(self.latency_seconds)
+        return self.to_result([f"Results for {json_query['text']}."])
+
+
+def test_repeated_tool_calls_are_served_from_the_memo_until_the_answer_is_forced(
+    build_agent: AgentFactory,
+) -> None:
+    backend = ScriptedBackend(
+        [
+            ScriptedReply(tool_calls=[SEARCH_CALL, SEARCH_CALL]),
+            ScriptedReply(tool_calls=[SEARCH_CALL]),
+            ScriptedReply(tool_calls=[SEARCH_CALL]),
+            ScriptedReply(content="It is sunny."),
+        ]
+    )
+    tool = SearchTool()
+    agent = build_agent(backend, [tool])
+
+    outputs = list(agent.reply_to("What is the weather in Paris?"))
+
+    assert tool.runs == 1
+    assert [o.type for o in outputs].count("function_call") == 4
+    assert outputs[-2].type == "limit_reached"
+    assert "repeated_tool_calls" in (outputs[-2].text or "")
+    assert outputs[-1].text == "It is sunny."
+    assert [r.tools is None for r in backend.requests] == [False, False, False, True]
+    assert "no time left" in backend.requests[-1].messages[-1]["content"]
+
+
+def test_max_iterations_and_tokens_force_a_final_answer(
+    build_agent: AgentFactory,
+) -> None:
+    replies = [
+        ScriptedReply(tool_calls=[SEARCH_CALL]),
+        ScriptedReply(content="Probably sunny."),
+    ]
+    backend = ScriptedBackend(replies)
+    agent = build_agent(backend, [SearchTool()], limits=ReplyLimits(max_iterations=2))
+
+    outputs = list(agent.reply_to("What is the weather in Paris?"))
+
+    assert outputs[-1].text == "Probably sunny."
+    assert "max_iterations" in (outputs[-2].text or "")
+    assert backend.requests[1].tools is None
+
+    # limits given with the request override those of the agent
+    backend = ScriptedBackend(replies)
+    agent = build_agent(backend, [SearchTool()])
+    outputs = list(
+        agent.reply_to(
+            "What is the weather in Paris?", limits=ReplyLimits(max_total_tokens=1)
+        )
+    )
+
+    assert "max_total_tokens" in (outputs[-2].text or "")
+    assert len(backend.requests) == 2
+    assert agent.history.get_as_string_list(n=10) != []
+
+
+def test_deadline_cuts_tool_runs_short_and_still_answers(
+    build_agent: AgentFactory,
+) -> None:
+    backend = ScriptedBackend(
+        [
+            ScriptedReply(tool_calls=[SEARCH_CALL]),
+            ScriptedReply(content="No results in time."),
+        ]
+    )
+    agent = build_agent(
+        backend,
+        [SearchTool(latency_seconds=5)],
+        limits=ReplyLimits(deadline_seconds=0.2, final_answer_seconds=0.1),
+    )
+
+    started_at = time.monotonic()
+    outputs = list(agent.reply_to("What is the weather in Paris?"))
+
+    assert time.monotonic() - started_at < 1
+    assert "timed out" in (outputs[1].text or "")
+    assert "deadline" in (outputs[2].text or "")
+    assert outputs[-1].text == "No results in time."
+
+
+def test_deadline_cuts_a_slow_llm_call_short_for_the_final_answer(
+    build_agent: AgentFactory,
+) -> None:
+    backend = SlowToolCallsBackend(
+        [ScriptedReply(content="Answered in time.")], tool_latency_seconds=5
+    )
+    agent = build_agent(
+        backend,
+        [SearchTool()],
+        limits=ReplyLimits(deadline_seconds=0.2, final_answer_seconds=0.1),
+    )
+
+    started_at = time.monotonic()
+    outputs = list(agent.reply_to("What is the weather in Paris?"))
+
+    assert time.monotonic() - started_at < 1
+    assert [o.type for o in outputs] == ["limit_reached", "answer"]
+    assert outputs[-1].text == "Answered in time."
+    # the unanswered prompt was replaced by the one asking for the final answer
+    final_request = backend.requests[-1]
+    assert final_request.tools is None and len(final_request.messages) == 2
+    assert "no time left" in final_request.messages[-1]["content"]
+
+
+@mark.parametrize("stream", [False, True])
+def test_final_answer_past_the_deadline_fails_the_reply(
+    build_agent: AgentFactory, stream: bool
+) -> None:
+    backend = ScriptedBackend([ScriptedReply(content="Too late.")], latency_seconds=5)
+    agent = build_agent(
+        backend,
+        [SearchTool()],
+        limits=ReplyLimits(
+            deadline_seconds=0.1, final_answer_seconds=0.1, max_iterations=1
+        ),
+        stream=stream,
+    )
+
+    started_at = time.monotonic()
+    with raises(RunCancelledError, match="deadline exceeded"):
+        list(agent.reply_to("What is the weather in Paris?"))
+
+    assert time.monotonic() - started_at < 1
+    assert agent.history.get_as_string_list(n=10) == []
+
+
+def test_default_limits_do_not_cap_iterations_and_are_not_shared(
+    build_agent: AgentFactory,
+) -> None:
+    backend = ScriptedBackend(
+        [
+            *[
+                ScriptedReply(tool_calls=[("search", {"text": f"page {i}"})])
+                for i in range(12)
+            ],
+            ScriptedReply(content="It is sunny."),
+        ]
+    )
+    agent = build_agent(backend, [SearchTool()])
+
+    outputs = list(agent.reply_to("What is the weather in Paris?"))
+
+    assert "limit_reached" not in [o.type for o in outputs]
+    assert outputs[-1].text == "It is sunny."
+    other_agent = build_agent(backend, [SearchTool()])
+    assert other_agent.limits is not agent.limits
+    assert other_agent.eviction_policy is not agent.eviction_policy
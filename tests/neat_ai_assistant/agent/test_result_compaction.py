@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any, Mapping
+
+from helpers import WordCountingOpenaiWrapper
+
+from neat_ai_assistant import (
+    ConversationHistory,
+    NeatAgent,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+    ToolResultCompactor,
+)
+from neat_ai_assistant.agent.result_compaction import OMISSION_MARKER, split_into_chunks
+from neat_ai_assistant.agent.tool import ToolResult
+
+FILLER = "The company also sponsors a local football club and a choir."
+PAGE = "\n\n".join(
+    [
+        "ACME annual report",
+        *[FILLER] * 5,
+        "Revenue grew by 12 percent to 3 billion dollars in 2023.",
+        *[FILLER] * 5,
+    ]
+)
+
+
+class ReportTool(Tool):
+    def __init__(self) -> None:
+        super().__init__(
+            name="Report",
+            description="Retrieves annual reports.",
+            params=[
+                ToolParam(
+                    name="company",
+                    type="string",
+                    description="Company.",
+                    required=True,
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([PAGE])
+
+
+def build_compactor(summary: str = "Unused.", **kwargs: Any) -> ToolResultCompactor:
+    backend = ScriptedBackend([ScriptedReply(content=summary)])
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend)
+    return ToolResultCompactor(openai_wrapper, chunk_chars=80, **kwargs)
+
+
+def test_split_into_chunks_merges_paragraphs_and_splits_sentences() -> None:
+    text = "Short one.\n\nShort two.\n\n" + "A long sentence goes on. " * 4
+
+    assert split_into_chunks(text, 30) == [
+        "Short one.\n\nShort two.",
+        "A long sentence goes on.",
+        "A long sentence goes on.",
+        "A long sentence goes on.",
+        "A long sentence goes on.",
+    ]
+
+
+def test_small_and_final_results_are_kept() -> None:
+    compactor = build_compactor(max_tokens_per_tool=5)
+    small = ToolResult(source="Report", results=["Revenue grew."])
+    final = ToolResult(source="Report", results=[PAGE], final=True)
+
+    assert asyncio.run(compactor.acompact("revenue", small)) is small
+    assert asyncio.run(compactor.acompact("revenue", final)) is final
+
+
+def test_extraction_keeps_relevant_chunks_in_order_within_budget() -> None:
+    compactor = build_compactor(max_tokens_per_tool=30)
+    result = ToolResult(source="Report", results=[PAGE, FILLER])
+
+    compacted = asyncio.run(compactor.acompact("ACME revenue 2023", result))
+
+    assert compacted.source == "Report"
+    [text] = compacted.results
+    assert text.startswith("ACME annual report")
+    assert "Revenue grew by 12 percent" in text
+    assert OMISSION_MARKER in text
+    assert len(text.split()) <= 30 + text.count(OMISSION_MARKER)
+
+
+def test_summaries_replace_large_results_unless_they_do_not_fit() -> None:
+    result = ToolResult(source="Report", results=[PAGE])
+    summarizing = build_compactor(
+        "ACME revenue grew 12% to $3bn in 2023.",
+        max_tokens_per_tool=30,
+        summarize_above_tokens=50,
+    )
+    too_long = build_compactor(PAGE, max_tokens_per_tool=30, summarize_above_tokens=50)
+
+    summarized = asyncio.run(summarizing.acompact("ACME revenue", result))
+    extracted = asyncio.run(too_long.acompact("ACME revenue", result))
+
+    assert summarized.results == ["ACME revenue grew 12% to $3bn in 2023."]
+    assert "Revenue grew by 12 percent" in extracted.results[0]
+    assert OMISSION_MARKER in extracted.results[0]
+
+
+def test_agent_feeds_compacted_results_back_to_the_model() -> None:
+    backend = ScriptedBackend(
+        [
+            ScriptedReply(tool_calls=[("report", {"company": "ACME"})]),
+            ScriptedReply(content="Revenue grew by 12 percent."),
+        ]
+    )
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend)
+    agent = NeatAgent(
+        openai_wrapper=openai_wrapper,
+        tools=[ReportTool()],
+        history=ConversationHistory(),
+        require_reasoning=False,
+        result_compactor=ToolResultCompactor(
+            openai_wrapper, max_tokens_per_tool=30, chunk_chars=80
+        ),
+    )
+
+    list(agent.reply_to("How much did the revenue grow?"))
+
+    prompt = backend.requests[1].messages[-1]["content"]
+    assert "Revenue grew by 12 percent" in prompt
+    assert prompt.count(FILLER) < 5
@@ -0,0 +1,82 @@
+import asyncio
+
+from pytest import raises
+
+from neat_ai_assistant import MetricsRegistry, RunQueueFullError, RunScheduler
+from neat_ai_assistant.agent.run_scheduler import RunTicket
+
+
+def test_scheduler_bounds_running_and_queued_runs() -> None:
+    async def scenario() -> None:
+        scheduler = RunScheduler(max_concurrent_runs=2, max_queued_runs=1)
+        first = scheduler.enqueue("a")
+        second = scheduler.enqueue("b")
+        third = scheduler.enqueue("c")
+
+        assert first.admitted and second.admitted and not third.admitted
+        assert (scheduler.running, scheduler.queued) == (2, 1)
+        with raises(RunQueueFullError) as e:
+            scheduler.enqueue("d")
+        assert 1 <= e.value.retry_after_seconds <= 60
+
+        first.release()
+        first.release()
+        await asyncio.wait_for(third.wait(), timeout=1)
+        assert (scheduler.running, scheduler.queued) == (2, 0)
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_admits_sessions_round_robin() -> None:
+    async def scenario() -> None:
+        scheduler = RunScheduler(max_concurrent_runs=1)
+        admitted: list[str] = []
+
+        async def run(ticket: RunTicket, name: str) -> None:
+            async with ticket:
+                admitted.append(name)
+                await asyncio.sleep(0)
+
+        tickets = [
+            (scheduler.enqueue(session_id), name)
+            for session_id, name in [("a", "a1"), ("a", "a2"), ("a", "a3")]
+        ]
+        tickets.append((scheduler.enqueue("b"), "b1"))
+        await asyncio.gather(*(run(t, name) for t, name in tickets))
+
+        assert admitted == ["a1", "a2", "b1", "a3"]
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_limits_queued_runs_per_session_and_exports_metrics() -> None:
+    async def scenario() -> None:
+        registry = MetricsRegistry()
+        scheduler = RunScheduler(
+            max_concurrent_runs=1,
+            max_queued_runs_per_session=1,
+            metrics_registry=registry,
+        )
+        running = scheduler.enqueue("a")
+        waiting = scheduler.enqueue("a")
+        with raises(RunQueueFullError):
+            scheduler.enqueue("a")
+        other = scheduler.enqueue("b")
+
+        # a waiter that gives up leaves the queue
+        wait = asyncio.ensure_future(waiting.wait())
+        await asyncio.sleep(0)
+        wait.cancel()
+        await asyncio.gather(wait, return_exceptions=True)
+        assert scheduler.queued == 1
+
+        metrics = registry.render()
+        assert "neat_run_queue_depth 1.0" in metrics
+        assert "neat_running_runs 1.0" in metrics
+        assert 'neat_run_rejections_total{reason="session_queue_full"} 1.0' in metrics
+
+        running.release()
+        assert other.admitted
+        assert "neat_run_queue_wait_seconds_count 2" in registry.render()
+
+    asyncio.run(scenario())
@@ -0,0 +1,69 @@
+import time
+
+from helpers import WordCountingOpenaiWrapper
+from pytest import fixture
+
+from neat_ai_assistant import Message, OpenaiWrapper, SessionManager
+
+
+@fixture
+def openai_wrapper() -> OpenaiWrapper:
+    return WordCountingOpenaiWrapper()
+
+
+def test_session_manager_isolates_histories(openai_wrapper: OpenaiWrapper) -> None:
+    sessions = SessionManager(openai_wrapper=openai_wrapper, tools=[])
+
+    sessions.get_history("a").add_message(Message(role="user", content="hi a"))
+
+    assert len(sessions.get_history("a").get()) == 1
+    assert len(sessions.get_history("b").get()) == 0
+    assert sessions.get_agent("a").history is sessions.get_history("a")
+    assert (
+        sessions.get_agent("a").openai_wrapper is sessions.get_agent("b").openai_wrapper
+    )
+    history_tool = sessions.get_agent("a").tools[-1]
+    assert history_tool.history is sessions.get_history("a")  # type: ignore
+
+
+def test_session_manager_evicts_least_recently_used(
+    openai_wrapper: OpenaiWrapper,
+) -> None:
+    sessions = SessionManager(openai_wrapper=openai_wrapper, tools=[], max_sessions=2)
+
+    sessions.get_agent("a")
+    sessions.get_agent("b")
+    sessions.get_agent("a")
+    sessions.get_agent("c")
+
+    assert "a" in sessions and "c" in sessions
+    assert "b" not in sessions
+
+
+def test_session_manager_evicts_idle_sessions(openai_wrapper: OpenaiWrapper) -> None:
+    sessions = SessionManager(
+        openai_wrapper=openai_wrapper, tools=[], idle_ttl_seconds=0.01
+    )
+
+    sessions.get_agent("a")
+    time.sleep(0.02)
+
+    assert sessions.evict_idle() == 1
+    assert len(sessions) == 0
+
+
+def test_session_history_is_bounded(openai_wrapper: OpenaiWrapper) -> None:
+    sessions = SessionManager(
+        openai_wrapper=openai_wrapper,
+        tools=[],
+        max_messages_per_session=3,
+        max_tokens_per_session=25,
+    )
+    history = sessions.get_history("a")
+
+    for i in range(5):
+        history.add_message(Message(role="user", content=f"message {i}"))
+    assert [m.content for m in history.get()] == ["message 2", "message 3", "message 4"]
+
+    history.add_message(Message(role="user", content="a much longer message " * 2))
+    assert len(history.get()) == 2
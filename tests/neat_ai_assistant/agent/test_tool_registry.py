@@ -0,0 +1,101 @@
+from typing import Any, Mapping, Sequence
+
+from helpers import AgentFactory
+from pytest import raises
+
+from neat_ai_assistant import (
+    KeywordToolSelector,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+    ToolRegistry,
+)
+from neat_ai_assistant.agent.tool import ToolResult
+
+
+class LookupTool(Tool):
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(
+            name=name,
+            description=description,
+            params=[
+                ToolParam(
+                    name="query", type="string", description="Query.", required=True
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([f"{self.name}: {json_query['query']}"])
+
+
+class ClockTool(LookupTool):
+    def __init__(self) -> None:
+        super().__init__("Clock", "Tells the time.")
+        self.calls = 0
+
+    def get_params(self) -> Sequence[ToolParam]:
+        self.calls += 1
+        return self.params
+
+
+def build_tools() -> list[Tool]:
+    return [
+        LookupTool("Weather Lookup", "Retrieves the weather forecast for a city."),
+        LookupTool("Stock Lookup", "Retrieves stock prices of a company."),
+        LookupTool("Web Search", "Searches the web for recent news."),
+        LookupTool("Webpage Retrieval", "Downloads the text of a webpage."),
+    ]
+
+
+def test_registry_dispatches_by_name_and_serialized_name() -> None:
+    tools = build_tools()
+    registry = ToolRegistry(tools)
+
+    assert registry.get("Stock Lookup") is tools[1]
+    assert registry.get("stock_lookup") is tools[1]
+    assert registry.get("unknown") is None
+    with raises(ValueError):
+        ToolRegistry([*tools, LookupTool("stock lookup", "Duplicate.")])
+
+
+def test_registry_caches_schemas_unless_params_are_per_call() -> None:
+    clock = ClockTool()
+    registry = ToolRegistry([*build_tools(), clock])
+
+    first = registry.serialize()
+    second = registry.serialize()
+
+    assert first == second
+    assert all(a is b for a, b in zip(first[:-1], second[:-1]))
+    assert clock.calls == 2
+
+
+def test_keyword_selector_keeps_registration_order_and_falls_back_to_all() -> None:
+    registry = ToolRegistry(build_tools())
+    selector = KeywordToolSelector(k=1, always_include=["Webpage Retrieval"])
+
+    selected = selector.select("What is the stock price of ACME?", registry)
+
+    assert [t.name for t in selected] == ["Stock Lookup", "Webpage Retrieval"]
+    assert selector.select("Hello there!", registry) == registry.tools
+
+
+def test_agent_offers_selected_tools_but_dispatches_any(
+    build_agent: AgentFactory,
+) -> None:
+    backend = ScriptedBackend(
+        [
+            ScriptedReply(tool_calls=[("web_search", {"query": "ACME"})]),
+            ScriptedReply(content="ACME is up."),
+        ]
+    )
+    agent = build_agent(backend, build_tools(), tool_selector=KeywordToolSelector(k=2))
+
+    outputs = list(agent.reply_to("How did the stock price of ACME develop?"))
+
+    offered = [t["function"]["name"] for t in backend.requests[0].tools or []]
+    assert offered == ["stock_lookup"]
+    assert "Web Search: ACME" in str(outputs[1].text)
+    assert outputs[-1].text == "ACME is up."
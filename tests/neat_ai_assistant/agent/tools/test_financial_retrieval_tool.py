@@ -0,0 +1,107 @@
+import json
+from typing import Any, Optional
+
+from pytest import raises
+
+from neat_ai_assistant import FinancialRetrievalTool, TokenBucket
+
+
+class FakeResponse:
+    def __init__(
+        self, payload: Optional[dict[str, Any]], status_code: int = 200
+    ) -> None:
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def json(self) -> dict[str, Any]:
+        if self.payload is None:
+            raise json.JSONDecodeError("Expecting value", "<html>", 0)
+        return self.payload
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.urls: list[str] = []
+
+    def get(self, url: str, timeout: Any) -> FakeResponse:
+        self.urls.append(url)
+        if "symbol=NOPE" in url:
+            return FakeResponse({"Error Message": "Invalid API call."})
+        if "symbol=DOWN" in url:
+            return FakeResponse(None, 503)
+        # newest bar first, like the API
+        return FakeResponse(
+            {
+                "Meta Data": {},
+                "Time Series (5min)": {
+                    "2023-11-20 10:10:00": bar(11, 13, 10, 12, 300),
+                    "2023-11-20 10:05:00": bar(10, 12, 9, 11, 200),
+                    "2023-11-20 10:00:00": bar(10, 11, 8, 10, 100),
+                },
+            }
+        )
+
+
+def bar(o: float, h: float, l: float, c: float, v: int) -> dict[str, str]:
+    return {
+        "1. open": str(o),
+        "2. high": str(h),
+        "3. low": str(l),
+        "4. close": str(c),
+        "5. volume": str(v),
+    }
+
+
+def test_financial_retrieval_summarizes_several_symbols_and_caches_them() -> None:
+    session = FakeSession()
+    tool = FinancialRetrievalTool("key", session=session)  # type: ignore[arg-type]
+
+    result = tool.run({"stock_trading_symbols": ["aapl", "MSFT", "AAPL", "nope"]})
+    tool.run({"stock_trading_symbols": ["AAPL"]})
+
+    assert len(session.urls) == 3
+    assert len(result.results) == 3
+    assert result.results[0] == (
+        "Symbol: AAPL\n"
+        "Period: 2023-11-20 10:00:00 to 2023-11-20 10:10:00 (3 bars of 5 minutes)\n"
+        "open_value: 10.0\n"
+        "close_value: 12.0\n"
+        "high_value: 13.0\n"
+        "low_value: 8.0\n"
+        "volume: 600\n"
+        "return: 20.0%"
+    )
+    assert result.results[2] == "Symbol: NOPE\nInvalid API call."
+
+
+def test_financial_retrieval_reports_failed_requests_and_invalid_symbols() -> None:
+    session = FakeSession()
+    tool = FinancialRetrievalTool("key", session=session)  # type: ignore[arg-type]
+
+    result = tool.run({"stock_trading_symbols": ["down"]})
+
+    assert result.results == ["Symbol: DOWN\nRequest failed with status 503."]
+    with raises(ValueError, match="list of strings"):
+        tool.run({"stock_trading_symbols": ["AAPL", 42]})
+    assert len(session.urls) == 1
+
+
+def test_financial_retrieval_queues_for_the_quota_only_so_long() -> None:
+    session = FakeSession()
+    tool = FinancialRetrievalTool(
+        "key",
+        rate_limiter=TokenBucket(rate=1 / 60, capacity=1),
+        max_queueing_seconds=1,
+        session=session,  # type: ignore[arg-type]
+    )
+
+    result = tool.run({"stock_trading_symbols": ["AAPL", "MSFT"]})
+
+    assert len(session.urls) == 1
+    assert result.results[1] == (
+        "Symbol: MSFT\n"
+        "Not requested, the API quota allows no further requests within 1 seconds."
+    )
+    # the skipped request gave its slot back
+    assert tool.rate_limiter.available_tokens > -0.5
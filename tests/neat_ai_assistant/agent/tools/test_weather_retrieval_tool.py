@@ -0,0 +1,177 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+from pytest import MonkeyPatch, fixture
+
+from neat_ai_assistant import WeatherRetrievalTool
+from neat_ai_assistant.agent.tools import weather_retrieval_tool
+from neat_ai_assistant.utils.cache import SQLiteCache
+
+PERIOD = weather_retrieval_tool.FORECAST_PERIOD_SECONDS
+
+
+class FakeLocation:
+    def __init__(self, latitude: float, longitude: float) -> None:
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class FakeGeolocator:
+    def __init__(self) -> None:
+        self.queries: list[str] = []
+
+    def geocode(self, query: str) -> Optional[FakeLocation]:
+        self.queries.append(query)
+        return FakeLocation(52.520008, 13.404954) if "berlin" in query.lower() else None
+
+
+class FakeResponse:
+    def __init__(self, payload: dict[str, Any], status_code: int = 200) -> None:
+        self.payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def json(self) -> dict[str, Any]:
+        return self.payload
+
+
+def build_forecast() -> dict[str, Any]:
+    return {
+        "city": {"name": "Berlin", "country": "DE", "sunrise": 0, "sunset": 0},
+        "list": [
+            {
+                "dt_txt": f"2023-11-20 {hour:02d}:00:00",
+                "main": {"temp": 273.15 + hour, "humidity": 80},
+                "weather": [{"description": "cloudy"}],
+                "wind": {"speed": 1.0, "deg": 90},
+            }
+            for hour in range(0, 24, 3)
+        ],
+    }
+
+
+@fixture
+def requested_urls(monkeypatch: MonkeyPatch) -> list[str]:
+    urls: list[str] = []
+
+    def fake_get(url: str, timeout: Any) -> FakeResponse:
+        assert timeout is not None
+        urls.append(url)
+        if "appid=invalid" in url:
+            return FakeResponse({"cod": 401, "message": "Invalid API key."}, 401)
+        return FakeResponse(build_forecast())
+
+    monkeypatch.setattr("requests.get", fake_get)
+    return urls
+
+
+def test_weather_retrieval_caches_geocoding_by_normalized_location(
+    tmp_path: Path,
+) -> None:
+    geolocator = FakeGeolocator()
+    tool = WeatherRetrievalTool(
+        "key",
+        geocode_cache=SQLiteCache(tmp_path / "geocode.db"),
+        geolocator=geolocator,
+    )
+
+    assert tool._get_coordinates("Berlin,Germany") == (52.520008, 13.404954)
+    assert tool._get_coordinates("  berlin ,  GERMANY") == (52.520008, 13.404954)
+    assert tool._get_coordinates("Atlantis") is None
+    assert geolocator.queries == ["Berlin,Germany", "Atlantis"]
+
+    restarted_tool = WeatherRetrievalTool(
+        "key",
+        geocode_cache=SQLiteCache(tmp_path / "geocode.db"),
+        geolocator=geolocator,
+    )
+    assert restarted_tool._get_coordinates("berlin, germany") == (52.520008, 13.404954)
+    assert len(geolocator.queries) == 2
+
+
+def test_weather_retrieval_caches_forecast_until_next_period(
+    requested_urls: list[str], monkeypatch: MonkeyPatch
+) -> None:
+    now = 1_000 * PERIOD + 10.0
+    monkeypatch.setattr("time.time", lambda: now)
+    tool = WeatherRetrievalTool("key", geolocator=FakeGeolocator())
+
+    tool._get_forecast(52.520008, 13.404954)
+    tool._get_forecast(52.521, 13.4049)
+    assert len(requested_urls) == 1
+    assert "lat=52.52&lon=13.4" in requested_urls[0]
+
+    now = 1_001 * PERIOD
+    tool._get_forecast(52.520008, 13.404954)
+    assert len(requested_urls) == 2
+
+
+def test_weather_retrieval_answers_several_times_in_one_call(
+    requested_urls: list[str],
+) -> None:
+    tool = WeatherRetrievalTool("key", geolocator=FakeGeolocator())
+
+    result = tool.run(
+        {
+            "location": "Berlin",
+            "datetimes": ["2023-11-20 07:00:00", "2023-11-20 22:30:00"],
+            "start_datetime": "2023-11-20 06:00:00",
+            "end_datetime": "2023-11-20 12:00:00",
+        }
+    )
+
+    assert len(requested_urls) == 1
+    assert len(result.results) == 3
+    assert "Date and time: 2023-11-20 06:00:00" in result.results[0]
+    assert "Date and time: 2023-11-20 21:00:00" in result.results[1]
+    assert "Temperature: 6.0°C to 12.0°C (mean 9.0°C)" in result.results[2]
+
+
+def test_weather_retrieval_reports_failed_requests_without_caching_them(
+    requested_urls: list[str],
+) -> None:
+    tool = WeatherRetrievalTool("invalid", geolocator=FakeGeolocator())
+
+    result = tool.run({"location": "Berlin"})
+    tool.run({"location": "Berlin"})
+
+    assert result.results == ["Location: Berlin\nInvalid API key."]
+    assert len(requested_urls) == 2
+
+
+def test_forecast_lookup_prefers_earlier_entry_on_tie() -> None:
+    forecast = weather_retrieval_tool._Forecast(build_forecast())
+
+    nearest = forecast.get_nearest(datetime(2023, 11, 20, 4, 30))
+    between = forecast.get_between(
+        datetime(2023, 11, 20, 4, 0), datetime(2023, 11, 20, 5, 0)
+    )
+
+    assert nearest["dt_txt"] == "2023-11-20 03:00:00"
+    assert [entry["dt_txt"] for entry in between] == ["2023-11-20 03:00:00"]
+
+
+def test_weather_retrieval_describes_current_hour_per_call(
+    monkeypatch: MonkeyPatch,
+) -> None:
+    class FakeDatetime(datetime):
+        current = datetime(2023, 11, 20, 9, 41, 7)
+
+        @classmethod
+        def now(cls, tz: Any = None) -> "FakeDatetime":
+            return cls.fromtimestamp(cls.current.timestamp())
+
+    monkeypatch.setattr(weather_retrieval_tool, "datetime", FakeDatetime)
+    tool = WeatherRetrievalTool("key", geolocator=FakeGeolocator())
+
+    schema = tool.serialize(require_reasoning=False)
+    datetimes = schema["function"]["parameters"]["properties"]["datetimes"]
+
+    assert datetimes["items"] == {"type": "string"}
+    assert '"2023-11-20 09:00:00"' in datetimes["description"]
+    # the schema only changes with the hour
+    FakeDatetime.current = datetime(2023, 11, 20, 9, 59, 59)
+    assert tool.serialize(require_reasoning=False) == schema
+    FakeDatetime.current = datetime(2023, 11, 20, 10, 0, 0)
+    assert tool.serialize(require_reasoning=False) != schema
@@ -0,0 +1,120 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+from pytest import fixture
+
+from neat_ai_assistant import WebpageRetrievalTool
+from neat_ai_assistant.utils.cache import SQLiteCache
+from neat_ai_assistant.utils.page_cache import PageCache
+
+PAGE = b"<html><body><h2>Title</h2><p>Some paragraph.</p></body></html>"
+ETAG = '"v1"'
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    request_counts: dict[str, int] = {}
+
+    def do_GET(self) -> None:
+        self.request_counts[self.path] = self.request_counts.get(self.path, 0) + 1
+        if self.path == "/missing":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        if self.path == "/huge":
+            for _ in range(1_000):
+                self.wfile.write(b"<p>" + b"x" * 1_000 + b"</p>")
+        elif self.path == "/slow":
+            time.sleep(1)
+            self.wfile.write(PAGE)
+        else:
+            self.wfile.write(PAGE)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+@fixture(scope="module")
+def base_url() -> Iterator[str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@fixture
+def tool() -> WebpageRetrievalTool:
+    return WebpageRetrievalTool(read_timeout=0.3, max_page_bytes=10_000)
+
+
+def test_webpage_retrieval_fetches_and_scrapes_page(
+    tool: WebpageRetrievalTool, base_url: str
+) -> None:
+    assert tool._retrieve_body_text(f"{base_url}/page") == "Title\nSome paragraph...."
+
+
+def test_webpage_retrieval_stops_reading_at_byte_budget(
+    tool: WebpageRetrievalTool, base_url: str
+) -> None:
+    page = tool._fetch_page(f"{base_url}/huge")
+
+    assert page is not None
+    assert len(page.content) == 10_000
+
+
+def test_webpage_retrieval_gives_up_on_failing_pages(
+    tool: WebpageRetrievalTool, base_url: str
+) -> None:
+    assert tool._fetch_page(f"{base_url}/slow") is None
+    assert tool._fetch_page(f"{base_url}/missing") is None
+
+
+def test_webpage_retrieval_serves_repeated_pages_from_cache(
+    tool: WebpageRetrievalTool, base_url: str
+) -> None:
+    url = f"{base_url}/cached"
+
+    first = tool._retrieve_body_text(url)
+    second = tool._retrieve_body_text(f"{base_url}/cached#section")
+
+    assert first == second == "Title\nSome paragraph...."
+    assert _PageHandler.request_counts[url.removeprefix(base_url)] == 1
+    assert tool.page_cache.stats.hits == 1
+    assert tool.page_cache.stats.misses == 1
+
+
+def test_webpage_retrieval_revalidates_stale_pages(base_url: str) -> None:
+    tool = WebpageRetrievalTool(page_cache=PageCache(ttl_seconds=0))
+
+    first = tool._retrieve_body_text(f"{base_url}/etag")
+    second = tool._retrieve_body_text(f"{base_url}/etag")
+
+    assert first == second == "Title\nSome paragraph...."
+    assert _PageHandler.request_counts["/etag"] == 2
+    assert tool.page_cache.stats.revalidations == 1
+
+
+def test_webpage_retrieval_reads_pages_from_disk_cache(
+    base_url: str, tmp_path: Path
+) -> None:
+    url = f"{base_url}/disk"
+    WebpageRetrievalTool(
+        page_cache=PageCache(disk_cache=SQLiteCache(tmp_path / "pages.db"))
+    )._retrieve_body_text(url)
+    tool = WebpageRetrievalTool(
+        page_cache=PageCache(disk_cache=SQLiteCache(tmp_path / "pages.db"))
+    )
+
+    assert tool._retrieve_body_text(url) == "Title\nSome paragraph...."
+    assert _PageHandler.request_counts["/disk"] == 1
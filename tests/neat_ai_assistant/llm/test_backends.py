@@ -0,0 +1,164 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Mapping
+
+from helpers import AgentFactory
+from openai.types.chat import ChatCompletionChunk
+from pytest import raises
+
+from neat_ai_assistant import Message, Model, OpenaiWrapper, Tool, ToolParam
+from neat_ai_assistant.agent.tool import ToolResult
+from neat_ai_assistant.llm.backends import ChatRequest, ScriptedBackend, ScriptedReply
+from neat_ai_assistant.llm.recording import (
+    MissingRecordingError,
+    RecordingBackend,
+    ReplayBackend,
+)
+from neat_ai_assistant.llm.streaming import ChatCompletionStreamAccumulator
+
+MESSAGES = [Message(role="user", content="What's the capital of France?")]
+REPLIES = [
+    ScriptedReply(tool_calls=[("city_index", {"city": "Paris"})]),
+    ScriptedReply(content="The capital of France is Paris."),
+]
+
+
+class CityIndexTool(Tool):
+    def __init__(self) -> None:
+        super().__init__(
+            name="City Index",
+            description="Find information about any city.",
+            params=[
+                ToolParam(
+                    name="city", type="string", description="The city.", required=True
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([f"{json_query['city']} is the capital of France."])
+
+
+async def collect_message(chunks: AsyncIterator[ChatCompletionChunk]) -> Any:
+    accumulator = ChatCompletionStreamAccumulator()
+    async for chunk in chunks:
+        accumulator.add(chunk)
+    return accumulator.to_completion()
+
+
+def test_scripted_backend_streams_what_it_completes() -> None:
+    backend = ScriptedBackend(REPLIES, chunk_size_chars=4)
+    request = ChatRequest(model=Model.GPT_4.value, messages=[])
+
+    async def complete_and_stream() -> tuple[Any, Any]:
+        completions = [await backend.acomplete(request) for _ in REPLIES]
+        streams = [
+            await collect_message(await backend.astream(request)) for _ in REPLIES
+        ]
+        return completions, streams
+
+    completions, streams = asyncio.run(complete_and_stream())
+
+    for completion, streamed_completion in zip(completions, streams):
+        assert streamed_completion.choices == completion.choices
+    assert len(backend.requests) == 4
+
+
+def test_scripted_backend_adds_latency() -> None:
+    openai_wrapper = OpenaiWrapper(
+        backend=ScriptedBackend(REPLIES, latency_seconds=0.1)
+    )
+
+    started_at = time.perf_counter()
+    completion = openai_wrapper.chat_complete(MESSAGES, Model.GPT_4)
+
+    assert time.perf_counter() - started_at >= 0.1
+    assert completion.choices[0].message.tool_calls is not None
+
+
+def test_replay_backend_replays_recorded_session(tmp_path: Path) -> None:
+    path = tmp_path / "session.jsonl"
+    recording_wrapper = OpenaiWrapper(
+        backend=RecordingBackend(
+            ScriptedBackend(REPLIES, chunk_delay_seconds=0.01), path
+        )
+    )
+
+    async def run_session(openai_wrapper: OpenaiWrapper) -> tuple[Any, Any]:
+        completion = await openai_wrapper.achat_complete(MESSAGES, Model.GPT_4)
+        chunks = await openai_wrapper.astream_chat_complete_with_tools(
+            MESSAGES, Model.GPT_4, []
+        )
+        return completion, await collect_message(chunks)
+
+    recorded = asyncio.run(run_session(recording_wrapper))
+    replaying_wrapper = OpenaiWrapper(backend=ReplayBackend(path, time_scale=0))
+    replayed = asyncio.run(run_session(replaying_wrapper))
+
+    assert replayed == recorded
+    assert recorded[1].choices[0].message.content == "The capital of France is Paris."
+    with raises(MissingRecordingError):
+        replaying_wrapper.chat_complete(MESSAGES, Model.GPT_3_5)
+
+
+def test_replay_falls_back_to_the_recorded_order_when_prompts_differ(
+    tmp_path: Path,
+) -> None:
+    path = tmp_path / "session.jsonl"
+    recording_wrapper = OpenaiWrapper(
+        backend=RecordingBackend(ScriptedBackend(REPLIES), path)
+    )
+    for content in ["Search result at 12:00.", "Page text at 12:00."]:
+        recording_wrapper.chat_complete(
+            [Message(role="user", content=content)], Model.GPT_4
+        )
+
+    # live tools put other results into the prompts of the replayed session
+    backend = ReplayBackend(path, time_scale=0, strict=False)
+    replaying_wrapper = OpenaiWrapper(backend=backend)
+    replayed = [
+        replaying_wrapper.chat_complete(
+            [Message(role="user", content=content)], Model.GPT_4
+        )
+        for content in ["Search result at 13:00.", "Page text at 13:00."]
+    ]
+
+    assert replayed[0].choices[0].message.tool_calls is not None
+    assert replayed[1].choices[0].message.content == "The capital of France is Paris."
+    assert backend.fallback_hits == 2
+    with raises(MissingRecordingError):
+        replaying_wrapper.chat_complete(MESSAGES, Model.GPT_4)
+
+    # exact matches take their exchange out of the fallback order
+    replaying_wrapper = OpenaiWrapper(
+        backend=ReplayBackend(path, time_scale=0, strict=False)
+    )
+    page = replaying_wrapper.chat_complete(
+        [Message(role="user", content="Page text at 12:00.")], Model.GPT_4
+    )
+    search = replaying_wrapper.chat_complete(
+        [Message(role="user", content="Search result at 13:00.")], Model.GPT_4
+    )
+    assert page.choices[0].message.content == "The capital of France is Paris."
+    assert search.choices[0].message.tool_calls is not None
+
+    strict_wrapper = OpenaiWrapper(backend=ReplayBackend(path, time_scale=0))
+    with raises(MissingRecordingError):
+        strict_wrapper.chat_complete(
+            [Message(role="user", content="Search result at 13:00.")], Model.GPT_4
+        )
+
+
+def test_agent_runs_offline_on_scripted_backend(build_agent: AgentFactory) -> None:
+    backend = ScriptedBackend(REPLIES)
+    agent = build_agent(backend, [CityIndexTool()], stream=True)
+
+    outputs = list(agent.reply_to("What's the capital of France?"))
+
+    assert [o.type for o in outputs][-1] == "answer"
+    assert "".join(o.text or "" for o in outputs if o.type == "answer") == (
+        "The capital of France is Paris."
+    )
+    assert len(backend.requests) == 2
+    assert "Paris is the capital" in str(backend.requests[1].messages[-1])
@@ -0,0 +1,202 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, cast
+
+import httpx
+import openai
+from helpers import WordCountingOpenaiWrapper
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from pytest import raises
+
+from neat_ai_assistant import (
+    ChatBackend,
+    Message,
+    Model,
+    RateLimiter,
+    RateLimits,
+    ScriptedBackend,
+    ScriptedReply,
+)
+from neat_ai_assistant.llm.backends import ChatRequest
+from neat_ai_assistant.llm.openai_wrapper import _get_retry_delay
+
+MODEL = Model.GPT_4
+MESSAGES = [Message(role="user", content="Hello there")]
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def build_error(
+    error_type: type[openai.APIStatusError], status_code: int, **headers: str
+) -> openai.APIStatusError:
+    response = httpx.Response(
+        status_code,
+        headers=headers,
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+    )
+    return error_type("Failed.", response=response, body=None)
+
+
+class FailingBackend(ChatBackend):
+    """Raises the given errors, one per call, before answering."""
+
+    def __init__(self, errors: list[Exception]) -> None:
+        self.errors = errors
+        self.calls = 0
+        self.backend = ScriptedBackend([ScriptedReply(content="Hi!")])
+
+    def complete(self, request: ChatRequest) -> ChatCompletion:
+        raise NotImplementedError
+
+    async def acomplete(self, request: ChatRequest) -> ChatCompletion:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return await self.backend.acomplete(request)
+
+    async def astream(self, request: ChatRequest) -> AsyncIterator[ChatCompletionChunk]:
+        raise NotImplementedError
+
+
+def test_rate_limiter_queues_requests_beyond_requests_and_tokens_per_minute() -> None:
+    clock = FakeClock()
+    limiter = RateLimiter(
+        {"m": RateLimits(requests_per_minute=2, tokens_per_minute=600)}, clock=clock
+    )
+
+    assert limiter.reserve("m", 300) == 0
+    assert limiter.reserve("m", 300) == 0
+    # the third request waits for the request bucket, its tokens would be back sooner
+    assert limiter.reserve("m", 60) == 30
+    # too large to ever fit, it only waits for a full token bucket
+    assert limiter.reserve("m", 10_000) == 66
+    assert limiter.reserve("unknown", 10_000) == 0
+
+    stats = limiter.stats
+    assert stats.requests == 5
+    assert stats.throttled_requests == 2
+    assert stats.throttled_seconds == 96
+
+
+def test_rate_limiter_settles_usage_and_pauses_after_rate_limit_errors() -> None:
+    clock = FakeClock()
+    limiter = RateLimiter(
+        {"m": RateLimits(requests_per_minute=100, tokens_per_minute=600)}, clock=clock
+    )
+
+    limiter.reserve("m", 600)
+    limiter.settle("m", estimated_tokens=600, used_tokens=300)
+    assert limiter.reserve("m", 300) == 0
+
+    limiter.pause("m", 5)
+    assert limiter.reserve("m", 0) == 5
+    assert limiter.stats.rate_limit_errors == 1
+
+
+def test_cancelled_waits_give_their_reservation_back() -> None:
+    clock = FakeClock()
+    limiter = RateLimiter(
+        {"m": RateLimits(requests_per_minute=1, tokens_per_minute=600)}, clock=clock
+    )
+
+    async def scenario() -> None:
+        assert await limiter.aacquire("m", 300) == 0
+        throttled = asyncio.ensure_future(limiter.aacquire("m", 300))
+        await asyncio.sleep(0)
+        throttled.cancel()
+        await asyncio.gather(throttled, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    # the next caller waits for the first request only, not for the abandoned one
+    assert limiter.reserve("m", 300) == 60
+
+
+def test_aborted_streams_give_their_estimate_back() -> None:
+    limiter = RateLimiter(
+        {MODEL.value: RateLimits(requests_per_minute=100, tokens_per_minute=1_000)},
+        clock=FakeClock(),
+    )
+    backend = ScriptedBackend(
+        [ScriptedReply(content="A long answer, streamed in many small chunks.")],
+        chunk_size_chars=4,
+    )
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend, rate_limiter=limiter)
+
+    async def scenario() -> None:
+        chunks = await openai_wrapper.astream_chat_complete_with_tools(
+            MESSAGES, MODEL, [], estimated_tokens=900
+        )
+        async for _ in chunks:
+            break
+        await cast(AsyncGenerator[ChatCompletionChunk, None], chunks).aclose()
+
+    asyncio.run(scenario())
+
+    assert limiter.reserve(MODEL.value, 900) == 0
+
+
+def test_retry_delays_honor_retry_after_headers() -> None:
+    error = build_error(openai.RateLimitError, 429, **{"retry-after-ms": "1500"})
+
+    assert _get_retry_delay(error, 0.1) == 1.5
+    assert _get_retry_delay(error, 2.0) == 2.0
+    assert _get_retry_delay(TimeoutError(), 0.1) == 0.1
+
+
+def test_wrapper_retries_rate_limit_and_connection_errors() -> None:
+    limiter = RateLimiter()
+    backend = FailingBackend(
+        [
+            build_error(openai.RateLimitError, 429, **{"retry-after-ms": "10"}),
+            openai.APIConnectionError(request=httpx.Request("POST", "https://x")),
+        ]
+    )
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend, rate_limiter=limiter)
+
+    completion = asyncio.run(openai_wrapper.achat_complete(MESSAGES, MODEL))
+
+    assert completion.choices[0].message.content == "Hi!"
+    assert backend.calls == 3
+    assert limiter.stats.requests == 3
+    assert limiter.stats.rate_limit_errors == 1
+
+
+def test_failed_attempts_give_their_reservation_back() -> None:
+    limiter = RateLimiter(
+        {MODEL.value: RateLimits(requests_per_minute=100, tokens_per_minute=1_000)},
+        clock=FakeClock(),
+    )
+    backend = FailingBackend(
+        [
+            openai.APIConnectionError(request=httpx.Request("POST", "https://x")),
+            openai.APIConnectionError(request=httpx.Request("POST", "https://x")),
+        ]
+    )
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend, rate_limiter=limiter)
+
+    # without the release, the second attempt would queue for the first one's tokens
+    completion = asyncio.run(
+        asyncio.wait_for(
+            openai_wrapper.achat_complete(MESSAGES, MODEL, estimated_tokens=900), 5
+        )
+    )
+
+    assert completion.choices[0].message.content == "Hi!"
+    assert backend.calls == 3
+    assert limiter.stats.throttled_requests == 0
+
+
+def test_wrapper_does_not_retry_bad_requests() -> None:
+    backend = FailingBackend([build_error(openai.BadRequestError, 400)])
+    openai_wrapper = WordCountingOpenaiWrapper(backend=backend)
+
+    with raises(openai.BadRequestError):
+        asyncio.run(openai_wrapper.achat_complete(MESSAGES, MODEL))
+    assert backend.calls == 1
+    assert openai_wrapper.rate_limiter is None
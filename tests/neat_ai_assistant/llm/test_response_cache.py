@@ -0,0 +1,133 @@
+import asyncio
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from openai.types.chat import ChatCompletionChunk
+
+from neat_ai_assistant import (
+    ChatCompletionCache,
+    Message,
+    Model,
+    OpenaiWrapper,
+    SQLiteCache,
+)
+from neat_ai_assistant.llm.backends import ScriptedBackend, ScriptedReply
+from neat_ai_assistant.llm.response_cache import fingerprint_request
+from neat_ai_assistant.llm.streaming import ChatCompletionStreamAccumulator
+
+MESSAGES = [
+    Message(role="system", content="You answer user questions concisely."),
+    Message(role="user", content="What's the weather in Berlin?"),
+]
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "weather",
+            "description": "Get the weather.",
+            "parameters": {
+                "type": "object",
+                "properties": {"location": {"type": "string"}},
+            },
+        },
+    }
+]
+REPLY = ScriptedReply(tool_calls=[("weather", {"location": "Berlin"})])
+
+
+def build_wrapper(
+    response_cache: ChatCompletionCache,
+) -> tuple[OpenaiWrapper, ScriptedBackend]:
+    backend = ScriptedBackend([REPLY])
+    return OpenaiWrapper(response_cache=response_cache, backend=backend), backend
+
+
+async def collect_message(chunks: AsyncIterator[ChatCompletionChunk]) -> Any:
+    accumulator = ChatCompletionStreamAccumulator()
+    async for chunk in chunks:
+        accumulator.add(chunk)
+    return accumulator.to_message()
+
+
+def test_fingerprint_ignores_key_order_but_not_content() -> None:
+    messages = [m.model_dump() for m in MESSAGES]
+    reordered_tools = [{"function": TOOLS[0]["function"], "type": "function"}]
+
+    fingerprint = fingerprint_request(Model.GPT_4.value, messages, TOOLS, 0.0)
+
+    assert fingerprint == fingerprint_request(
+        Model.GPT_4.value, messages, reordered_tools, 0.0
+    )
+    assert fingerprint != fingerprint_request(Model.GPT_4.value, messages, TOOLS, 0.5)
+    assert fingerprint != fingerprint_request(Model.GPT_3_5.value, messages, TOOLS, 0.0)
+    assert fingerprint != fingerprint_request(Model.GPT_4.value, messages, None, 0.0)
+
+
+def test_response_cache_replays_identical_completion() -> None:
+    openai_wrapper, backend = build_wrapper(ChatCompletionCache())
+
+    first = asyncio.run(
+        openai_wrapper.achat_complete_with_tools(MESSAGES, Model.GPT_4, TOOLS)
+    )
+    second = asyncio.run(
+        openai_wrapper.achat_complete_with_tools(list(MESSAGES), Model.GPT_4, TOOLS)
+    )
+
+    assert len(backend.requests) == 1
+    assert second == first
+    assert second.choices[0].message.tool_calls is not None
+    assert openai_wrapper.response_cache is not None
+    stats = openai_wrapper.response_cache.stats
+    assert (stats.hits, stats.misses, stats.hit_rate) == (1, 1, 0.5)
+
+
+def test_response_cache_survives_restart_on_disk(tmp_path: Path) -> None:
+    openai_wrapper, _ = build_wrapper(
+        ChatCompletionCache(disk_cache=SQLiteCache(tmp_path / "responses.db"))
+    )
+    completion = asyncio.run(
+        openai_wrapper.achat_complete_with_tools(MESSAGES, Model.GPT_4, TOOLS)
+    )
+
+    restarted_wrapper, restarted_backend = build_wrapper(
+        ChatCompletionCache(disk_cache=SQLiteCache(tmp_path / "responses.db"))
+    )
+    replayed_completion = asyncio.run(
+        restarted_wrapper.achat_complete_with_tools(MESSAGES, Model.GPT_4, TOOLS)
+    )
+
+    assert len(restarted_backend.requests) == 0
+    assert replayed_completion == completion
+
+
+def test_response_cache_records_and_replays_streams() -> None:
+    openai_wrapper, backend = build_wrapper(ChatCompletionCache())
+
+    async def stream_twice() -> tuple[Any, Any]:
+        first = await openai_wrapper.astream_chat_complete_with_tools(
+            MESSAGES, Model.GPT_4, TOOLS
+        )
+        first_message = await collect_message(first)
+        second = await openai_wrapper.astream_chat_complete_with_tools(
+            MESSAGES, Model.GPT_4, TOOLS
+        )
+        return first_message, await collect_message(second)
+
+    first_message, second_message = asyncio.run(stream_twice())
+
+    assert len(backend.requests) == 1
+    assert first_message == second_message
+    assert first_message.tool_calls[0].function.arguments == '{"location": "Berlin"}'
+
+
+def test_response_cache_skips_sampled_requests() -> None:
+    openai_wrapper, backend = build_wrapper(ChatCompletionCache())
+
+    for _ in range(2):
+        asyncio.run(
+            openai_wrapper.achat_complete_with_tools(
+                MESSAGES, Model.GPT_4, TOOLS, temperature=0.7
+            )
+        )
+
+    assert len(backend.requests) == 2
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+from neat_ai_assistant.utils.cache import LRUCache, SQLiteCache
+from neat_ai_assistant.utils.page_cache import CachedPage, normalize_url
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used_entries_by_size() -> None:
+    cache: LRUCache[str, str] = LRUCache(max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.get("a")
+    cache.set("c", "xxxx")
+
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.stats.size_bytes == 8
+    assert cache.stats.evictions == 1
+
+
+def test_lru_cache_expires_entries_but_keeps_them_for_revalidation() -> None:
+    clock = FakeClock()
+    cache: LRUCache[str, int] = LRUCache(ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.now = 10
+    entry = cache.get_entry("a")
+
+    assert cache.get("a") is None
+    assert entry is not None and entry.value == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+
+def test_sqlite_cache_evicts_least_recently_used_entries_by_size(
+    tmp_path: Path,
+) -> None:
+    cache = SQLiteCache(tmp_path / "cache.db", max_bytes=10)
+    cache.set("a", b"xxxx")
+    cache.set("b", b"xxxx")
+    cache.get("a")
+    cache.set("c", b"xxxx")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == cache.get("c") == b"xxxx"
+    assert cache.stats.size_bytes == 8
+
+
+def test_sqlite_cache_expires_entries(tmp_path: Path) -> None:
+    cache = SQLiteCache(tmp_path / "cache.db")
+    cache.set("a", b"x", ttl_seconds=-1)
+
+    assert cache.get("a") is None
+
+
+def test_cached_page_round_trips_through_bytes() -> None:
+    page = CachedPage(
+        url="https://example.com",
+        content=b"\xff<html>\n</html>",
+        body_text="Title\nText",
+        etag='"abc"',
+        fetched_at=1.5,
+    )
+
+    assert CachedPage.from_bytes(page.to_bytes()) == page
+
+
+def test_normalize_url() -> None:
+    assert (
+        normalize_url("HTTPS://Example.com:443/docs?b=2&utm_source=x&a=1#intro")
+        == "https://example.com/docs?a=1&b=2"
+    )
+    assert normalize_url("http://example.com:8080") == "http://example.com:8080/"
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Any, Mapping
+
+from helpers import AgentFactory
+from pytest import raises
+
+from neat_ai_assistant import (
+    CancellationToken,
+    RunCancelledError,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+)
+from neat_ai_assistant.agent.tool import ToolResult
+from neat_ai_assistant.utils.cancellation import activate_cancellation
+
+REPLIES = [
+    ScriptedReply(tool_calls=[("disconnect", {"text": "bye"})]),
+    ScriptedReply(content="Never read."),
+]
+
+
+class DisconnectTool(Tool):
+    """Cancels the reply while it runs, like a client closing the tab."""
+
+    def __init__(self, cancellation: CancellationToken) -> None:
+        super().__init__(
+            name="Disconnect",
+            description="Disconnects.",
+            params=[
+                ToolParam(
+                    name="text", type="string", description="Text.", required=True
+                )
+            ],
+        )
+        self.cancellation = cancellation
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        self.cancellation.cancel("client disconnected")
+        return self.to_result([json_query["text"]])
+
+
+def test_race_cancels_the_awaited_work() -> None:
+    async def scenario() -> None:
+        cancellation = CancellationToken()
+        work = asyncio.ensure_future(asyncio.sleep(10))
+        asyncio.get_running_loop().call_later(0.01, cancellation.cancel)
+
+        with raises(RunCancelledError, match="cancelled"):
+            await cancellation.race(work)
+        assert work.cancelled()
+
+        assert await CancellationToken().race(asyncio.sleep(0, "done")) == "done"
+
+    asyncio.run(scenario())
+
+
+def test_tool_runs_are_refused_once_cancelled() -> None:
+    cancellation = CancellationToken()
+    tool = DisconnectTool(cancellation)
+    cancellation.cancel()
+
+    activate_cancellation(cancellation)
+    try:
+        with raises(RunCancelledError):
+            tool.run({"text": "bye"})
+    finally:
+        activate_cancellation(None)
+
+
+def test_cancelled_reply_stops_and_leaves_no_turn_in_the_history(
+    build_agent: AgentFactory,
+) -> None:
+    backend = ScriptedBackend(REPLIES)
+    cancellation = CancellationToken()
+    agent = build_agent(backend, [DisconnectTool(cancellation)])
+
+    with raises(RunCancelledError, match="client disconnected"):
+        list(agent.reply_to("Say bye.", cancellation))
+
+    assert len(backend.requests) == 1
+    assert agent.history.get_as_string_list(n=10) == []
+
+
+def test_deadline_abandons_a_pending_llm_call(build_agent: AgentFactory) -> None:
+    backend = ScriptedBackend(REPLIES, latency_seconds=5)
+    cancellation = CancellationToken(timeout_seconds=0.05)
+    agent = build_agent(backend, [DisconnectTool(cancellation)])
+
+    started_at = time.monotonic()
+    with raises(RunCancelledError, match="deadline exceeded"):
+        list(agent.reply_to("Say bye.", cancellation))
+
+    assert time.monotonic() - started_at < 1
@@ -0,0 +1,49 @@
+from helpers import legacy_scrape_body_text
+from pytest import mark, raises
+
+from neat_ai_assistant.utils.html_sections import (
+    _BudgetFilled,
+    _SectionParser,
+    extract_section_text,
+)
+
+PAGES = [
+    "<html><body><h2>Title</h2><p>Some paragraph.</p></body></html>",
+    "<p>No headers at all.</p>",
+    "<h2>Header without paragraphs</h2><div>text</div>",
+    "<h2>A</h2><p>one</p><div><p>two</p></div><h3>B</h3><p>three</p>",
+    "<h2>A</h2><p>outer<p>nested</p>tail</p><hr><p>after rule</p>",
+    "<h2>A<p>inside header</p>rest</h2><p>x</p><h1>stop</h1><p>dropped</p>",
+    "<h2>A<p>x</p><hr>still header</h2><p>y</p>",
+    "<h2>A</h2><p>text<br>more</br> end<br/>done</p><header><p>z</p></header>",
+    "<h2>A</h2><p>a<script>var p = '<p>';</script><style>p {}</style>b</p>",
+    "<h2>A</h2><p>a<ruby>b<rt>c</rt></ruby><template>hidden</template></p>",
+    "<h2>A</h2><p>  \n  </p><p> </p><pre>  kept  </pre><p><pre> \n </pre></p>",
+    "<h2>A&amp;B</h2><p>&nbsp;&lt;tag&gt; &bogus; &amp &#147;&#x41;&#9999999;</p>",
+    "<!DOCTYPE html><h2>A</h2><p>a<!-- comment -->b<![CDATA[ c ]]><?pi?>d</p>",
+    "<H2>Upper</H2><P>case</P><h4/><p>after empty header</p>",
+    "<h2>A</h2><p>unclosed <b>bold",
+    "<h2>A</h2><p>a & b</p><p>&amp",
+]
+
+
+@mark.parametrize("page", PAGES)
+@mark.parametrize("maximum_length_char", [0, 3, 12, 1000])
+def test_extract_section_text_matches_bs4(page: str, maximum_length_char: int) -> None:
+    for content in (page, page.encode("utf-8"), page.encode("cp1252", "ignore")):
+        assert extract_section_text(
+            content, maximum_length_char
+        ) == legacy_scrape_body_text(content, maximum_length_char)
+
+
+def test_extract_section_text_stops_once_budget_is_filled() -> None:
+    page = "\n".join(f"<h2>Section {i}</h2><p>Paragraph {i}.</p>" for i in range(1_000))
+    parser = _SectionParser(maximum_length_char=100, original_encoding=None)
+
+    with raises(_BudgetFilled):
+        parser.feed(page)
+
+    line, _ = parser.getpos()
+    assert line < 10
+    assert parser.cleaned_prefix.startswith("Section 0\nParagraph 0.")
+    assert extract_section_text(page, 100) == legacy_scrape_body_text(page, 100)
@@ -0,0 +1,23 @@
+from neat_ai_assistant.utils.rate_limit import TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_queues_callers_beyond_capacity() -> None:
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1, capacity=2, clock=clock)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 1
+    assert bucket.reserve() == 2
+    assert not bucket.try_acquire()
+
+    clock.now = 10
+    assert bucket.available_tokens == 2
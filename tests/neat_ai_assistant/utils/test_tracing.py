@@ -0,0 +1,171 @@
+import json
+from pathlib import Path
+from typing import Any, Mapping
+
+from helpers import AgentFactory
+from pytest import MonkeyPatch, mark
+
+from neat_ai_assistant import (
+    ChatCompletionCache,
+    JsonLinesTraceSink,
+    MetricsRegistry,
+    PrometheusTraceSink,
+    ScriptedBackend,
+    ScriptedReply,
+    Tool,
+    ToolParam,
+    Tracer,
+    TraceSink,
+)
+from neat_ai_assistant.agent.tool import ToolResult
+from neat_ai_assistant.utils.tracing import NULL_SPAN, Span, Trace, start_span
+
+REPLIES = [
+    ScriptedReply(tool_calls=[("echo", {"text": "hello"})]),
+    ScriptedReply(content="The echo said hello."),
+]
+
+
+class EchoTool(Tool):
+    def __init__(self) -> None:
+        super().__init__(
+            name="Echo",
+            description="Echoes the text.",
+            params=[
+                ToolParam(
+                    name="text", type="string", description="Text.", required=True
+                )
+            ],
+        )
+
+    def _run(self, json_query: Mapping[str, Any]) -> ToolResult:
+        return self.to_result([json_query["text"]])
+
+
+class CollectingSink(TraceSink):
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self.traces: list[Trace] = []
+
+    def on_span(self, trace: Trace, span: Span) -> None:
+        self.spans.append(span)
+
+    def on_trace(self, trace: Trace) -> None:
+        self.traces.append(trace)
+
+
+@mark.parametrize("stream", [False, True])
+def test_tracer_records_llm_calls_and_tool_runs_per_reply(
+    build_agent: AgentFactory, stream: bool
+) -> None:
+    sink = CollectingSink()
+    agent = build_agent(
+        ScriptedBackend(REPLIES), [EchoTool()], stream=stream, tracer=Tracer([sink])
+    )
+
+    list(agent.reply_to("Echo hello."))
+
+    assert len(sink.traces) == 1
+    spans = sink.traces[0].spans
+    assert [s.name for s in spans] == [
+        "llm.chat_completion",
+        "tool.run",
+        "llm.chat_completion",
+        "agent.reply",
+    ]
+    assert spans[1].attributes["tool"] == "Echo"
+    assert spans[-1].attributes["iterations"] == 2
+    assert all(s.duration_seconds is not None and s.error is None for s in spans)
+    if stream:
+        assert spans[2].attributes["completion_tokens"] == 4
+
+
+def test_streamed_spans_take_prompt_tokens_from_the_agent_estimate(
+    build_agent: AgentFactory, monkeypatch: MonkeyPatch
+) -> None:
+    sink = CollectingSink()
+    agent = build_agent(
+        ScriptedBackend(REPLIES), [EchoTool()], stream=True, tracer=Tracer([sink])
+    )
+
+    def fail(*args: Any) -> int:
+        raise AssertionError("the transcript was tokenized again")
+
+    monkeypatch.setattr(agent.openai_wrapper, "open_ai_count_tokens", fail)
+    list(agent.reply_to("Echo hello."))
+
+    llm_spans = [s for s in sink.spans if s.name == "llm.chat_completion"]
+    assert len(llm_spans) == 2
+    assert all(s.attributes["prompt_tokens"] > 0 for s in llm_spans)
+
+
+def test_prometheus_sink_aggregates_spans_and_cache_hits(
+    build_agent: AgentFactory,
+) -> None:
+    registry = MetricsRegistry()
+    agent = build_agent(
+        ScriptedBackend(REPLIES),
+        [EchoTool()],
+        wrapper_kwargs={"response_cache": ChatCompletionCache()},
+        stream=True,
+        tracer=Tracer([PrometheusTraceSink(registry)]),
+    )
+
+    for _ in range(2):
+        list(agent.reply_to("Echo hello."))
+
+    metrics = registry.render()
+    assert (
+        'neat_llm_request_duration_seconds_count{model="gpt-4-1106-preview",cache_hit="true"} 2'
+        in metrics
+    )
+    assert 'neat_tool_duration_seconds_count{tool="Echo"} 2' in metrics
+    assert 'neat_agent_reply_iterations_bucket{le="2.0"} 2' in metrics
+    assert (
+        'neat_llm_tokens_total{model="gpt-4-1106-preview",kind="completion",cache_hit="false"} 6.0'
+        in metrics
+    )
+
+
+def test_histogram_buckets_are_cumulative_and_labels_escaped() -> None:
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency", "Latency.", ["step"], buckets=[1, 2])
+
+    for value in [0.5, 1, 1.5, 3]:
+        histogram.observe(value, ('say "hi"\n',))
+
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_bucket{step="say \\"hi\\"\\n",le="1.0"} 2',
+        'latency_bucket{step="say \\"hi\\"\\n",le="2.0"} 3',
+        'latency_bucket{step="say \\"hi\\"\\n",le="+Inf"} 4',
+        'latency_sum{step="say \\"hi\\"\\n"} 6.0',
+        'latency_count{step="say \\"hi\\"\\n"} 4',
+    ]
+
+
+def test_json_lines_sink_writes_one_trace_per_reply(
+    build_agent: AgentFactory, tmp_path: Path
+) -> None:
+    path = tmp_path / "traces.jsonl"
+    agent = build_agent(
+        ScriptedBackend(REPLIES),
+        [EchoTool()],
+        tracer=Tracer([JsonLinesTraceSink(path)]),
+    )
+
+    list(agent.reply_to("Echo hello."))
+    list(agent.reply_to("Echo hello."))
+
+    traces = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(traces) == 2
+    assert traces[0]["trace_id"] != traces[1]["trace_id"]
+    assert [s["name"] for s in traces[0]["spans"]][0] == "agent.reply"
+
+
+def test_hooks_are_no_ops_without_an_active_trace() -> None:
+    with start_span("tool.run", tool="Echo") as span:
+        span.set(cache_hit=True)
+
+    assert span is NULL_SPAN
+    assert not span.enabled
@@ -0,0 +1,60 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from neat_ai_assistant.utils.web_search import SearchHit, WebSearchClient
+
+
+class FakeDDGS:
+    def __init__(self, n_available: int = 10, delay: float = 0.0) -> None:
+        self.n_available = n_available
+        self.delay = delay
+        self.queries: list[str] = []
+        self._lock = threading.Lock()
+
+    def text(self, keywords: str) -> Iterator[SearchHit]:
+        with self._lock:
+            self.queries.append(keywords)
+        time.sleep(self.delay)
+        for i in range(self.n_available):
+            yield {"title": f"{keywords} {i}", "href": f"https://{i}.com", "body": ""}
+
+
+def test_web_search_client_caches_by_normalized_query() -> None:
+    ddgs = FakeDDGS()
+    client = WebSearchClient(ddgs=ddgs)
+
+    first = client.text("Python  Asyncio", 3)
+    second = client.text(" python asyncio ", 3)
+
+    assert first == second
+    assert len(ddgs.queries) == 1
+    assert (client.stats.hits, client.stats.misses) == (1, 1)
+
+
+def test_web_search_client_serves_smaller_requests_from_larger_results() -> None:
+    ddgs = FakeDDGS(n_available=4)
+    client = WebSearchClient(ddgs=ddgs)
+
+    assert len(client.text("query", 5)) == 4
+    assert len(client.text("query", 2)) == 2
+    # the search had only 4 hits, so asking for more cannot find new ones
+    assert len(client.text("query", 8)) == 4
+    assert len(ddgs.queries) == 1
+
+    client.text("other", 2)
+    client.text("other", 3)
+    assert len(ddgs.queries) == 3
+
+
+def test_web_search_client_coalesces_concurrent_searches() -> None:
+    ddgs = FakeDDGS(delay=0.2)
+    client = WebSearchClient(ddgs=ddgs)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: client.text("query", 3), range(4)))
+
+    assert all(r == results[0] for r in results)
+    assert len(ddgs.queries) == 1
+    assert client.stats.coalesced == 3